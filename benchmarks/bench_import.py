@@ -0,0 +1,80 @@
+"""匯入時間基準測試
+
+在全新的直譯器中重複匯入分析核心，檢查匯入時間中位數是否在預算內，
+並確認 Streamlit、pandas、plotly、requests 等重量級套件沒有在匯入時被載入。
+超出預算或載入了重量級套件時以非零狀態碼結束，可放入 CI 防止回歸。
+
+    python benchmarks/bench_import.py --budget-ms 60 --output bench_import.json
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CORE_MODULES = [
+    "macrocore",
+    "macrocore.analysis",
+    "macrocore.cache",
+    "macrocore.charts",
+    "macrocore.report",
+    "macrocore.scoring",
+]
+HEAVY_MODULES = ["streamlit", "pandas", "plotly", "numpy", "requests"]
+
+PROBE = """
+import json, sys, time
+started = time.perf_counter()
+{imports}
+elapsed = time.perf_counter() - started
+heavy = sorted(name for name in {heavy!r} if name in sys.modules)
+print(json.dumps({{"elapsed_ms": elapsed * 1000, "heavy": heavy}}))
+"""
+
+
+def measure_once(modules):
+    code = PROBE.format(imports="\n".join(f"import {m}" for m in modules), heavy=HEAVY_MODULES)
+    output = subprocess.run(
+        [sys.executable, "-c", code], cwd=ROOT, check=True, capture_output=True, text=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="分析核心匯入時間基準測試")
+    parser.add_argument("--runs", type=int, default=15, help="重複次數（預設 15）")
+    parser.add_argument("--budget-ms", type=float, default=60.0, help="匯入時間中位數上限，毫秒（預設 60）")
+    parser.add_argument("--output", help="將結果寫入 JSON 檔")
+    args = parser.parse_args(argv)
+
+    samples = [measure_once(CORE_MODULES) for _ in range(args.runs)]
+    timings = sorted(sample["elapsed_ms"] for sample in samples)
+    heavy = sorted({name for sample in samples for name in sample["heavy"]})
+    result = {
+        "modules": CORE_MODULES,
+        "runs": args.runs,
+        "median_ms": round(statistics.median(timings), 2),
+        "min_ms": round(timings[0], 2),
+        "max_ms": round(timings[-1], 2),
+        "budget_ms": args.budget_ms,
+        "heavy_modules_loaded": heavy,
+    }
+    print(json.dumps(result, ensure_ascii=False, indent=2))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+
+    if heavy:
+        print(f"失敗：匯入分析核心時載入了重量級套件 {', '.join(heavy)}", file=sys.stderr)
+        return 1
+    if result["median_ms"] > args.budget_ms:
+        print(f"失敗：匯入時間中位數 {result['median_ms']} ms 超過預算 {args.budget_ms} ms", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,230 @@
+"""分析流程端到端基準測試
+
+在子程序啟動 mock_upstream.py 模擬 GNews 與 DeepSeek，將 DEEPSEEK_API_URL 與 GNEWS_SEARCH_URL 指向它，
+再以多個工作執行緒重複執行「GNews 擷取 → 組合新聞 → DeepSeek 分析（含解析與補請求）→ 圖表規格」。
+每次都是新的新聞且不使用分析快取，量到的是實際呼叫上游的流程。
+輸出吞吐量、延遲百分位數、解析成功率（第一次回應就取得完整結果的比例）、各階段平均耗時與記憶體峰值；
+--output 寫入 JSON 檔，--baseline 與先前的結果比較，吞吐量下降或 p95 延遲上升超過 --tolerance 時以非零狀態碼結束。
+
+    python benchmarks/bench_pipeline.py --requests 200 --concurrency 8 --latency 0.5 --truncated-rate 0.1 \\
+        --output bench_pipeline.json
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MOCK_UPSTREAM = os.path.join(ROOT, "benchmarks", "mock_upstream.py")
+MOCK_API_KEY = "mock-key"
+# 轉交給 mock_upstream.py 的命令列參數
+MOCK_OPTIONS = (
+    "latency", "jitter", "chunk_delay", "error_rate", "invalid_rate", "truncated_rate", "malformed_rate", "seed",
+    "canned",
+)
+
+
+def percentile(sorted_values, q):
+    """最近排名法的百分位數；沒有樣本時返回 None"""
+    if not sorted_values:
+        return None
+    rank = max(1, -(-len(sorted_values) * q // 100))
+    return sorted_values[int(rank) - 1]
+
+
+def rounded(value, digits=2):
+    return None if value is None else round(value, digits)
+
+
+def start_mock_upstream(mock_args):
+    """以子程序啟動模擬服務（不與受測流程爭用 GIL 與記憶體），返回 (程序, 服務網址)"""
+    process = subprocess.Popen(
+        [sys.executable, MOCK_UPSTREAM, *mock_args], cwd=ROOT, stdout=subprocess.PIPE, text=True
+    )
+    line = process.stdout.readline()
+    if not line:
+        process.wait()
+        raise RuntimeError(f"模擬服務啟動失敗（結束碼 {process.returncode}）")
+    return process, json.loads(line)
+
+
+def mock_argv(options):
+    """將模擬服務的設定轉為 mock_upstream.py 的命令列參數"""
+    argv = []
+    for name, value in options.items():
+        if value is not None:
+            argv += ["--" + name.replace("_", "-"), str(value)]
+    return argv
+
+
+def add_mock_arguments(parser, latency=0.5):
+    """加入模擬服務的設定參數（對應 MOCK_OPTIONS）"""
+    parser.add_argument("--latency", type=float, default=latency, help=f"模擬 DeepSeek 回應延遲秒數（預設 {latency}）")
+    parser.add_argument("--jitter", type=float, default=0.1, help="延遲的隨機浮動範圍 ± 秒（預設 0.1）")
+    parser.add_argument("--chunk-delay", type=float, default=0.0, help="串流每段之間的間隔秒數（預設 0）")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="DeepSeek 回應 503 的比例")
+    parser.add_argument("--invalid-rate", type=float, default=0.0, help="分析回應完全不含 JSON 的比例")
+    parser.add_argument("--truncated-rate", type=float, default=0.0, help="分析回應在中途截斷的比例")
+    parser.add_argument("--malformed-rate", type=float, default=0.0, help="分析回應 JSON 多一個尾逗號的比例")
+    parser.add_argument("--canned", help="模擬分析回應使用的 JSON 檔")
+    parser.add_argument("--seed", type=int, default=0, help="異常注入的亂數種子（預設 0）")
+
+
+def max_rss_mb():
+    """程序的最大常駐記憶體（MB）；沒有 resource 模組的平台（Windows）返回 None"""
+    try:
+        import resource
+    except ImportError:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux 以 KB 為單位，macOS 以位元組為單位
+    return round(rss / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, check=True, capture_output=True, text=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_pipeline(args):
+    """執行基準測試並返回統計結果；必須在設定好上游網址的環境變數之後才匯入分析核心"""
+    from macrocore.analysis import format_news_text, request_analysis
+    from macrocore.charts import build_chart_specs
+    from macrocore.metrics import metrics
+    from macrocore.news import DEFAULT_NEWS_QUERY, fetch_gnews
+    from macrocore.tolerant_json import parse_stats
+
+    def run_once(_):
+        started = time.perf_counter()
+        try:
+            news = fetch_gnews(DEFAULT_NEWS_QUERY, MOCK_API_KEY, max_results=1)[0]
+            analysis, _ = request_analysis(format_news_text(news), MOCK_API_KEY, stream=args.stream)
+            build_chart_specs(analysis)
+        except Exception as e:
+            return None, type(e).__name__
+        return time.perf_counter() - started, None
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        outcomes = list(executor.map(run_once, range(args.requests)))
+    duration = time.perf_counter() - started
+
+    latencies = sorted(elapsed * 1000 for elapsed, _ in outcomes if elapsed is not None)
+    errors = {}
+    for _, error in outcomes:
+        if error is not None:
+            errors[error] = errors.get(error, 0) + 1
+    parse = {outcome: parse_stats.snapshot()[outcome] for outcome in parse_stats.OUTCOMES}
+    parsed = sum(parse.values())
+    histograms, _ = metrics.snapshot()
+    stages = {
+        dict(key)["stage"]: {"count": series["count"], "mean_ms": round(series["sum"] / series["count"] * 1000, 2)}
+        for key, series in sorted(histograms.get("stage_duration_seconds", {}).items())
+    }
+    return {
+        "requests": args.requests,
+        "succeeded": len(latencies),
+        "failed": args.requests - len(latencies),
+        "errors": errors,
+        "duration_s": round(duration, 3),
+        "throughput_rps": round(len(latencies) / duration, 3),
+        "latency_ms": {
+            "mean": rounded(sum(latencies) / len(latencies) if latencies else None),
+            **{f"p{q}": rounded(percentile(latencies, q)) for q in (50, 95, 99)},
+            "max": rounded(latencies[-1] if latencies else None),
+        },
+        "parse": dict(parse, success_rate=round((parse["clean"] + parse["repaired"]) / parsed, 4) if parsed else None),
+        "stages": stages,
+    }
+
+
+def compare(result, baseline, tolerance):
+    """返回相對於基準結果的退步項目說明"""
+    regressions = []
+    old, new = baseline.get("throughput_rps"), result["throughput_rps"]
+    if old and new < old * (1 - tolerance):
+        regressions.append(f"吞吐量 {new} req/s 低於基準 {old} req/s")
+    old, new = (baseline.get("latency_ms") or {}).get("p95"), result["latency_ms"]["p95"]
+    if old and new is not None and new > old * (1 + tolerance):
+        regressions.append(f"p95 延遲 {new} ms 高於基準 {old} ms")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="分析流程端到端基準測試（本地模擬 GNews 與 DeepSeek）")
+    parser.add_argument("--requests", type=int, default=100, help="分析次數（預設 100）")
+    parser.add_argument("--concurrency", type=int, default=4, help="同時執行的工作執行緒數（預設 4）")
+    parser.add_argument("--stream", action="store_true", help="以 SSE 串流接收分析結果")
+    add_mock_arguments(parser)
+    parser.add_argument("--trace-memory", action="store_true",
+                        help="以 tracemalloc 追蹤 Python 配置的記憶體峰值（會拖慢執行）")
+    parser.add_argument("--output", help="將結果寫入 JSON 檔")
+    parser.add_argument("--baseline", help="與先前寫出的結果 JSON 比較")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="容許的退步比例（預設 0.2）")
+    args = parser.parse_args(argv)
+
+    mock = {name: getattr(args, name) for name in MOCK_OPTIONS}
+    process, urls = start_mock_upstream(mock_argv(mock))
+    try:
+        os.environ["DEEPSEEK_API_URL"] = urls["deepseek_url"]
+        os.environ["GNEWS_SEARCH_URL"] = urls["gnews_url"]
+        # 基準測試不受共用額度限制，也不寫入使用者的額度狀態
+        os.environ["RATE_LIMIT_DISABLED"] = "1"
+        sys.path.insert(0, ROOT)
+        if args.trace_memory:
+            import tracemalloc
+            tracemalloc.start()
+        stats = run_pipeline(args)
+        python_peak = None
+        if args.trace_memory:
+            python_peak = round(tracemalloc.get_traced_memory()[1] / (1024 * 1024), 1)
+            tracemalloc.stop()
+        with urllib.request.urlopen(urls["stats_url"]) as response:
+            upstream = json.load(response)
+    finally:
+        process.terminate()
+        process.wait()
+
+    result = {
+        "benchmark": "pipeline",
+        "started_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "revision": git_revision(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "config": {
+            "requests": args.requests,
+            "concurrency": args.concurrency,
+            "stream": args.stream,
+            "mock": mock,
+        },
+        **stats,
+        "upstream": upstream,
+        "memory": {"python_peak_mb": python_peak, "max_rss_mb": max_rss_mb()},
+    }
+    print(json.dumps(result, ensure_ascii=False, indent=2))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            regressions = compare(result, json.load(f), args.tolerance)
+        for message in regressions:
+            print(f"失敗：{message}", file=sys.stderr)
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,476 @@
+"""Streamlit 頁面多使用者負載測試
+
+啟動 mock_upstream.py 與一個使用暫存資料目錄的 Streamlit 實例（上游指向模擬服務），
+再以 WebSocket 協定模擬多位分析師同時操作：載入頁面 → 點選新聞 news_{id} →
+按下「立即分析此新聞」→ 下載報告。每位使用者在 --duration 秒內重複完整流程，步驟之間有思考時間。
+
+輸出穩定期間（扣除 --ramp-up）每秒完成的工作階段數、各步驟延遲百分位數、
+排隊延遲（送出重跑請求到伺服器開始執行腳本的時間，執行緒與 GIL 不足時會上升）、
+以及伺服器程序的 CPU 時間、常駐記憶體與執行緒數（換算為每個工作階段與每位同時使用者），
+可用來估算一個實例能服務多少位分析師。--url 改為測試已啟動的實例（此時上游不受控，
+以 --pid 指定伺服器程序才會取樣資源用量）。
+
+    python benchmarks/load_streamlit.py --users 20 --duration 120 --latency 2 --output load_streamlit.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from datetime import datetime, timezone
+from urllib.parse import urljoin, urlsplit
+
+from bench_pipeline import (
+    MOCK_API_KEY,
+    MOCK_OPTIONS,
+    ROOT,
+    add_mock_arguments,
+    git_revision,
+    mock_argv,
+    percentile,
+    rounded,
+    start_mock_upstream,
+)
+
+APP_PATH = os.path.join(ROOT, "macroinsight.py")
+STEPS = ("load", "select", "analyze", "download")
+REPORT_BUTTON_KEY = "download_report_markdown"
+
+
+class SessionError(Exception):
+    """模擬的操作流程無法繼續（找不到按鈕、分析失敗、下載失敗……）"""
+
+
+class StreamlitSession:
+    """以 WebSocket 協定模擬一個瀏覽器分頁：重跑腳本、點擊按鈕與取得延遲產生的下載檔"""
+
+    def __init__(self, base_url, http):
+        self.base_url = base_url
+        self.http = http
+        self.ws = None
+        self.session_id = None
+        self.page_script_hash = ""
+        self.widgets = {}
+        self.errors = []
+        self.queue_delays = []
+        self._run = None
+        self._operations = {}
+        self._reader = None
+
+    async def connect(self):
+        import websockets
+
+        url = urlsplit(self.base_url)
+        ws_url = f"{'wss' if url.scheme == 'https' else 'ws'}://{url.netloc}{url.path.rstrip('/')}/_stcore/stream"
+        self.ws = await websockets.connect(ws_url, subprotocols=["streamlit"], max_size=None)
+        self._reader = asyncio.ensure_future(self._read())
+
+    async def close(self):
+        if self.ws is not None:
+            await self.ws.close()
+        if self._reader is not None:
+            await asyncio.gather(self._reader, return_exceptions=True)
+
+    async def _read(self):
+        from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+
+        async for data in self.ws:
+            msg = ForwardMsg()
+            msg.ParseFromString(data)
+            kind = msg.WhichOneof("type")
+            if kind == "new_session":
+                # 每次腳本開始執行都會送出 new_session
+                self.page_script_hash = msg.new_session.page_script_hash
+                self.session_id = msg.new_session.initialize.session_id or self.session_id
+                if self._run is not None and self._run["started"] is None:
+                    self._run["started"] = time.perf_counter()
+            elif kind == "delta" and msg.delta.WhichOneof("type") == "new_element":
+                self._record_element(msg.delta.new_element)
+            elif kind == "script_finished" and self._run is not None:
+                if not self._run["done"].done():
+                    self._run["done"].set_result(msg.script_finished)
+            elif kind == "backend_operation_response":
+                future = self._operations.pop(msg.backend_operation_response.request_id, None)
+                if future is not None and not future.done():
+                    future.set_result(msg.backend_operation_response)
+        # 連線中斷時讓等待中的呼叫端結束
+        for future in [self._run and self._run["done"], *self._operations.values()]:
+            if future is not None and not future.done():
+                future.set_exception(SessionError("WebSocket 連線已中斷"))
+
+    def _record_element(self, element):
+        kind = element.WhichOneof("type")
+        if kind in ("button", "download_button", "checkbox"):
+            widget = getattr(element, kind)
+            # 元件 id 的格式為 "$$ID-<雜湊>-<使用者指定的 key>"
+            self.widgets[widget.id.split("-", 2)[-1]] = widget
+        elif kind == "alert" and element.alert.format == element.alert.ERROR:
+            self.errors.append(element.alert.body)
+        elif kind == "exception":
+            self.errors.append(element.exception.message)
+
+    async def rerun(self, widget_states=(), timeout=300):
+        """送出重跑請求並等待腳本執行完畢；排隊延遲記入 queue_delays"""
+        from streamlit.proto.BackMsg_pb2 import BackMsg
+
+        back_msg = BackMsg()
+        back_msg.rerun_script.page_script_hash = self.page_script_hash
+        back_msg.rerun_script.widget_states.widgets.extend(widget_states)
+        self.errors = []
+        self._run = {"sent": time.perf_counter(), "started": None, "done": asyncio.get_running_loop().create_future()}
+        await self.ws.send(back_msg.SerializeToString())
+        await asyncio.wait_for(self._run["done"], timeout)
+        if self._run["started"] is not None:
+            self.queue_delays.append(self._run["started"] - self._run["sent"])
+        if self.errors:
+            raise SessionError(self.errors[0])
+
+    def widget(self, key):
+        widget = self.widgets.get(key)
+        if widget is None:
+            raise SessionError(f"頁面上找不到元件 {key}")
+        return widget
+
+    async def click(self, key, extra_states=()):
+        from streamlit.proto.WidgetStates_pb2 import WidgetState
+
+        state = WidgetState(id=self.widget(key).id, trigger_value=True)
+        await self.rerun([state, *extra_states])
+
+    async def download(self, key, timeout=60):
+        """取得下載按鈕延遲產生的檔案，返回位元組數"""
+        from streamlit.proto.BackMsg_pb2 import BackMsg
+
+        file_id = self.widget(key).deferred_file_id
+        if not file_id:
+            raise SessionError(f"{key} 不是延遲產生的下載按鈕")
+        back_msg = BackMsg()
+        request = back_msg.backend_operation_request
+        request.request_id = uuid.uuid4().hex
+        request.session_id = self.session_id
+        request.deferred_file.file_id = file_id
+        future = self._operations[request.request_id] = asyncio.get_running_loop().create_future()
+        await self.ws.send(back_msg.SerializeToString())
+        response = await asyncio.wait_for(future, timeout)
+        if response.error_msg:
+            raise SessionError(f"報告產生失敗：{response.error_msg}")
+        file_response = await self.http.get(urljoin(self.base_url + "/", response.deferred_file.url.lstrip("/")))
+        if file_response.status_code != 200:
+            raise SessionError(f"報告下載失敗，狀態碼：{file_response.status_code}")
+        return len(file_response.content)
+
+
+async def run_session(base_url, http, rng, args):
+    """一位分析師的完整流程，返回 {步驟: 秒數} 與排隊延遲"""
+    from streamlit.proto.WidgetStates_pb2 import WidgetState
+
+    async def think():
+        if args.think_time:
+            await asyncio.sleep(rng.uniform(0.5, 1.5) * args.think_time)
+
+    timings = {}
+    session = StreamlitSession(base_url, http)
+    started = time.perf_counter()
+    try:
+        response = await http.get(base_url + "/")
+        if response.status_code != 200:
+            raise SessionError(f"頁面載入失敗，狀態碼：{response.status_code}")
+        await session.connect()
+        await session.rerun()
+        timings["load"] = time.perf_counter() - started
+        await think()
+
+        news_keys = sorted(key for key in session.widgets if key.startswith("news_"))
+        if not news_keys:
+            raise SessionError("新聞列表是空的")
+        started = time.perf_counter()
+        await session.click(rng.choice(news_keys))
+        timings["select"] = time.perf_counter() - started
+        await think()
+
+        extra_states = []
+        if args.bypass_cache:
+            extra_states.append(WidgetState(id=session.widget("bypass_cache").id, bool_value=True))
+        started = time.perf_counter()
+        await session.click("analyze_selected_news", extra_states)
+        timings["analyze"] = time.perf_counter() - started
+        await think()
+
+        started = time.perf_counter()
+        await session.download(REPORT_BUTTON_KEY)
+        timings["download"] = time.perf_counter() - started
+    finally:
+        await session.close()
+    return timings, session.queue_delays
+
+
+class ProcessSampler:
+    """定期讀取 /proc 取樣伺服器程序的 CPU 時間、常駐記憶體與執行緒數（只支援 Linux）"""
+
+    def __init__(self, pid, interval=0.5):
+        self.pid = pid
+        self.interval = interval
+        self.samples = []
+
+    @property
+    def available(self):
+        return self.pid is not None and os.path.exists(f"/proc/{self.pid}/stat")
+
+    def sample(self):
+        with open(f"/proc/{self.pid}/stat") as f:
+            # 程序名稱可能含空白，從最後一個右括號之後開始切分
+            fields = f.read().rsplit(")", 1)[1].split()
+        cpu = (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+        status = {}
+        with open(f"/proc/{self.pid}/status") as f:
+            for line in f:
+                name, _, value = line.partition(":")
+                status[name] = value.split()
+        sample = {
+            "time": time.perf_counter(),
+            "cpu_seconds": cpu,
+            "rss_mb": int(status["VmRSS"][0]) / 1024,
+            "threads": int(status["Threads"][0]),
+        }
+        self.samples.append(sample)
+        return sample
+
+    async def run(self, stop):
+        while not stop.is_set():
+            self.sample()
+            try:
+                await asyncio.wait_for(stop.wait(), self.interval)
+            except asyncio.TimeoutError:
+                pass
+
+
+async def run_load(base_url, args, pid):
+    import httpx
+
+    rng = random.Random(args.seed)
+    sessions = []
+    queue_delays = []
+    sampler = ProcessSampler(pid)
+    stop_sampling = asyncio.Event()
+    sampler_task = asyncio.ensure_future(sampler.run(stop_sampling)) if sampler.available else None
+
+    started = time.perf_counter()
+    deadline = started + args.duration
+    window_start = started + args.ramp_up
+
+    async def user(index, http):
+        # 使用者在 ramp-up 期間平均錯開開始時間
+        await asyncio.sleep(args.ramp_up * index / args.users)
+        while time.perf_counter() < deadline:
+            session_started = time.perf_counter()
+            try:
+                timings, delays = await run_session(base_url, http, random.Random(rng.random()), args)
+            except Exception as e:
+                sessions.append({"finished": time.perf_counter(), "error": f"{type(e).__name__}: {e}"})
+                continue
+            queue_delays.extend(delays)
+            sessions.append({
+                "finished": time.perf_counter(), "seconds": time.perf_counter() - session_started, "steps": timings,
+            })
+
+    limits = httpx.Limits(max_connections=args.users * 2)
+    async with httpx.AsyncClient(timeout=60, limits=limits) as http:
+        await asyncio.gather(*(user(i, http) for i in range(args.users)))
+    finished = time.perf_counter()
+    if sampler_task is not None:
+        stop_sampling.set()
+        await sampler_task
+        sampler.sample()
+    return sessions, queue_delays, sampler.samples, started, window_start, finished
+
+
+def summarize(values):
+    values = sorted(value * 1000 for value in values)
+    return {
+        "count": len(values),
+        "mean_ms": rounded(sum(values) / len(values) if values else None),
+        **{f"p{q}_ms": rounded(percentile(values, q)) for q in (50, 95, 99)},
+        "max_ms": rounded(values[-1] if values else None),
+    }
+
+
+def summarize_resources(samples, users, completed, window_start):
+    """伺服器程序的資源用量；沒有取樣時返回 None"""
+    if not samples:
+        return None
+    first, last = samples[0], samples[-1]
+    peak_rss = max(sample["rss_mb"] for sample in samples)
+    steady = [sample for sample in samples if sample["time"] >= window_start] or samples
+    cpu = last["cpu_seconds"] - first["cpu_seconds"]
+    return {
+        "cpu_seconds": round(cpu, 2),
+        "cpu_utilization": round(cpu / (last["time"] - first["time"]), 3) if last["time"] > first["time"] else None,
+        "cpu_seconds_per_session": round(cpu / completed, 4) if completed else None,
+        "rss_start_mb": round(first["rss_mb"], 1),
+        "rss_peak_mb": round(peak_rss, 1),
+        "rss_end_mb": round(last["rss_mb"], 1),
+        "rss_mb_per_user": round((peak_rss - first["rss_mb"]) / users, 2),
+        "threads_start": first["threads"],
+        "threads_peak": max(sample["threads"] for sample in steady),
+    }
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_streamlit(urls, workdir, args):
+    """在暫存目錄啟動 Streamlit（分析快取、歷史庫等 .cache 資料都寫在其中），返回 (程序, 網址)"""
+    import httpx
+
+    port = free_port()
+    env = dict(
+        os.environ,
+        DEEPSEEK_API_URL=urls["deepseek_url"],
+        GNEWS_SEARCH_URL=urls["gnews_url"],
+        DeepSeek_API=MOCK_API_KEY,
+        GNEWS_API_KEY=MOCK_API_KEY,
+        RATE_LIMIT_DISABLED="1",
+    )
+    log = open(os.path.join(workdir, "streamlit.log"), "w")
+    process = subprocess.Popen(
+        [
+            sys.executable, "-m", "streamlit", "run", APP_PATH,
+            "--server.headless=true", "--server.address=127.0.0.1", f"--server.port={port}",
+            "--server.fileWatcherType=none", "--browser.gatherUsageStats=false",
+        ],
+        cwd=workdir, env=env, stdout=log, stderr=subprocess.STDOUT,
+    )
+    base_url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + args.startup_timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            break
+        try:
+            if httpx.get(base_url + "/_stcore/health", timeout=1).status_code == 200:
+                return process, base_url
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    process.kill()
+    log.close()
+    with open(os.path.join(workdir, "streamlit.log"), encoding="utf-8", errors="replace") as f:
+        raise RuntimeError("Streamlit 啟動失敗：\n" + f.read()[-2000:])
+
+
+def stop_process(process):
+    process.terminate()
+    try:
+        process.wait(10)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
+
+
+async def warm_up(base_url):
+    """先完成一次頁面執行，讓模組匯入與新聞擷取不算入測試期間"""
+    import httpx
+
+    async with httpx.AsyncClient(timeout=60) as http:
+        session = StreamlitSession(base_url, http)
+        try:
+            await session.connect()
+            await session.rerun()
+        finally:
+            await session.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Streamlit 頁面多使用者負載測試（本地模擬 GNews 與 DeepSeek）")
+    parser.add_argument("--users", type=int, default=10, help="同時操作的使用者數（預設 10）")
+    parser.add_argument("--duration", type=float, default=60, help="開始新工作階段的時間長度，秒（預設 60）")
+    parser.add_argument("--ramp-up", type=float, default=10, help="使用者錯開開始的時間，不列入穩定期間（預設 10）")
+    parser.add_argument("--think-time", type=float, default=1.0, help="步驟之間的平均思考時間，秒（預設 1）")
+    parser.add_argument("--bypass-cache", action="store_true", help="勾選「略過分析快取」，每次分析都呼叫上游")
+    parser.add_argument("--url", help="測試已啟動的實例，不啟動模擬服務與 Streamlit")
+    parser.add_argument("--pid", type=int, help="搭配 --url：取樣資源用量的伺服器程序 id")
+    parser.add_argument("--startup-timeout", type=float, default=60, help="等待 Streamlit 啟動的秒數（預設 60）")
+    parser.add_argument("--keep-workdir", action="store_true", help="保留暫存目錄（含 Streamlit 記錄檔）")
+    parser.add_argument("--output", help="將結果寫入 JSON 檔")
+    add_mock_arguments(parser, latency=2.0)
+    args = parser.parse_args(argv)
+    args.ramp_up = min(args.ramp_up, args.duration)
+
+    mock = {name: getattr(args, name) for name in MOCK_OPTIONS}
+    mock_process = streamlit_process = None
+    workdir = None
+    upstream = None
+    try:
+        if args.url:
+            base_url, pid = args.url.rstrip("/"), args.pid
+        else:
+            mock_process, urls = start_mock_upstream(mock_argv(mock))
+            workdir = tempfile.mkdtemp(prefix="macroinsight-load-")
+            streamlit_process, base_url = start_streamlit(urls, workdir, args)
+            pid = streamlit_process.pid
+        asyncio.run(warm_up(base_url))
+        sessions, queue_delays, samples, started, window_start, finished = asyncio.run(run_load(base_url, args, pid))
+        if mock_process is not None:
+            import httpx
+            upstream = httpx.get(urls["stats_url"]).json()
+    finally:
+        for process in (streamlit_process, mock_process):
+            if process is not None:
+                stop_process(process)
+        if workdir is not None:
+            if args.keep_workdir:
+                print(f"暫存目錄：{workdir}", file=sys.stderr)
+            else:
+                shutil.rmtree(workdir, ignore_errors=True)
+
+    completed = [s for s in sessions if "error" not in s]
+    errors = {}
+    for s in sessions:
+        if "error" in s:
+            errors[s["error"]] = errors.get(s["error"], 0) + 1
+    window_end = started + args.duration
+    in_window = [s for s in completed if window_start <= s["finished"] <= window_end]
+    window = window_end - window_start
+    result = {
+        "benchmark": "streamlit_load",
+        "started_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "revision": git_revision(),
+        "config": {
+            "users": args.users,
+            "duration": args.duration,
+            "ramp_up": args.ramp_up,
+            "think_time": args.think_time,
+            "bypass_cache": args.bypass_cache,
+            "url": args.url,
+            "mock": None if args.url else mock,
+        },
+        "sessions": len(sessions),
+        "completed": len(completed),
+        "failed": len(sessions) - len(completed),
+        "errors": errors,
+        "elapsed_s": round(finished - started, 2),
+        "sessions_per_second": round(len(in_window) / window, 3) if window > 0 else None,
+        "session": summarize(s["seconds"] for s in completed),
+        "steps": {step: summarize(s["steps"][step] for s in completed) for step in STEPS},
+        "queue_delay": summarize(queue_delays),
+        "server": summarize_resources(samples, args.users, len(completed), window_start),
+        "upstream": upstream,
+    }
+    print(json.dumps(result, ensure_ascii=False, indent=2))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+    return 0 if completed else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,278 @@
+"""GNews 與 DeepSeek 的本地模擬服務，供基準測試與負載測試使用
+
+同一個連接埠提供 GET /api/v4/search（每次返回內容不同的新文章，避免命中分析快取）、
+POST /v1/chat/completions（含 SSE 串流）與 GET /stats（已處理的請求與注入的異常次數）。
+回應延遲、串流速度、錯誤率與格式錯誤的比例都可設定；分析回應預設為提示詞的結構模板，
+也可以 --canned 指定 JSON 檔。啟動後在標準輸出印出一行包含兩個服務網址的 JSON，
+將分析核心的 DEEPSEEK_API_URL 與 GNEWS_SEARCH_URL 指向這兩個網址即可離線執行整個流程。
+
+    python benchmarks/mock_upstream.py --port 8900 --latency 2 --error-rate 0.05 --truncated-rate 0.1
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from macrocore.analysis import SUMMARY_MAX_TOKENS  # noqa: E402
+from macrocore.prompt import RESULT_TEMPLATE  # noqa: E402
+
+GNEWS_PATH = "/api/v4/search"
+DEEPSEEK_PATH = "/v1/chat/completions"
+SUMMARY_TEXT = "短期宜控制部位並觀察政策動向，長期可逢低布局受惠產業。"
+# 各種模型輸出異常：容錯解析可修復的尾逗號、中途截斷（需補請求區塊）、完全沒有 JSON（解析失敗）
+FAULTS = ("error", "invalid", "truncated", "malformed")
+
+
+# 模擬新聞的主體與事件；組合出的內容差異夠大，頁面不會把它們合併成近似重複的同一則
+SUBJECTS = ("央行", "台積電", "主計總處", "財政部", "金管會", "經濟部", "美國聯準會", "鴻海", "中油", "國發會", "外資")
+EVENTS = (
+    "宣布升息半碼，房貸族利息負擔增加", "公布上月營收，年增率創下新高", "上修全年經濟成長率預測",
+    "公布出口訂單，連續三個月衰退", "調整電價與油價，民生物價承壓", "發布景氣燈號，由黃藍燈轉為綠燈",
+    "宣布擴大投資先進製程與海外設廠",
+)
+
+
+def mock_article(i, published):
+    subject, event = SUBJECTS[i % len(SUBJECTS)], EVENTS[i % len(EVENTS)]
+    return {
+        "title": f"{subject}{event}（第 {i} 則）",
+        "description": f"{subject}今日{event}，市場人士預估影響將延續至第 {i % 4 + 1} 季。",
+        "content": f"{subject}{event}。" + "".join(
+            f"另外，{SUBJECTS[(i + j) % len(SUBJECTS)]}{EVENTS[(i // len(EVENTS) + j) % len(EVENTS)]}。"
+            for j in (2, 3, 5)
+        ) + f"法人認為後續動向值得關注（編號 {i}）。",
+        "url": f"https://mock.example/news/{i}",
+        "publishedAt": published,
+        "source": {"name": "模擬通訊社"},
+    }
+
+
+class MockUpstream(ThreadingHTTPServer):
+    """模擬上游服務；options 為命令列參數，stats 記錄各類請求與注入的異常次數"""
+
+    daemon_threads = True
+
+    def __init__(self, address, options):
+        super().__init__(address, MockHandler)
+        self.options = options
+        if options.canned:
+            with open(options.canned, encoding="utf-8") as f:
+                self.analysis = json.load(f)
+        else:
+            self.analysis = RESULT_TEMPLATE
+        self.random = random.Random(options.seed)
+        self.stats = dict.fromkeys(("gnews", "analysis", "sections", "summary") + FAULTS, 0)
+        self.lock = threading.Lock()
+        self.articles = 0
+        self.responses = 0
+
+    def analysis_content(self):
+        """分析回應的模型輸出；每次在重點中加上編號，讓圖表規格等依內容快取的步驟不會一直命中"""
+        with self.lock:
+            self.responses += 1
+            number = self.responses
+        summary = self.analysis.get("summary") or {}
+        analysis = dict(self.analysis, summary=dict(
+            summary, key_points=[f"模擬分析 #{number}"] + list(summary.get("key_points") or [])
+        ))
+        return "```json\n" + json.dumps(analysis, ensure_ascii=False, indent=2) + "\n```"
+
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def handle_error(self, request, client_address):
+        # 用戶端讀完串流後直接關閉連線是正常情況，不輸出追蹤訊息
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+    def count(self, name):
+        with self.lock:
+            self.stats[name] += 1
+
+    def draw_fault(self, kind):
+        """依設定的比例決定這次回應要注入的異常，None 為正常回應"""
+        options = self.options
+        with self.lock:
+            roll = self.random.random()
+        threshold = 0.0
+        for fault, rate in (("error", options.error_rate), ("invalid", options.invalid_rate),
+                            ("truncated", options.truncated_rate), ("malformed", options.malformed_rate)):
+            if fault != "error" and kind != "analysis":
+                continue  # 補請求與總結只注入 HTTP 錯誤
+            threshold += rate
+            if roll < threshold:
+                self.count(fault)
+                return fault
+        return None
+
+    def delay(self, latency, jitter):
+        with self.lock:
+            offset = self.random.uniform(-jitter, jitter) if jitter else 0.0
+        time.sleep(max(0.0, latency + offset))
+
+    def next_articles(self, count):
+        with self.lock:
+            start = self.articles
+            self.articles += count
+        published = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
+        return [mock_article(i, published) for i in range(start, start + count)]
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        server = self.server
+        url = urlsplit(self.path)
+        if url.path == "/stats":
+            with server.lock:
+                self.send_json(200, dict(server.stats))
+            return
+        if url.path != GNEWS_PATH:
+            self.send_json(404, {"error": "not found"})
+            return
+        server.count("gnews")
+        server.delay(server.options.gnews_latency, 0)
+        count = int(parse_qs(url.query).get("max", ["10"])[0])
+        articles = server.next_articles(count)
+        self.send_json(200, {"totalArticles": len(articles), "articles": articles})
+
+    def do_POST(self):
+        server = self.server
+        options = server.options
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length") or 0)) or b"{}")
+        if urlsplit(self.path).path != DEEPSEEK_PATH:
+            self.send_json(404, {"error": "not found"})
+            return
+        prompt = "".join(message.get("content", "") for message in body.get("messages", []))
+        if body.get("max_tokens", 0) <= SUMMARY_MAX_TOKENS:
+            kind = "summary"
+        elif "這次只需返回" in prompt:
+            kind = "sections"
+        else:
+            kind = "analysis"
+        server.count(kind)
+
+        fault = server.draw_fault(kind)
+        if fault == "error":
+            self.send_json(options.error_status, {"error": {"message": "mock upstream error"}})
+            return
+        content = SUMMARY_TEXT if kind == "summary" else server.analysis_content()
+        if fault == "invalid":
+            content = "抱歉，目前無法提供這則新聞的分析。"
+        elif fault == "truncated":
+            content = content[:len(content) * 3 // 5]
+        elif fault == "malformed":
+            # 在最後一個欄位後多一個逗號：嚴格解析失敗，容錯解析可以修復
+            end = content.rfind("}", 0, content.rfind("}"))
+            content = content[:end + 1] + "," + content[end + 1:]
+        usage = {
+            "prompt_tokens": len(prompt) // 2,
+            "completion_tokens": len(content) // 2,
+            "total_tokens": (len(prompt) + len(content)) // 2,
+            "prompt_cache_hit_tokens": 0,
+            "prompt_cache_miss_tokens": len(prompt) // 2,
+        }
+
+        server.delay(options.latency, options.jitter)
+        if body.get("stream"):
+            self.send_stream(content, usage)
+        else:
+            self.send_json(200, {
+                "model": body.get("model"),
+                "choices": [
+                    {"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}
+                ],
+                "usage": usage,
+            })
+
+    def send_json(self, status, payload):
+        data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        if status == 429 or status >= 500:
+            self.send_header("Retry-After", "1")
+        self.end_headers()
+        self.wfile.write(data)
+
+    def send_stream(self, content, usage):
+        """以 SSE 分段送出，每段之間等待 --chunk-delay 秒"""
+        options = self.server.options
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        def event(payload):
+            data = f"data: {payload}\n\n".encode("utf-8")
+            self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+
+        for i in range(0, len(content), options.chunk_size):
+            if i and options.chunk_delay:
+                time.sleep(options.chunk_delay)
+            event(json.dumps({"choices": [{"index": 0, "delta": {"content": content[i:i + options.chunk_size]}}]},
+                             ensure_ascii=False))
+        event(json.dumps({"choices": [], "usage": usage}))
+        event("[DONE]")
+        self.wfile.write(b"0\r\n\r\n")
+
+    def log_message(self, format, *args):
+        pass
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="GNews 與 DeepSeek 的本地模擬服務")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=0, help="連接埠，0 為自動選擇（預設）")
+    parser.add_argument("--latency", type=float, default=0.5, help="DeepSeek 回應前的延遲秒數（預設 0.5）")
+    parser.add_argument("--jitter", type=float, default=0.0, help="延遲的隨機浮動範圍 ± 秒（預設 0）")
+    parser.add_argument("--gnews-latency", type=float, default=0.1, help="GNews 回應延遲秒數（預設 0.1）")
+    parser.add_argument("--chunk-size", type=int, default=40, help="串流每段的字元數（預設 40）")
+    parser.add_argument("--chunk-delay", type=float, default=0.0, help="串流每段之間的間隔秒數（預設 0）")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="DeepSeek 回應 HTTP 錯誤的比例")
+    parser.add_argument("--error-status", type=int, default=503, help="注入錯誤的狀態碼（預設 503）")
+    parser.add_argument("--invalid-rate", type=float, default=0.0, help="分析回應完全不含 JSON 的比例")
+    parser.add_argument("--truncated-rate", type=float, default=0.0, help="分析回應在中途截斷的比例")
+    parser.add_argument("--malformed-rate", type=float, default=0.0, help="分析回應 JSON 多一個尾逗號的比例")
+    parser.add_argument("--canned", help="分析回應使用的 JSON 檔（預設為提示詞的結構模板）")
+    parser.add_argument("--seed", type=int, help="異常注入的亂數種子")
+    return parser
+
+
+def start_mock_upstream(options):
+    """在背景執行緒啟動模擬服務，返回伺服器"""
+    server = MockUpstream((options.host, options.port), options)
+    threading.Thread(target=server.serve_forever, name="mock-upstream", daemon=True).start()
+    return server
+
+
+def main(argv=None):
+    options = build_parser().parse_args(argv)
+    server = MockUpstream((options.host, options.port), options)
+    print(json.dumps({
+        "deepseek_url": server.base_url + DEEPSEEK_PATH,
+        "gnews_url": server.base_url + GNEWS_PATH,
+        "stats_url": server.base_url + "/stats",
+    }), flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
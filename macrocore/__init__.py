@@ -0,0 +1,28 @@
+"""MacroInsight 分析核心（不依賴 Streamlit 的共用元件）
+
+常用介面可直接自套件取得；各子模組在第一次存取時才載入，
+讓 ``import macrocore`` 維持在數十毫秒以內。
+"""
+import importlib
+
+_EXPORTS = {
+    "AnalysisCache": "macrocore.cache",
+    "AnalysisError": "macrocore.analysis",
+    "build_markdown_report": "macrocore.report",
+    "convert_impact_to_score": "macrocore.scoring",
+    "format_news_text": "macrocore.analysis",
+    "render_report": "macrocore.report",
+    "request_analysis": "macrocore.analysis",
+    "request_investment_summary": "macrocore.analysis",
+    "score_impacts": "macrocore.scoring",
+}
+
+__all__ = sorted(_EXPORTS)
+
+
+def __getattr__(name):
+    if name not in _EXPORTS:
+        raise AttributeError(f"module 'macrocore' has no attribute {name!r}")
+    value = getattr(importlib.import_module(_EXPORTS[name]), name)
+    globals()[name] = value
+    return value
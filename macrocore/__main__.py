@@ -0,0 +1,5 @@
+import sys
+
+from macrocore.cli import main
+
+sys.exit(main())
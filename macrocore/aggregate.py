@@ -0,0 +1,174 @@
+"""跨新聞的每日市場影響統計
+
+每則分析在各面向（GDP、通膨、就業、消費、股市、債市、匯市、商品）各得到一個帶正負號的分數
+（同一面向有多個項目時取平均），以 Welford 演算法逐筆更新當日的筆數、平均與離差平方和，
+新分析進來時只更新一列，不必重新掃描歷史；任意期間的統計再以平行合併公式由每日列組合而成。
+狀態存在 SQLite，頁面、批次工具與 ASGI 服務寫入同一份統計。numpy 只在計算時才載入。
+"""
+import contextlib
+import os
+import sqlite3
+
+# (面向, 顯示名稱)
+AGGREGATE_DIMENSIONS = (
+    ("gdp", "GDP"),
+    ("inflation", "通膨"),
+    ("employment", "就業"),
+    ("consumption", "消費"),
+    ("stock", "股市"),
+    ("bond", "債市"),
+    ("forex", "匯市"),
+    ("commodity", "商品"),
+)
+# 歷史庫的面向對應到統計面向；產業類面向不納入
+SOURCE_DIMENSIONS = {
+    "gdp": "gdp",
+    "inflation": "inflation",
+    "employment": "employment",
+    "consumption": "consumption",
+    "index": "stock",
+    "bond_government": "bond",
+    "bond_corporate": "bond",
+    "forex": "forex",
+    "commodity": "commodity",
+}
+_INDEX = {name: i for i, (name, _) in enumerate(AGGREGATE_DIMENSIONS)}
+
+
+def dimension_scores(dimensions, signed, matched=None):
+    """將一則分析展開後的各列分數彙整為各統計面向的平均分數（numpy 陣列，缺少的面向為 NaN）
+
+    matched 為 False 的列（無法辨識的描述，例如缺值時的「未提供」）不列入。
+    """
+    import numpy as np
+
+    index = np.array([_INDEX.get(SOURCE_DIMENSIONS.get(d), -1) for d in dimensions], dtype=np.intp)
+    keep = index >= 0
+    if matched is not None:
+        keep &= np.asarray(matched, dtype=bool)
+    values = np.asarray(signed, dtype=float)[keep]
+    totals = np.bincount(index[keep], weights=values, minlength=len(AGGREGATE_DIMENSIONS))
+    counts = np.bincount(index[keep], minlength=len(AGGREGATE_DIMENSIONS))
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(counts > 0, totals / counts, np.nan)
+
+
+def combine(count, mean, m2, axis=0):
+    """以平行合併公式沿 axis 合併多組 (筆數, 平均, 離差平方和)，返回合併後的 (筆數, 平均, 標準差)"""
+    import numpy as np
+
+    count = np.asarray(count, dtype=float)
+    mean = np.nan_to_num(np.asarray(mean, dtype=float))
+    m2 = np.asarray(m2, dtype=float)
+    total = count.sum(axis=axis)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        combined_mean = (count * mean).sum(axis=axis) / total
+        # 組內離差平方和加上組平均相對總平均的偏移
+        deviation = mean - np.expand_dims(combined_mean, axis)
+        combined_m2 = m2.sum(axis=axis) + (count * np.nan_to_num(deviation) ** 2).sum(axis=axis)
+        std = np.sqrt(combined_m2 / total)
+    return total.astype(int), np.where(total > 0, combined_mean, np.nan), np.where(total > 0, std, np.nan)
+
+
+class DailyImpactAggregate:
+    """每日 × 面向的增量統計（筆數、平均、離差平方和），以 SQLite 保存"""
+
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS daily_impact ("
+                " day TEXT NOT NULL,"
+                " dimension TEXT NOT NULL,"
+                " count INTEGER NOT NULL,"
+                " mean REAL NOT NULL,"
+                " m2 REAL NOT NULL,"
+                " PRIMARY KEY (day, dimension))"
+            )
+
+    @contextlib.contextmanager
+    def _connect(self):
+        # BEGIN IMMEDIATE 讓讀取-更新-寫入在程序間互斥
+        conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+        finally:
+            conn.close()
+
+    def add(self, day, scores):
+        """以一則分析的各面向分數（dimension_scores 的結果）更新當日統計；day 為 YYYY-MM-DD"""
+        with self._connect() as conn:
+            for (dimension, _), value in zip(AGGREGATE_DIMENSIONS, scores):
+                if value != value:  # NaN：這則分析沒有此面向
+                    continue
+                row = conn.execute(
+                    "SELECT count, mean, m2 FROM daily_impact WHERE day = ? AND dimension = ?", (day, dimension)
+                ).fetchone()
+                count, mean, m2 = row if row is not None else (0, 0.0, 0.0)
+                count += 1
+                delta = float(value) - mean
+                mean += delta / count
+                m2 += delta * (float(value) - mean)
+                conn.execute(
+                    "INSERT OR REPLACE INTO daily_impact (day, dimension, count, mean, m2) VALUES (?, ?, ?, ?, ?)",
+                    (day, dimension, count, mean, m2),
+                )
+
+    def replace(self, rows):
+        """以 [(day, dimension, count, mean, m2)] 整批取代統計，供由歷史庫重建時使用"""
+        with self._connect() as conn:
+            conn.execute("DELETE FROM daily_impact")
+            conn.executemany(
+                "INSERT INTO daily_impact (day, dimension, count, mean, m2) VALUES (?, ?, ?, ?, ?)", rows
+            )
+
+    def _load(self, start, end):
+        import numpy as np
+
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT day, dimension, count, mean, m2 FROM daily_impact WHERE day BETWEEN ? AND ? ORDER BY day",
+                (start.isoformat(), end.isoformat()),
+            ).fetchall()
+        days = sorted({row[0] for row in rows})
+        position = {day: i for i, day in enumerate(days)}
+        shape = (len(days), len(AGGREGATE_DIMENSIONS))
+        count, mean, m2 = np.zeros(shape), np.zeros(shape), np.zeros(shape)
+        for day, dimension, n, mu, squares in rows:
+            if dimension in _INDEX:
+                i, j = position[day], _INDEX[dimension]
+                count[i, j], mean[i, j], m2[i, j] = n, mu, squares
+        return days, count, mean, m2
+
+    def daily(self, start, end):
+        """返回期間內各日的統計：{"days", "dimensions", "count", "mean", "std"}，矩陣為 日 × 面向"""
+        import numpy as np
+
+        days, count, mean, m2 = self._load(start, end)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            std = np.sqrt(m2 / count)
+        return {
+            "days": days,
+            "dimensions": [label for _, label in AGGREGATE_DIMENSIONS],
+            "count": count.astype(int),
+            "mean": np.where(count > 0, mean, np.nan),
+            "std": np.where(count > 0, std, np.nan),
+        }
+
+    def window(self, start, end):
+        """合併期間內的每日統計，返回各面向的 {"dimensions", "count", "mean", "std"}"""
+        _, count, mean, m2 = self._load(start, end)
+        total, combined_mean, std = combine(count, mean, m2, axis=0)
+        return {
+            "dimensions": [label for _, label in AGGREGATE_DIMENSIONS],
+            "count": total,
+            "mean": combined_mean,
+            "std": std,
+        }
@@ -0,0 +1,187 @@
+"""非同步上游呼叫（httpx），供 ASGI 服務使用
+
+提示詞、回應解析、快取鍵與重試/斷路器策略都與同步版本共用，
+確保兩種前端得到相同的分析結果與快取命中。
+"""
+import asyncio
+import json
+import time
+
+from macrocore.analysis import (
+    AnalysisError,
+    analysis_key,
+    analysis_source,
+    build_analysis_payload,
+    build_sections_payload,
+    finalize_analysis,
+    find_near_duplicate_analysis,
+    merge_sections_result,
+    parse_analysis_result,
+    record_analysis_source,
+    response_json,
+)
+from macrocore.deepseek import DEEPSEEK_API_URL, deepseek_headers
+from macrocore.httpclient import BaseHttpClient, retry_after_seconds
+from macrocore.metrics import metrics
+from macrocore.usage import normalize_usage, usage_tracker
+
+
+class AsyncHttpClient(BaseHttpClient):
+    """事件迴圈共用的非同步 HTTP 用戶端，保持每個主機的長連線"""
+
+    def __init__(self, max_connections=50, **kwargs):
+        super().__init__(**kwargs)
+        import httpx
+        self._httpx = httpx
+        connect_timeout, read_timeout = self.timeout
+        self.client = httpx.AsyncClient(
+            timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+        )
+
+    async def request(self, method, url, max_retries=None, provider=None, **kwargs):
+        """送出請求；遇到連線錯誤或 429/5xx 時退避重試，斷路器開啟或額度不足時立即失敗"""
+        breaker = self.breaker(url)
+        retries = self.max_retries if max_retries is None else max_retries
+        limited = provider is not None and self.quota is not None
+        attempt = 0
+        while True:
+            self._ensure_closed(url, breaker)
+            if limited:
+                try:
+                    await self.quota.acquire_async(provider)
+                except BaseException:
+                    breaker.release_trial()
+                    raise
+            try:
+                response = await self.client.request(method, url, **kwargs)
+            except self._httpx.HTTPError as exc:
+                breaker.record_failure()
+                retryable = isinstance(exc, self._httpx.TransportError)
+                if not retryable or attempt >= retries:
+                    raise
+                await asyncio.sleep(self._backoff(attempt))
+                attempt += 1
+                continue
+
+            blocked_for = None
+            if limited and response.status_code >= 400:
+                blocked_for = await asyncio.to_thread(
+                    self.quota.record_response, provider, response.status_code, retry_after_seconds(response)
+                )
+            delay = self._retry_delay(breaker, response, attempt, retries, blocked_for)
+            if delay is None:
+                return response
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    async def post(self, url, **kwargs):
+        return await self.request("POST", url, **kwargs)
+
+    async def aclose(self):
+        await self.client.aclose()
+
+
+async def async_request_analysis(news_text, api_key, client, cache=None, use_cache=True, singleflight=None,
+                                 near_duplicates=None, history=None, similar=None):
+    """request_analysis 的非同步版本，返回 (分析結果, 資訊)；失敗時拋出 AnalysisError
+
+    近似重複新聞、歷史庫與相似歷史分析參考的處理與 request_analysis 相同。
+    傳入 AsyncSingleFlight 時，同一則新聞正在分析中的後到請求會等待並共用同一份結果。
+    """
+    with metrics.timer("analysis") as fields:
+        analysis, info = await _async_request_analysis(
+            news_text, api_key, client, cache, use_cache, singleflight, near_duplicates, history, similar
+        )
+        fields["source"] = analysis_source(info)
+    record_analysis_source(info)
+    return analysis, info
+
+
+async def _async_request_analysis(news_text, api_key, client, cache, use_cache, singleflight, near_duplicates,
+                                  history, similar):
+    cache_key = analysis_key(news_text)
+    if cache is not None and use_cache:
+        # SQLite 讀寫雖短，仍移到執行緒中避免阻塞事件迴圈
+        cached_analysis = await asyncio.to_thread(cache.get, cache_key)
+        if cached_analysis is not None:
+            return cached_analysis, {
+                "cached": True, "stored": True, "shared": False, "usage": None, "near_duplicate": None
+            }
+        if near_duplicates is not None:
+            duplicate = await asyncio.to_thread(find_near_duplicate_analysis, news_text, cache, near_duplicates)
+            if duplicate is not None:
+                return duplicate[0], {
+                    "cached": True, "stored": False, "shared": False, "usage": None, "near_duplicate": duplicate[1]
+                }
+
+    async def fetch():
+        if singleflight is not None and cache is not None and use_cache:
+            # 取得跨程序鎖後再查一次快取：其他程序可能剛完成同一則新聞的分析
+            cached_analysis = await asyncio.to_thread(cache.get, cache_key, False)
+            if cached_analysis is not None:
+                return cached_analysis, {
+                    "cached": True, "stored": True, "shared": False, "usage": None, "near_duplicate": None
+                }
+
+        started = time.monotonic()
+        payload = json.dumps(build_analysis_payload(news_text, similar=similar))
+        with metrics.timer("deepseek", kind="analysis", stream=False) as fields:
+            response = await client.post(
+                DEEPSEEK_API_URL,
+                provider="deepseek",
+                headers=deepseek_headers(api_key),
+                content=payload,
+            )
+            fields["status_code"] = response.status_code
+            if response.status_code != 200:
+                raise AnalysisError(f"API 調用失敗: {response.status_code}", raw_response=response.text)
+            result = response_json(response)
+            fields.update(normalize_usage(result.get("usage")) or {})
+
+        with metrics.timer("parse"):
+            analysis, broken, parsed_cleanly, usage = parse_analysis_result(result)
+        usage = usage_tracker.record("analysis", usage, time.monotonic() - started)
+        still_broken = []
+        if broken:
+            with metrics.timer("repair", sections=broken):
+                still_broken = await _request_sections(news_text, api_key, client, analysis, broken)
+        analysis = finalize_analysis(analysis, parsed_cleanly, broken)
+        if not still_broken:
+            if cache is not None:
+                await asyncio.to_thread(cache.put, cache_key, analysis)
+                if near_duplicates is not None:
+                    await asyncio.to_thread(near_duplicates.add, cache_key, news_text)
+            if history is not None:
+                await asyncio.to_thread(history.append, cache_key, analysis, None, news_text)
+        return analysis, {
+            "cached": False, "stored": cache is not None and not still_broken, "shared": False, "usage": usage,
+            "near_duplicate": None,
+        }
+
+    if singleflight is None:
+        return await fetch()
+    (analysis, info), shared = await singleflight.do(cache_key, fetch)
+    return analysis, dict(info, shared=shared)
+
+
+async def _request_sections(news_text, api_key, client, analysis, sections):
+    """只重新請求截斷或無法解析的區塊，返回仍然缺少的區塊"""
+    started = time.monotonic()
+    try:
+        response = await client.post(
+            DEEPSEEK_API_URL,
+            provider="deepseek",
+            headers=deepseek_headers(api_key),
+            content=json.dumps(build_sections_payload(news_text, sections)),
+        )
+    except Exception:
+        return list(sections)
+    if response.status_code != 200:
+        return list(sections)
+    try:
+        result = response_json(response)
+        usage_tracker.record("repair", result.get("usage"), time.monotonic() - started)
+        return merge_sections_result(analysis, sections, result)
+    except AnalysisError:
+        return list(sections)
@@ -0,0 +1,370 @@
+"""新聞分析核心流程：組合提示詞、呼叫 DeepSeek 並擷取 JSON 結果"""
+import json
+import re
+import time
+
+from macrocore.cache import analysis_cache_key
+from macrocore.deepseek import DEEPSEEK_API_URL, deepseek_headers, iter_stream_content
+from macrocore.httpclient import get_http_client
+from macrocore.metrics import metrics
+from macrocore.prompt import (
+    PROMPT_VERSION,
+    RESULT_TEMPLATE,
+    build_analysis_messages,
+    build_sections_messages,
+    build_summary_messages,
+)
+from macrocore.stream_json import SectionStreamParser
+from macrocore.tolerant_json import conform_to_template, loads_tolerant, parse_stats
+from macrocore.usage import normalize_usage, usage_tracker
+
+# DeepSeek 分析參數
+DEEPSEEK_MODEL = "deepseek-chat"
+ANALYSIS_TEMPERATURE = 0.3
+ANALYSIS_MAX_TOKENS = 4000
+SUMMARY_MAX_TOKENS = 500
+
+
+class AnalysisError(Exception):
+    """分析失敗；保留原始回應與擷取出的 JSON 字串供除錯"""
+
+    def __init__(self, message, raw_response=None, json_str=None):
+        super().__init__(message)
+        self.raw_response = raw_response
+        self.json_str = json_str
+
+
+def extract_analysis_json(response_content):
+    """從模型回應中擷取並解析分析結果 JSON"""
+    # 使用正則表達式提取被 ```json ... ``` 包圍的內容
+    match = re.search(r"```json\n(.*?)\n```", response_content, re.DOTALL)
+    if match:
+        json_str = match.group(1)
+    else:
+        # 如果沒有找到 ```json ... ```，則退回使用原始的查找方式
+        start_idx = response_content.find('{')
+        end_idx = response_content.rfind('}') + 1
+        if start_idx < 0 or end_idx <= start_idx:
+            raise AnalysisError("無法在回應中找到有效的 JSON 結構", raw_response=response_content)
+        json_str = response_content[start_idx:end_idx]
+
+    try:
+        return json.loads(json_str)
+    except json.JSONDecodeError as je:
+        raise AnalysisError(f"JSON 解析錯誤: {str(je)}", raw_response=response_content, json_str=json_str)
+
+
+def response_json(response):
+    """解析 API 回應本體；狀態碼 200 但本體不是有效 JSON 時拋出 AnalysisError"""
+    try:
+        return response.json()
+    except ValueError as e:
+        raise AnalysisError(f"API 回應不是有效的 JSON: {e}", raw_response=response.text)
+
+
+def message_content(result):
+    """取出回應中的模型輸出；格式不符時拋出 AnalysisError"""
+    try:
+        return result["choices"][0]["message"]["content"]
+    except (KeyError, IndexError, TypeError):
+        raise AnalysisError("API 回應缺少模型輸出內容", raw_response=json.dumps(result, ensure_ascii=False))
+
+
+@metrics.timed("prompt")
+def build_analysis_payload(news_text, stream=False, similar=None):
+    """組合分析請求的 DeepSeek API 請求內容；similar 為附加在提示詞中的相似歷史分析"""
+    data = {
+        "model": DEEPSEEK_MODEL,
+        "messages": build_analysis_messages(news_text, similar),
+        "temperature": ANALYSIS_TEMPERATURE,
+        "max_tokens": ANALYSIS_MAX_TOKENS
+    }
+    if stream:
+        data["stream"] = True
+        data["stream_options"] = {"include_usage": True}
+    return data
+
+
+def missing_sections(analysis, broken=()):
+    """返回分析結果中缺少、截斷或無法解析的頂層區塊"""
+    if not isinstance(analysis, dict):
+        return list(RESULT_TEMPLATE)
+    return [name for name in RESULT_TEMPLATE if name not in analysis or name in broken]
+
+
+def parse_analysis_content(response_content):
+    """容錯解析模型輸出，返回 (分析結果, 需要重新請求的頂層區塊, 是否直接解析成功)
+
+    先以原本的方式嚴格解析；失敗時改用容錯解析，保留完整的區塊。
+    兩種情況下截斷或缺少的區塊都列入重新請求清單；連一個區塊都取不到時拋出 AnalysisError。
+    """
+    try:
+        analysis = extract_analysis_json(response_content)
+        broken, parsed_cleanly = [], True
+    except AnalysisError as e:
+        error = e
+        analysis, broken, _ = loads_tolerant(response_content)
+        parsed_cleanly = False
+    else:
+        error = AnalysisError("回應的 JSON 不含任何分析區塊", raw_response=response_content)
+    missing = missing_sections(analysis, broken)
+    if len(missing) == len(RESULT_TEMPLATE):
+        parse_stats.record("failed")
+        raise error
+    return analysis, missing, parsed_cleanly
+
+
+def parse_analysis_result(result):
+    """解析非串流回應，返回 (分析結果, 需要重新請求的頂層區塊, 是否直接解析成功, token 用量)"""
+    return (*parse_analysis_content(message_content(result)), dict(result.get("usage") or {}))
+
+
+def build_sections_payload(news_text, sections):
+    """只重新請求部分頂層區塊的 DeepSeek API 請求內容"""
+    return {
+        "model": DEEPSEEK_MODEL,
+        "messages": build_sections_messages(news_text, sections),
+        "temperature": ANALYSIS_TEMPERATURE,
+        "max_tokens": ANALYSIS_MAX_TOKENS
+    }
+
+
+def merge_sections_result(analysis, sections, result):
+    """將重新請求的區塊併入分析結果，返回仍然缺少的區塊；回應格式不符時拋出 AnalysisError"""
+    repaired, broken, _ = loads_tolerant(message_content(result))
+    still_broken = []
+    for name in sections:
+        if repaired and name in repaired and name not in broken:
+            analysis[name] = repaired[name]
+        else:
+            still_broken.append(name)
+    return still_broken
+
+
+def finalize_analysis(analysis, parsed_cleanly, requested_sections):
+    """依結構模板補齊缺少的欄位並記錄解析結果統計，返回校正後的分析結果"""
+    analysis, filled = conform_to_template(analysis, RESULT_TEMPLATE)
+    if requested_sections:
+        parse_stats.record("sections_requested")
+    elif not parsed_cleanly or filled:
+        parse_stats.record("repaired")
+    else:
+        parse_stats.record("clean")
+    return analysis
+
+
+def analysis_key(news_text):
+    """目前提示詞版本、模型與溫度下，這則新聞的分析快取鍵"""
+    return analysis_cache_key(news_text, PROMPT_VERSION, DEEPSEEK_MODEL, ANALYSIS_TEMPERATURE)
+
+
+def format_news_text(news):
+    """將新聞項目（title/category/content）組成送交分析的文本；單則、批次與命令列共用以確保快取鍵一致"""
+    return f"""
+**新聞標題：** {news['title']}
+**新聞類別：** {news['category']}
+
+**新聞內容：**
+{news['content']}
+"""
+
+
+def analysis_source(info):
+    """分析結果的來源：near_duplicate / cache_hit / shared / api，作為指標標籤"""
+    if info["near_duplicate"] is not None:
+        return "near_duplicate"
+    if info["cached"]:
+        return "cache_hit"
+    return "shared" if info["shared"] else "api"
+
+
+def record_analysis_source(info):
+    metrics.increment("analysis_requests_total", help_text="分析請求依結果來源的次數", source=analysis_source(info))
+
+
+def find_near_duplicate_analysis(news_text, cache, near_duplicates):
+    """在近似重複索引中找到同一事件已分析過的新聞時，返回 (分析結果, 相似度)，否則返回 None"""
+    match = near_duplicates.find(news_text)
+    if match is None:
+        return None
+    key, similarity = match
+    # 原新聞的分析可能已被快取淘汰，此時仍需重新分析
+    analysis = cache.get(key, record_stats=False)
+    return (analysis, similarity) if analysis is not None else None
+
+
+def request_analysis(news_text, api_key, cache=None, use_cache=True, stream=False,
+                     on_section=None, rate_limiter=None, singleflight=None, near_duplicates=None,
+                     history=None, similar=None):
+    """分析一則新聞，返回 (分析結果, 資訊)；資訊包含 cached、stored、shared 與 token 用量 usage
+
+    stored 表示這份結果確實以這則新聞的鍵存在分析快取中（近似重複沿用、以預設值補齊的結果不寫入快取），
+    呼叫端只應把後續產生的內容（例如投資建議總結）併入 stored 為真的快取項目。
+
+    usage 含輸入/輸出 token 與上下文快取命中/未命中 token，快取或共用結果時為 None。
+    傳入 NearDuplicateIndex 時，內容雜湊未命中但與已分析新聞近似重複（例如不同媒體轉載的同一則稿件）
+    也直接沿用該分析，資訊中的 near_duplicate 為相似度，否則為 None。
+
+    不依賴 Streamlit，可在背景執行緒中呼叫；失敗時拋出 AnalysisError。
+    stream=True 時以 SSE 串流接收，每完成一個頂層區塊即呼叫 on_section(名稱, 內容)，內容已依結構模板補齊欄位。
+    rate_limiter 只在實際呼叫 API 前取得配額，快取命中不受限制。
+    傳入 singleflight 時，同一則新聞正在分析中的後到呼叫會等待並共用同一份結果。
+    傳入 AnalysisHistory 時，實際呼叫 API 取得的完整結果會展開寫入歷史庫（快取命中不重複寫入）。
+    similar 為相似的歷史分析（SemanticIndex.search 的結果），實際呼叫 API 時附在提示詞中作為參考；
+    參考資料不影響快取鍵，快取命中時直接返回既有結果。
+    各階段耗時與結果來源記入 metrics。
+    """
+    with metrics.timer("analysis") as fields:
+        analysis, info = _request_analysis(
+            news_text, api_key, cache, use_cache, stream, on_section, rate_limiter, singleflight, near_duplicates,
+            history, similar
+        )
+        fields["source"] = analysis_source(info)
+    record_analysis_source(info)
+    return analysis, info
+
+
+def _request_analysis(news_text, api_key, cache, use_cache, stream, on_section, rate_limiter, singleflight,
+                      near_duplicates, history, similar):
+    # 相同新聞、提示詞版本、模型與溫度直接返回快取結果，不再消耗 token
+    cache_key = analysis_key(news_text)
+    if cache is not None and use_cache:
+        cached_analysis = cache.get(cache_key)
+        if cached_analysis is not None:
+            return cached_analysis, {
+                "cached": True, "stored": True, "shared": False, "usage": None, "near_duplicate": None
+            }
+        if near_duplicates is not None:
+            duplicate = find_near_duplicate_analysis(news_text, cache, near_duplicates)
+            if duplicate is not None:
+                return duplicate[0], {
+                    "cached": True, "stored": False, "shared": False, "usage": None, "near_duplicate": duplicate[1]
+                }
+
+    def fetch():
+        if singleflight is not None and cache is not None and use_cache:
+            # 取得跨程序鎖後再查一次快取：其他程序可能剛完成同一則新聞的分析
+            cached_analysis = cache.get(cache_key, record_stats=False)
+            if cached_analysis is not None:
+                return cached_analysis, {
+                    "cached": True, "stored": True, "shared": False, "usage": None, "near_duplicate": None
+                }
+        return _fetch_analysis(
+            news_text, api_key, cache_key, cache, stream, on_section, rate_limiter, near_duplicates, history,
+            similar
+        )
+
+    if singleflight is None:
+        return fetch()
+    (analysis, info), shared = singleflight.do(cache_key, fetch)
+    return analysis, dict(info, shared=shared)
+
+
+def _fetch_analysis(news_text, api_key, cache_key, cache, stream, on_section, rate_limiter, near_duplicates,
+                    history, similar):
+    data = build_analysis_payload(news_text, stream=stream, similar=similar)
+    if rate_limiter is not None:
+        rate_limiter.acquire()
+    started = time.monotonic()
+    # 串流模式下往返時間包含邊接收邊解析與顯示區塊的時間
+    with metrics.timer("deepseek", kind="analysis", stream=stream) as fields:
+        response = get_http_client().post(
+            DEEPSEEK_API_URL, provider="deepseek", headers=deepseek_headers(api_key),
+            data=json.dumps(data), stream=stream
+        )
+        fields["status_code"] = response.status_code
+        if response.status_code != 200:
+            raise AnalysisError(f"API 調用失敗: {response.status_code}", raw_response=response.text)
+
+        if stream:
+            # 邊接收邊解析，每個頂層區塊一完成就交給呼叫端
+            usage = {}
+            parser = SectionStreamParser()
+            chunks = []
+            for delta in iter_stream_content(response, usage=usage):
+                chunks.append(delta)
+                for section_name, section in parser.feed(delta):
+                    if on_section is None:
+                        continue
+                    # 串流中的區塊尚未校正，先依模板補齊缺少的巢狀欄位，避免顯示時因缺欄位中斷整份分析
+                    if section_name in RESULT_TEMPLATE:
+                        section, _ = conform_to_template(section, RESULT_TEMPLATE[section_name])
+                    on_section(section_name, section)
+        else:
+            result = response_json(response)
+            usage = result.get("usage")
+        fields.update(normalize_usage(usage) or {})
+
+    with metrics.timer("parse"):
+        if not stream:
+            analysis, broken, parsed_cleanly, usage = parse_analysis_result(result)
+        elif parser.complete:
+            # JSON 完整但可能少了整個頂層區塊，同樣需要補請求
+            analysis, broken, parsed_cleanly = parser.sections, missing_sections(parser.sections), True
+        else:
+            analysis, broken, parsed_cleanly = parse_analysis_content("".join(chunks))
+
+    usage = usage_tracker.record("analysis", usage, time.monotonic() - started)
+    still_broken = []
+    if broken:
+        # 只重新請求截斷或無法解析的區塊，不必重跑整份分析
+        with metrics.timer("repair", sections=broken):
+            still_broken = _request_sections(news_text, api_key, analysis, broken, rate_limiter)
+    analysis = finalize_analysis(analysis, parsed_cleanly, broken)
+    if on_section is not None:
+        for section_name in broken:
+            on_section(section_name, analysis[section_name])
+    # 仍有區塊只能以預設值補上時不寫入快取與歷史庫，下次分析會重新呼叫
+    if not still_broken:
+        if cache is not None:
+            cache.put(cache_key, analysis)
+            if near_duplicates is not None:
+                near_duplicates.add(cache_key, news_text)
+        if history is not None:
+            history.append(cache_key, analysis, news_text=news_text)
+    return analysis, {
+        "cached": False, "stored": cache is not None and not still_broken, "shared": False, "usage": usage,
+        "near_duplicate": None,
+    }
+
+
+def _request_sections(news_text, api_key, analysis, sections, rate_limiter):
+    if rate_limiter is not None:
+        rate_limiter.acquire()
+    started = time.monotonic()
+    try:
+        response = get_http_client().post(
+            DEEPSEEK_API_URL, provider="deepseek", headers=deepseek_headers(api_key),
+            data=json.dumps(build_sections_payload(news_text, sections))
+        )
+    except Exception:
+        # 補救請求失敗時仍返回已取得的區塊
+        return list(sections)
+    if response.status_code != 200:
+        return list(sections)
+    try:
+        result = response_json(response)
+        usage_tracker.record("repair", result.get("usage"), time.monotonic() - started)
+        return merge_sections_result(analysis, sections, result)
+    except AnalysisError:
+        return list(sections)
+
+
+@metrics.timed("summary")
+def request_investment_summary(news_text, analysis, api_key):
+    """產生 200 字以內的投資建議總結；只依賴已解析的分析結果，可在背景執行緒中呼叫"""
+    summary_data = {
+        "model": DEEPSEEK_MODEL,
+        "messages": build_summary_messages(news_text, analysis),
+        "temperature": ANALYSIS_TEMPERATURE,
+        "max_tokens": SUMMARY_MAX_TOKENS
+    }
+    started = time.monotonic()
+    response = get_http_client().post(
+        DEEPSEEK_API_URL, provider="deepseek", headers=deepseek_headers(api_key), data=json.dumps(summary_data)
+    )
+    if response.status_code != 200:
+        raise AnalysisError(f"API 調用失敗: {response.status_code}", raw_response=response.text)
+    result = response_json(response)
+    usage_tracker.record("summary", result.get("usage"), time.monotonic() - started)
+    return message_content(result)
@@ -0,0 +1,61 @@
+"""有並行上限的批次執行"""
+import itertools
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+
+def _timed_call(func, item):
+    started = time.perf_counter()
+    try:
+        return func(item), None, time.perf_counter() - started
+    except Exception as e:
+        return None, e, time.perf_counter() - started
+
+
+def run_bounded(func, items, max_workers=3):
+    """以最多 max_workers 個執行緒並行執行 func(item)
+
+    依完成先後產生 (索引, 結果, 例外, 耗時秒數)；單一項目失敗不影響其他項目。
+    產生器本身在呼叫端執行緒中迭代，因此可以安全地在迴圈內更新畫面。
+    同時最多只提交 max_workers 個項目，每完成一個才提交下一個；
+    中斷（Ctrl-C）或提前關閉產生器時，尚未開始的項目不再執行。
+    """
+    items = enumerate(items)
+    max_workers = max(1, max_workers)
+    executor = ThreadPoolExecutor(max_workers=max_workers)
+    try:
+        pending = {}
+        for index, item in itertools.islice(items, max_workers):
+            pending[executor.submit(_timed_call, func, item)] = index
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                index = pending.pop(future)
+                for next_index, item in itertools.islice(items, 1):
+                    pending[executor.submit(_timed_call, func, item)] = next_index
+                result, error, elapsed = future.result()
+                yield index, result, error, elapsed
+    finally:
+        # 正常結束時所有項目都已完成；中斷時不等待執行中的項目，也不開始排隊中的項目
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+class RateLimiter:
+    """執行緒共用的固定間隔限速器：每分鐘最多放行 rate_per_minute 次"""
+
+    def __init__(self, rate_per_minute):
+        self.interval = 60.0 / rate_per_minute if rate_per_minute > 0 else 0.0
+        self._next_at = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """阻塞直到取得下一個放行時段"""
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            wait = self._next_at - now
+            self._next_at = max(now, self._next_at) + self.interval
+        if wait > 0:
+            time.sleep(wait)
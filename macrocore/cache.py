@@ -0,0 +1,147 @@
+"""以內容雜湊為鍵的持久化分析結果快取"""
+import contextlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from macrocore.text import content_hash, normalize_news_text
+
+DEFAULT_CACHE_PATH = os.path.join(".cache", "analysis_cache.sqlite3")
+
+
+def analysis_cache_key(news_text, prompt_version, model, temperature):
+    """由正規化新聞文本、提示詞版本、模型與溫度計算快取鍵"""
+    return content_hash(
+        normalize_news_text(news_text), prompt_version, model, f"{float(temperature):.3f}"
+    )
+
+
+class AnalysisCache:
+    """SQLite 分析快取，支援容量與存活時間淘汰、命中統計及略過開關"""
+
+    def __init__(self, path=DEFAULT_CACHE_PATH, max_bytes=64 * 1024 * 1024,
+                 max_entries=5000, max_age=7 * 24 * 3600, enabled=True):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.max_age = max_age
+        self.enabled = enabled
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        if self.enabled:
+            directory = os.path.dirname(os.path.abspath(path))
+            os.makedirs(directory, exist_ok=True)
+            with self._connect() as conn:
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS analyses ("
+                    " key TEXT PRIMARY KEY,"
+                    " value TEXT NOT NULL,"
+                    " size INTEGER NOT NULL,"
+                    " created_at REAL NOT NULL,"
+                    " accessed_at REAL NOT NULL,"
+                    " hit_count INTEGER NOT NULL DEFAULT 0)"
+                )
+                conn.execute(
+                    "CREATE INDEX IF NOT EXISTS idx_analyses_accessed ON analyses (accessed_at)"
+                )
+
+    @classmethod
+    def from_env(cls):
+        """依環境變數建立快取實例"""
+        return cls(
+            path=os.getenv("ANALYSIS_CACHE_PATH", DEFAULT_CACHE_PATH),
+            max_bytes=int(float(os.getenv("ANALYSIS_CACHE_MAX_MB", "64")) * 1024 * 1024),
+            max_entries=int(os.getenv("ANALYSIS_CACHE_MAX_ENTRIES", "5000")),
+            max_age=float(os.getenv("ANALYSIS_CACHE_MAX_AGE_HOURS", "168")) * 3600,
+            enabled=os.getenv("ANALYSIS_CACHE_DISABLED", "").lower() not in ("1", "true", "yes"),
+        )
+
+    @contextlib.contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=10)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def get(self, key, record_stats=True):
+        """讀取快取結果，未命中或已過期時返回 None；record_stats=False 時不計入命中統計"""
+        if not self.enabled:
+            return None
+        now = time.time()
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT value FROM analyses WHERE key = ? AND created_at >= ?",
+                (key, now - self.max_age),
+            ).fetchone()
+            if row is not None:
+                conn.execute(
+                    "UPDATE analyses SET accessed_at = ?, hit_count = hit_count + 1 WHERE key = ?",
+                    (now, key),
+                )
+        if record_stats:
+            with self._lock:
+                if row is None:
+                    self.misses += 1
+                else:
+                    self.hits += 1
+        return json.loads(row[0]) if row is not None else None
+
+    def put(self, key, value):
+        """寫入分析結果，並依容量與存活時間淘汰舊資料"""
+        if not self.enabled:
+            return
+        payload = json.dumps(value, ensure_ascii=False)
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO analyses (key, value, size, created_at, accessed_at)"
+                " VALUES (?, ?, ?, ?, ?)",
+                (key, payload, len(payload.encode("utf-8")), now, now),
+            )
+            self._evict(conn, now)
+
+    def _evict(self, conn, now):
+        conn.execute("DELETE FROM analyses WHERE created_at < ?", (now - self.max_age,))
+        count, total = conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM analyses"
+        ).fetchone()
+        if count <= self.max_entries and total <= self.max_bytes:
+            return
+        # 依最近存取時間由舊至新淘汰，直到筆數與容量都回到上限內
+        doomed = []
+        for key, size in conn.execute("SELECT key, size FROM analyses ORDER BY accessed_at"):
+            if count <= self.max_entries and total <= self.max_bytes:
+                break
+            doomed.append((key,))
+            count -= 1
+            total -= size
+        conn.executemany("DELETE FROM analyses WHERE key = ?", doomed)
+
+    def clear(self):
+        """清除所有快取資料"""
+        if not self.enabled:
+            return
+        with self._connect() as conn:
+            conn.execute("DELETE FROM analyses")
+
+    def stats(self):
+        """返回命中統計與目前快取大小"""
+        entries, total = 0, 0
+        if self.enabled:
+            with self._connect() as conn:
+                entries, total = conn.execute(
+                    "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM analyses"
+                ).fetchone()
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "hits": self.hits,
+                "misses": self.misses,
+                "entries": entries,
+                "bytes": total,
+            }
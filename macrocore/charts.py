@@ -0,0 +1,253 @@
+"""分析結果的圖表
+
+單則分析的三張圖表以純 dict 產生 Plotly 圖表規格（{"data", "layout"}），不需要載入 plotly；
+規格依分析內容雜湊快取，同一份分析重新渲染時直接沿用，頁面、HTML 報告與 ASGI 服務的
+market_impact.charts 都使用同一份規格。投資策略時間軸每個期間只用一條以 None 分段的線，
+不再為每條策略各建一條 trace。跨新聞統計圖表仍以 plotly 繪製，plotly 只在實際繪圖時才載入。
+"""
+import json
+import threading
+from collections import OrderedDict
+
+from macrocore.metrics import metrics
+from macrocore.scoring import score_impacts
+from macrocore.text import content_hash
+
+# 修改圖表規格時請同步更新版本號，讓快取的舊規格失效
+CHART_SPEC_VERSION = "1"
+
+
+def radar_spec(analysis):
+    """市場影響雷達圖"""
+    # 準備雷達圖數據：各面向的影響描述一次評分
+    macro = analysis["market_impact"]["macro_economy"]
+    markets = analysis["market_impact"]["financial_markets"]
+    indices = markets["stock_market"]["indices"]
+    impacts = {
+        "GDP影響": macro["gdp"]["impact"],
+        "通膨影響": macro["inflation"]["impact"],
+        "就業影響": macro["employment"]["impact"],
+        "消費影響": macro["consumption"]["impact"],
+        "股市影響": indices[0]["impact"] if indices else "",
+        "債市影響": markets["bond_market"]["government"]["impact"]
+    }
+    values = score_impacts(list(impacts.values()))["magnitude"].tolist()
+    return {
+        "data": [{
+            "type": "scatterpolar",
+            "r": values,
+            "theta": list(impacts),
+            "fill": "toself",
+            "name": "市場影響程度",
+            "line": {"color": "rgb(0, 0, 0)"},
+            "fillcolor": "rgba(169, 169, 169, 0.3)",
+        }],
+        "layout": {
+            "polar": {
+                "radialaxis": {
+                    "visible": True,
+                    "range": [0, 1],
+                    "tickvals": [0, 0.25, 0.5, 0.75, 1],
+                    "ticktext": ["極小", "較小", "中等", "較大", "極大"],
+                }
+            },
+            "showlegend": False,
+            "title": {"text": "各面向影響程度分析", "x": 0.5},
+        },
+    }
+
+
+def industry_spec(analysis):
+    """產業影響對比圖"""
+    benefited = [industry["industry"] for industry in analysis["industry_impact"]["benefited"]]
+    damaged = [industry["industry"] for industry in analysis["industry_impact"]["damaged"]]
+
+    def bars(name, industries, value, color, label):
+        return {
+            "type": "bar",
+            "name": name,
+            "y": industries,
+            "x": [value] * len(industries),
+            "orientation": "h",
+            "marker": {"color": color},
+            "text": [label] * len(industries),
+            "textposition": "auto",
+        }
+
+    return {
+        "data": [
+            bars("受惠產業", benefited, 0.8, "rgb(144, 238, 144)", "正面影響"),
+            bars("受損產業", damaged, -0.8, "rgb(255, 182, 193)", "負面影響"),
+        ],
+        "layout": {
+            "title": {"text": "產業影響對比分析", "x": 0.5},
+            "barmode": "relative",
+            "yaxis": {"title": {"text": "產業"}},
+            "xaxis": {
+                "title": {"text": "影響程度"},
+                "tickvals": [-0.8, 0, 0.8],
+                "ticktext": ["負面", "中性", "正面"],
+                "range": [-1, 1],
+            },
+            "showlegend": True,
+        },
+    }
+
+
+def timeline_spec(analysis):
+    """投資建議時間軸；每個期間一條 trace，各策略以 None 斷開成獨立線段"""
+    periods = [
+        ("短期策略", analysis["investment_advice"]["short_term"]["position"], 0, "rgb(169, 169, 169)"),
+        ("中長期策略", analysis["investment_advice"]["long_term"]["asset_allocation"], 1, "rgb(0, 0, 0)"),
+    ]
+    data = []
+    for period, strategies, y_position, color in periods:
+        x, y, text = [], [], []
+        for j, strategy in enumerate(strategies):
+            x += [j, j + 0.8, None]
+            y += [y_position, y_position, None]
+            text += [strategy, "", ""]
+        data.append({
+            "type": "scatter",
+            "x": x,
+            "y": y,
+            "mode": "lines+text",
+            "name": period,
+            "text": text,
+            "textposition": "middle right",
+            "line": {"color": color, "width": 2},
+        })
+    return {
+        "data": data,
+        "layout": {
+            "title": {"text": "投資策略時間軸", "x": 0.5},
+            "yaxis": {"ticktext": ["短期", "中長期"], "tickvals": [0, 1], "zeroline": False},
+            "xaxis": {"showticklabels": False, "zeroline": False},
+            "showlegend": True,
+            "height": 400,
+        },
+    }
+
+
+CHART_SPEC_BUILDERS = {
+    "radar": radar_spec,
+    "industries": industry_spec,
+    "timeline": timeline_spec,
+}
+
+
+def analysis_hash(analysis):
+    """分析結果內容的雜湊（含圖表規格版本），作為圖表快取鍵"""
+    return content_hash(json.dumps(analysis, sort_keys=True, ensure_ascii=False), CHART_SPEC_VERSION)
+
+
+class ChartSpecCache:
+    """以分析內容雜湊為鍵的圖表規格 LRU 快取；執行緒安全
+
+    返回的規格為共用物件，呼叫端不可修改。
+    """
+
+    def __init__(self, max_entries=256):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def specs(self, analysis):
+        """返回 {圖表名稱: 規格 dict}"""
+        key = analysis_hash(analysis)
+        with self._lock:
+            specs = self._entries.get(key)
+            if specs is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return specs
+            self.misses += 1
+        specs = {name: builder(analysis) for name, builder in CHART_SPEC_BUILDERS.items()}
+        with self._lock:
+            self._entries[key] = specs
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return specs
+
+
+# 程序內共用的圖表規格快取
+chart_spec_cache = ChartSpecCache()
+
+
+@metrics.timed("charts")
+def build_chart_specs(analysis):
+    """產生可直接交給前端 Plotly.newPlot 的圖表規格 {名稱: {"data": ..., "layout": ...}}"""
+    return chart_spec_cache.specs(analysis)
+
+
+def build_impact_heatmap_figure(daily):
+    """跨新聞的每日影響熱度圖；daily 為 DailyImpactAggregate.daily 的結果"""
+    import plotly.graph_objects as go
+
+    # 懸停時顯示離散程度與分析則數
+    hover = [
+        [f"平均 {m:+.2f}<br>標準差 {s:.2f}<br>{n} 則" if n else "無資料" for m, s, n in zip(mean_row, std_row, count_row)]
+        for mean_row, std_row, count_row in zip(daily["mean"].T, daily["std"].T, daily["count"].T)
+    ]
+    fig = go.Figure(go.Heatmap(
+        z=daily["mean"].T,
+        x=daily["days"],
+        y=daily["dimensions"],
+        text=hover,
+        hoverinfo="text",
+        zmin=-1,
+        zmax=1,
+        colorscale=[[0, 'rgb(255, 182, 193)'], [0.5, 'rgb(245, 245, 245)'], [1, 'rgb(144, 238, 144)']],
+        colorbar=dict(tickvals=[-1, 0, 1], ticktext=['負面', '中性', '正面'])
+    ))
+    fig.update_layout(
+        title="每日市場影響熱度圖",
+        title_x=0.5,
+        xaxis=dict(type='category'),
+        height=400
+    )
+    return fig
+
+
+def build_aggregate_radar_figure(window):
+    """期間內所有新聞的綜合影響雷達圖；以平均加減一個標準差的範圍表示看法分歧程度"""
+    import plotly.graph_objects as go
+
+    categories = [f"{label}（{n}）" for label, n in zip(window["dimensions"], window["count"])]
+    mean = window["mean"].tolist()
+    fig = go.Figure()
+    fig.add_trace(go.Scatterpolar(
+        r=(window["mean"] + window["std"]).tolist(),
+        theta=categories,
+        name='平均 + 標準差',
+        line=dict(color='rgb(169, 169, 169)', dash='dot')
+    ))
+    fig.add_trace(go.Scatterpolar(
+        r=(window["mean"] - window["std"]).tolist(),
+        theta=categories,
+        name='平均 - 標準差',
+        line=dict(color='rgb(169, 169, 169)', dash='dot')
+    ))
+    fig.add_trace(go.Scatterpolar(
+        r=mean,
+        theta=categories,
+        fill='toself',
+        name='平均影響',
+        line_color='rgb(0, 0, 0)',
+        fillcolor='rgba(169, 169, 169, 0.3)'
+    ))
+    fig.update_layout(
+        polar=dict(
+            radialaxis=dict(
+                visible=True,
+                range=[-1, 1],
+                tickvals=[-1, -0.5, 0, 0.5, 1],
+                ticktext=['負面', '偏負', '中性', '偏正', '正面']
+            )
+        ),
+        title="綜合影響雷達圖",
+        title_x=0.5
+    )
+    return fig
@@ -0,0 +1,303 @@
+"""無介面命令列工具
+
+批次分析：從 JSONL 檔案或標準輸入讀取新聞，並行分析後每行輸出一筆 JSON 結果。
+
+    python -m macrocore analyze --input news.jsonl --output analyses.jsonl --workers 4 --rate 30
+
+背景新聞擷取：依每日額度定期呼叫 GNews，新文章寫入頁面讀取的本地文章庫。
+
+    python -m macrocore ingest --daily-quota 100
+
+分析歷史查詢：輸出產業的逐日情緒與滾動平均（CSV），或合併歷史庫的小檔。
+
+    python -m macrocore history 半導體 --window 30 --days 90
+
+相似事件查詢：從語意索引找出與輸入新聞最相似的歷史分析，每行輸出一筆 JSON。
+
+    python -m macrocore similar --input news.txt -k 5
+
+批次匯出報告：將歷史庫中一段期間的分析逐則產生報告並串流寫入 ZIP。
+
+    python -m macrocore export --format html --days 30 --output reports.zip
+
+每行輸入可為 {"id", "title", "content", "category"}，或直接提供 {"id", "text"}。
+輸出檔已存在時會略過其中 status 為 ok 的 id，可在中斷後直接重新執行以續跑。
+"""
+import argparse
+import contextlib
+import json
+import os
+import sys
+from datetime import datetime, timedelta, timezone
+
+from dotenv import load_dotenv
+
+from macrocore.analysis import AnalysisError, format_news_text, request_analysis
+from macrocore.batch import RateLimiter, run_bounded
+from macrocore.cache import AnalysisCache
+from macrocore.dedup import NearDuplicateIndex
+from macrocore.history import SECTOR_DIMENSIONS, AnalysisHistory
+from macrocore.ingest import (
+    DEFAULT_DAILY_QUOTA,
+    DEFAULT_INGEST_PAGES,
+    DEFAULT_RESERVE_RATIO,
+    configured_queries,
+    poll_interval,
+    run_ingestion,
+)
+from macrocore.metrics import configure_logging
+from macrocore.news import ArticleStore, GNewsError
+from macrocore.report import REPORT_FORMATS, write_reports_zip
+from macrocore.singleflight import SingleFlight
+from macrocore.tolerant_json import parse_stats
+from macrocore.text import content_hash
+
+
+def _news_text(item):
+    if item.get("text"):
+        return item["text"]
+    return format_news_text({
+        "title": item.get("title", "無標題"),
+        "category": item.get("category", "綜合"),
+        "content": item.get("content", ""),
+    })
+
+
+def _item_id(item, text):
+    item_id = item.get("id") or item.get("url")
+    return str(item_id) if item_id else content_hash(text)[:16]
+
+
+def _read_items(stream):
+    items = []
+    for line_no, line in enumerate(stream, 1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            item = json.loads(line)
+        except ValueError as e:
+            print(f"略過第 {line_no} 行：JSON 格式錯誤 ({e})", file=sys.stderr)
+            continue
+        text = _news_text(item)
+        items.append({"id": _item_id(item, text), "text": text})
+    return items
+
+
+def _completed_ids(path):
+    """讀取既有輸出檔中已成功完成的 id，供續跑時略過"""
+    done = set()
+    if not path or path == "-" or not os.path.exists(path):
+        return done
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue  # 中斷時可能留下不完整的最後一行
+            if record.get("status") == "ok":
+                done.add(record.get("id"))
+    return done
+
+
+def run_analyze(args):
+    api_key = os.getenv("DeepSeek_API")
+    if not api_key:
+        print("未找到 DeepSeek API Key，請在 .env 或環境變數中設置 DeepSeek_API", file=sys.stderr)
+        return 2
+
+    if args.input == "-":
+        items = _read_items(sys.stdin)
+    else:
+        with open(args.input, encoding="utf-8") as f:
+            items = _read_items(f)
+
+    done = _completed_ids(args.output)
+    seen = set()
+    pending = []
+    for item in items:
+        if item["id"] in done or item["id"] in seen:
+            continue
+        seen.add(item["id"])
+        pending.append(item)
+    print(f"共 {len(items)} 則新聞，略過已完成 {len(items) - len(pending)} 則，待分析 {len(pending)} 則",
+          file=sys.stderr)
+
+    cache = None if args.no_cache else AnalysisCache.from_env()
+    # 轉載同一則稿件的近似重複新聞沿用已有的分析
+    near_duplicates = None if args.no_cache else NearDuplicateIndex.from_env()
+    rate_limiter = RateLimiter(args.rate) if args.rate else None
+    # 與網頁或其他批次程序同時分析同一則新聞時共用結果
+    singleflight = SingleFlight.from_env()
+    history = AnalysisHistory.from_env()
+
+    def analyze_item(item):
+        return request_analysis(
+            item["text"], api_key, cache=cache, rate_limiter=rate_limiter,
+            singleflight=singleflight, near_duplicates=near_duplicates, history=history
+        )
+
+    out = sys.stdout if args.output == "-" else open(args.output, "a", encoding="utf-8")
+    failures = 0
+    try:
+        # 中斷時立即關閉產生器，排隊中的項目不再呼叫 API
+        with contextlib.closing(run_bounded(analyze_item, pending, args.workers)) as results:
+            for finished, (index, result, error, elapsed) in enumerate(results, 1):
+                item = pending[index]
+                record = {
+                    "id": item["id"],
+                    "status": "ok" if error is None else "error",
+                    "analyzed_at": datetime.now().isoformat(timespec="seconds"),
+                    "elapsed_seconds": round(elapsed, 3),
+                }
+                if error is None:
+                    analysis, info = result
+                    record.update(cached=info["cached"], near_duplicate=info["near_duplicate"],
+                                  usage=info["usage"], analysis=analysis)
+                else:
+                    failures += 1
+                    record["error"] = str(error)
+                    if isinstance(error, AnalysisError) and error.raw_response:
+                        record["raw_response"] = error.raw_response
+                # 每筆立即寫出並 flush，程式中斷時已完成的結果不會遺失
+                out.write(json.dumps(record, ensure_ascii=False) + "\n")
+                out.flush()
+                print(f"[{finished}/{len(pending)}] {item['id']} {record['status']} {elapsed:.1f}s", file=sys.stderr)
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    stats = parse_stats.snapshot()
+    if stats["total"]:
+        print(f"解析結果：直接成功 {stats['clean']}、容錯修復 {stats['repaired']}、"
+              f"補請求區塊 {stats['sections_requested']}、失敗 {stats['failed']}", file=sys.stderr)
+    return 1 if failures else 0
+
+
+def run_ingest(args):
+    api_key = os.getenv("GNEWS_API_KEY")
+    if not api_key or api_key == "YOUR_GNEWS_API_KEY":
+        print("未找到 GNews API Key，請在 .env 或環境變數中設置 GNEWS_API_KEY", file=sys.stderr)
+        return 2
+
+    queries = args.query or configured_queries()
+    interval = args.interval or poll_interval(len(queries), args.daily_quota, args.reserve, args.max_pages)
+    print(f"擷取 {len(queries)} 個查詢，每 {interval:.0f} 秒一輪", file=sys.stderr)
+    try:
+        failures = run_ingestion(
+            ArticleStore.from_env(), api_key, queries, interval, max_results=args.max, once=args.once,
+            max_pages=args.max_pages,
+        )
+    except GNewsError as e:
+        print(f"{e}：API Key 無效或已被停用", file=sys.stderr)
+        return 2
+    except KeyboardInterrupt:
+        return 0
+    return 1 if failures else 0
+
+
+def run_history(args):
+    history = AnalysisHistory.from_env()
+    if args.compact:
+        print(f"已合併 {history.compact()} 個檔案", file=sys.stderr)
+    if args.rebuild_aggregate:
+        print(f"已重建 {history.rebuild_aggregate()} 筆每日統計", file=sys.stderr)
+    if args.rebuild_semantic_index:
+        print(f"已重建 {history.rebuild_semantic_index()} 筆新聞向量", file=sys.stderr)
+    if (args.compact or args.rebuild_aggregate or args.rebuild_semantic_index) and not args.entity:
+        return 0
+    if not args.entity:
+        print("請指定要查詢的產業或對象名稱", file=sys.stderr)
+        return 2
+    trend = history.rolling_sentiment(
+        args.entity, args.window, periods=args.days, dimensions=args.dimension or SECTOR_DIMENSIONS
+    )
+    trend.to_csv(sys.stdout, index_label="date", float_format="%.4f")
+    return 0
+
+
+def run_similar(args):
+    history = AnalysisHistory.from_env()
+    if history.semantic is None:
+        print("分析歷史庫已停用，沒有可查詢的語意索引", file=sys.stderr)
+        return 2
+    if args.input == "-":
+        news_text = sys.stdin.read()
+    else:
+        with open(args.input, encoding="utf-8") as f:
+            news_text = f.read()
+    for item in history.semantic.search(news_text, args.k, min_similarity=args.min_similarity):
+        item["analyzed_at"] = item["analyzed_at"].isoformat(timespec="seconds")
+        print(json.dumps(item, ensure_ascii=False))
+    return 0
+
+
+def run_export(args):
+    history = AnalysisHistory.from_env()
+    end = datetime.now(timezone.utc).date()
+    documents = history.iter_documents(end - timedelta(days=args.days - 1), end)
+    if args.output == "-":
+        written = write_reports_zip(documents, sys.stdout.buffer, args.format)
+    else:
+        with open(args.output, "wb") as f:
+            written = write_reports_zip(documents, f, args.format)
+    print(f"已匯出 {written} 位元組", file=sys.stderr)
+    return 0
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="python -m macrocore", description="MacroInsight 無介面工具")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    analyze = subparsers.add_parser("analyze", help="批次分析 JSONL 新聞")
+    analyze.add_argument("--input", "-i", default="-", help="輸入 JSONL 檔案，- 代表標準輸入（預設）")
+    analyze.add_argument("--output", "-o", default="-", help="輸出 JSONL 檔案，- 代表標準輸出（預設）；已存在時續跑")
+    analyze.add_argument("--workers", "-w", type=int, default=4, help="並行分析數（預設 4）")
+    analyze.add_argument("--rate", type=float, default=30, help="每分鐘最多呼叫 DeepSeek 次數，0 為不限（預設 30）")
+    analyze.add_argument("--no-cache", action="store_true", help="不讀寫分析快取")
+    analyze.set_defaults(func=run_analyze)
+
+    ingest = subparsers.add_parser("ingest", help="背景擷取 GNews 新聞至本地文章庫")
+    ingest.add_argument("--query", "-q", action="append", help="查詢字串，可重複指定（預設讀取 NEWS_QUERIES）")
+    ingest.add_argument("--daily-quota", type=int, default=int(os.getenv("GNEWS_DAILY_QUOTA", DEFAULT_DAILY_QUOTA)),
+                        help=f"GNews 每日請求額度（預設 {DEFAULT_DAILY_QUOTA}）")
+    ingest.add_argument("--reserve", type=float, default=DEFAULT_RESERVE_RATIO,
+                        help=f"保留給頁面手動刷新的額度比例（預設 {DEFAULT_RESERVE_RATIO}）")
+    ingest.add_argument("--interval", type=float, help="固定輪詢間隔秒數，未指定時依每日額度推算")
+    ingest.add_argument("--max", type=int, default=10, help="每次查詢最多取得的文章數（預設 10）")
+    ingest.add_argument("--max-pages", type=int, default=DEFAULT_INGEST_PAGES,
+                        help=f"每個查詢每輪最多往前翻的頁數，輪詢間隔依此推算（預設 {DEFAULT_INGEST_PAGES}）")
+    ingest.add_argument("--once", action="store_true", help="只擷取一輪後結束，可搭配 cron 使用")
+    ingest.set_defaults(func=run_ingest)
+
+    history = subparsers.add_parser("history", help="查詢分析歷史庫中產業的情緒走勢")
+    history.add_argument("entity", nargs="?", help="產業或對象名稱（子字串比對）")
+    history.add_argument("--window", type=int, default=30, help="滾動平均天數（預設 30）")
+    history.add_argument("--days", type=int, default=90, help="輸出最近幾天（預設 90）")
+    history.add_argument("--dimension", action="append",
+                         help=f"限定面向，可重複指定（預設 {'、'.join(SECTOR_DIMENSIONS)}）")
+    history.add_argument("--compact", action="store_true", help="先合併歷史庫各分區的小檔")
+    history.add_argument("--rebuild-aggregate", action="store_true", help="由歷史庫重新計算每日市場影響統計")
+    history.add_argument("--rebuild-semantic-index", action="store_true",
+                         help="由歷史庫重新計算相似事件查詢使用的新聞向量（更換向量模型後使用）")
+    history.set_defaults(func=run_history)
+
+    similar = subparsers.add_parser("similar", help="查詢與新聞最相似的歷史分析")
+    similar.add_argument("--input", "-i", default="-", help="新聞文本檔案，- 代表標準輸入（預設）")
+    similar.add_argument("-k", type=int, default=5, help="返回的則數（預設 5）")
+    similar.add_argument("--min-similarity", type=float, default=0.0, help="最低相似度（0~1，預設 0）")
+    similar.set_defaults(func=run_similar)
+
+    export = subparsers.add_parser("export", help="將歷史庫中的分析批次匯出為報告 ZIP")
+    export.add_argument("--format", "-f", choices=sorted(REPORT_FORMATS), default="markdown",
+                        help="報告格式（預設 markdown）")
+    export.add_argument("--days", type=int, default=7, help="匯出最近幾天的分析（預設 7）")
+    export.add_argument("--output", "-o", default="-", help="輸出 ZIP 檔案，- 代表標準輸出（預設）")
+    export.set_defaults(func=run_export)
+    return parser
+
+
+def main(argv=None):
+    load_dotenv()
+    configure_logging()
+    args = build_parser().parse_args(argv)
+    return args.func(args)
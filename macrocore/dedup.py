@@ -0,0 +1,208 @@
+"""近似重複新聞偵測（SimHash + LSH 分段）
+
+GNews 常把同一則通訊社稿件以不同媒體、些微改寫的版本重複返回，內容雜湊無法辨識。
+這裡以正規化後的字元 2-gram（中文詞彙多為兩字，比 3-gram 更能容忍改寫）計算 64 位元 SimHash，海明距離在門檻內即視為同一事件；
+指紋切成 (最大距離 + 1) 段做 LSH 分桶，依鴿籠原理，距離在門檻內的兩則必定至少有一段完全相同，
+查詢時只需比對同桶候選而不必掃描全部指紋。門檻越高分段越少、每段越長，候選也越少。
+"""
+import contextlib
+import hashlib
+import os
+import re
+import sqlite3
+import time
+from collections import Counter
+
+from macrocore.text import normalize_news_text
+
+FINGERPRINT_BITS = 64
+DEFAULT_INDEX_PATH = os.path.join(".cache", "near_duplicates.sqlite3")
+# format_news_text 的「新聞類別」其實是來源媒體名稱，轉載版本必定不同，整行排除
+_SOURCE_LINE_RE = re.compile(r"\*\*新聞類別[:：]\*\*[^\n]*")
+# 其餘粗體欄位標籤（**新聞標題：** 等）對每則新聞都相同，計算指紋前先移除
+_LABEL_RE = re.compile(r"\*\*[^*]{1,20}[:：]\*\*")
+_NON_WORD_RE = re.compile(r"[\W_]+")
+_MASK = (1 << FINGERPRINT_BITS) - 1
+
+
+def _signed(value):
+    # SQLite INTEGER 為有號 64 位元，超過範圍的值轉成對應的負數保存
+    return value - (1 << FINGERPRINT_BITS) if value >> (FINGERPRINT_BITS - 1) else value
+
+
+def clean_news_text(text):
+    """移除來源媒體行與欄位標籤後正規化，只保留文字與數字，供指紋與語意向量使用"""
+    return _NON_WORD_RE.sub("", normalize_news_text(_LABEL_RE.sub(" ", _SOURCE_LINE_RE.sub(" ", text or ""))))
+
+
+def _features(text, size=2):
+    text = clean_news_text(text)
+    if len(text) <= size:
+        return Counter([text]) if text else Counter()
+    return Counter(text[i:i + size] for i in range(len(text) - size + 1))
+
+
+def simhash(text):
+    """計算新聞文本的 64 位元 SimHash 指紋；空文本返回 0"""
+    weights = [0] * FINGERPRINT_BITS
+    for feature, count in _features(text).items():
+        h = int.from_bytes(hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest(), "big")
+        for bit in range(FINGERPRINT_BITS):
+            if h >> bit & 1:
+                weights[bit] += count
+            else:
+                weights[bit] -= count
+    fingerprint = 0
+    for bit, weight in enumerate(weights):
+        if weight > 0:
+            fingerprint |= 1 << bit
+    return fingerprint
+
+
+def hamming_distance(a, b):
+    return bin((a ^ b) & _MASK).count("1")
+
+
+def max_distance_for(threshold):
+    """相似度門檻（0~1）換算為允許的最大海明距離"""
+    return max(0, int(round((1.0 - threshold) * FINGERPRINT_BITS, 6)))
+
+
+def band_values(fingerprint, bands):
+    """將指紋切成 bands 段，返回 [(段序號, 段值)]；最後一段包含除不盡的位元"""
+    width = FINGERPRINT_BITS // bands
+    values = []
+    for i in range(bands):
+        bits = width if i < bands - 1 else FINGERPRINT_BITS - width * (bands - 1)
+        values.append((i, fingerprint >> (i * width) & ((1 << bits) - 1)))
+    return values
+
+
+def group_near_duplicates(texts, threshold=0.85):
+    """將文本依近似重複分群，返回索引清單的清單；每群依原順序排列，第一則作為代表"""
+    max_distance = max_distance_for(threshold)
+    bands = max_distance + 1
+    fingerprints = [simhash(text) for text in texts]
+    parent = list(range(len(texts)))
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    buckets = {}
+    for index, fingerprint in enumerate(fingerprints):
+        for bucket in band_values(fingerprint, bands):
+            for other in buckets.setdefault(bucket, []):
+                if hamming_distance(fingerprint, fingerprints[other]) <= max_distance:
+                    root, other_root = find(index), find(other)
+                    if root != other_root:
+                        parent[max(root, other_root)] = min(root, other_root)
+            buckets[bucket].append(index)
+
+    groups = {}
+    for index in range(len(texts)):
+        groups.setdefault(find(index), []).append(index)
+    return sorted(groups.values())
+
+
+class NearDuplicateIndex:
+    """持久化的 SimHash 索引：記錄已分析新聞的指紋與對應的分析快取鍵"""
+
+    def __init__(self, path=DEFAULT_INDEX_PATH, threshold=0.85, max_entries=20000):
+        self.path = path
+        self.threshold = threshold
+        self.max_distance = max_distance_for(threshold)
+        self.bands = self.max_distance + 1
+        self.max_entries = max_entries
+        # 門檻 1 以上代表只接受完全相同，交給內容雜湊快取即可
+        self.enabled = threshold < 1.0
+        self.matches = 0
+        if self.enabled:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            with self._connect() as conn:
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS fingerprints ("
+                    " key TEXT PRIMARY KEY,"
+                    " fingerprint INTEGER NOT NULL,"
+                    " created_at REAL NOT NULL)"
+                )
+                # 分段欄位以「段數:段序號」區分，調整門檻後舊分段自然不會被查到
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS fingerprint_bands ("
+                    " band TEXT NOT NULL,"
+                    " value INTEGER NOT NULL,"
+                    " key TEXT NOT NULL,"
+                    " PRIMARY KEY (band, value, key))"
+                )
+
+    @classmethod
+    def from_env(cls):
+        """依環境變數建立索引；NEAR_DUPLICATE_THRESHOLD 設為 1 時停用"""
+        return cls(
+            path=os.getenv("NEAR_DUPLICATE_INDEX_PATH", DEFAULT_INDEX_PATH),
+            threshold=float(os.getenv("NEAR_DUPLICATE_THRESHOLD", "0.85")),
+        )
+
+    @contextlib.contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=10)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def _bands(self, fingerprint):
+        return [(f"{self.bands}:{i}", _signed(value)) for i, value in band_values(fingerprint, self.bands)]
+
+    def find(self, news_text):
+        """返回最相似且在門檻內的已分析新聞快取鍵與相似度 (key, similarity)，找不到時返回 None"""
+        if not self.enabled:
+            return None
+        fingerprint = simhash(news_text)
+        bands = self._bands(fingerprint)
+        where = " OR ".join(["(band = ? AND value = ?)"] * len(bands))
+        params = [item for pair in bands for item in pair]
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT key, fingerprint FROM fingerprints WHERE key IN"
+                f" (SELECT key FROM fingerprint_bands WHERE {where})",
+                params,
+            ).fetchall()
+        best = None
+        for key, candidate in rows:
+            distance = hamming_distance(fingerprint, candidate)
+            if distance <= self.max_distance and (best is None or distance < best[1]):
+                best = (key, distance)
+        if best is None:
+            return None
+        self.matches += 1
+        return best[0], 1.0 - best[1] / FINGERPRINT_BITS
+
+    def add(self, key, news_text):
+        """記錄一則已分析新聞的指紋"""
+        if not self.enabled:
+            return
+        fingerprint = simhash(news_text)
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO fingerprints (key, fingerprint, created_at) VALUES (?, ?, ?)",
+                (key, _signed(fingerprint), time.time()),
+            )
+            conn.executemany(
+                "INSERT OR IGNORE INTO fingerprint_bands (band, value, key) VALUES (?, ?, ?)",
+                [(band, value, key) for band, value in self._bands(fingerprint)],
+            )
+            self._evict(conn)
+
+    def _evict(self, conn):
+        (count,) = conn.execute("SELECT COUNT(*) FROM fingerprints").fetchone()
+        if count <= self.max_entries:
+            return
+        doomed = conn.execute(
+            "SELECT key FROM fingerprints ORDER BY created_at LIMIT ?", (count - self.max_entries,)
+        ).fetchall()
+        conn.executemany("DELETE FROM fingerprints WHERE key = ?", doomed)
+        conn.executemany("DELETE FROM fingerprint_bands WHERE key = ?", doomed)
@@ -0,0 +1,36 @@
+"""DeepSeek Chat Completions API 的請求與串流讀取"""
+import json
+import os
+
+# 可改指向相容的代理或基準測試的本地模擬服務
+DEEPSEEK_API_URL = os.getenv("DEEPSEEK_API_URL", "https://api.deepseek.com/v1/chat/completions")
+
+
+def deepseek_headers(api_key):
+    """組合 DeepSeek API 請求標頭"""
+    return {
+        "Content-Type": "application/json",
+        "Authorization": f"Bearer {api_key}"
+    }
+
+
+def iter_stream_content(response, usage=None):
+    """逐行讀取 SSE 串流回應，依序產生模型輸出的文字片段
+
+    若傳入 usage 字典，最後一個區塊附帶的 token 用量會寫入其中。
+    """
+    for raw_line in response.iter_lines():
+        # SSE 回應通常不帶 charset，須自行以 UTF-8 解碼以免中文亂碼
+        line = raw_line.decode("utf-8") if isinstance(raw_line, bytes) else raw_line
+        if not line.startswith("data:"):
+            continue  # 空行或 ": keep-alive" 註解
+        payload = line[len("data:"):].strip()
+        if payload == "[DONE]":
+            break
+        chunk = json.loads(payload)
+        if usage is not None and chunk.get("usage"):
+            usage.update(chunk["usage"])
+        for choice in chunk.get("choices") or []:
+            content = (choice.get("delta") or {}).get("content")
+            if content:
+                yield content
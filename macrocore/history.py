@@ -0,0 +1,395 @@
+"""分析結果的欄式歷史庫（Parquet）
+
+每則分析展開成長表格：一列代表一個「面向 × 對象」的影響（GDP、某個指數、某個產業、某個貨幣對……），
+欄位型別固定，並以 score_impacts 附上程度、方向與帶正負號的分數，時間序列與分組查詢不必再解析 JSON。
+資料依分析時間的月份分區（month=YYYY-MM），每次寫入一個小檔；分區內小檔過多時合併成單一檔案，
+查詢時依月份剪枝並只讀取需要的欄位，一年份的歷史也能在百毫秒內完成「半導體近 30 日情緒」這類查詢。
+每次寫入同時更新 DailyImpactAggregate 的每日統計，供跨新聞的熱度圖與雷達圖直接讀取，
+並將新聞向量寫入 SemanticIndex，供查詢相似的歷史事件。
+完整的分析結果與新聞原文另存於 documents 子目錄（同樣依月份分區），供匯出報告時逐批讀取；
+投資建議總結在分析寫入後才於背景產生，完成時另存於 SQLite，讀取時再合併回分析結果。
+pyarrow / pandas 只在實際讀寫時才載入。
+"""
+import contextlib
+import os
+import sqlite3
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+
+from macrocore.aggregate import SOURCE_DIMENSIONS, DailyImpactAggregate, dimension_scores
+from macrocore.scoring import score_impacts
+from macrocore.semantic import DEFAULT_ANN_THRESHOLD, DEFAULT_MAX_ENTRIES, SemanticIndex, load_embedder
+from macrocore.singleflight import KeyFileLock
+
+DEFAULT_HISTORY_PATH = os.path.join(".cache", "history")
+# 分區內小檔超過此數量時於寫入後合併
+DEFAULT_COMPACT_THRESHOLD = 32
+# 產業情緒查詢預設涵蓋的面向
+SECTOR_DIMENSIONS = ("sector", "industry_benefited", "industry_damaged")
+MACRO_DIMENSIONS = ("gdp", "inflation", "employment", "consumption")
+# 受惠/受損產業沒有影響描述，以固定的方向詞評分
+_INDUSTRY_IMPACT = {"benefited": "受惠", "damaged": "受損"}
+
+
+def _schema(dataset="impacts"):
+    import pyarrow as pa
+
+    if dataset == "documents":
+        return pa.schema([
+            ("analyzed_at", pa.timestamp("ms", tz="UTC")),
+            ("article_id", pa.string()),
+            ("news_text", pa.string()),
+            ("analysis", pa.string()),
+        ])
+    return pa.schema([
+        ("analyzed_at", pa.timestamp("ms", tz="UTC")),
+        ("date", pa.date32()),
+        ("article_id", pa.string()),
+        ("dimension", pa.string()),
+        ("entity", pa.string()),
+        ("impact", pa.string()),
+        ("magnitude", pa.float32()),
+        ("direction", pa.int8()),
+        ("signed", pa.float32()),
+        ("matched", pa.bool_()),
+    ])
+
+
+def flatten_analysis(analysis):
+    """將分析結果展開為 [(面向, 對象, 影響描述)]；總經面向的對象為空字串"""
+    rows = []
+    macro = analysis["market_impact"]["macro_economy"]
+    for dimension in MACRO_DIMENSIONS:
+        rows.append((dimension, "", macro[dimension]["impact"]))
+    markets = analysis["market_impact"]["financial_markets"]
+    stock = markets["stock_market"]
+    rows.extend(("index", item["name"], item["impact"]) for item in stock["indices"])
+    rows.extend(("sector", item["name"], item["impact"]) for item in stock["sectors"])
+    rows.append(("bond_government", "", markets["bond_market"]["government"]["impact"]))
+    rows.append(("bond_corporate", "", markets["bond_market"]["corporate"]["impact"]))
+    rows.extend(("forex", item["pair"], item["impact"]) for item in markets["forex_market"])
+    rows.extend(("commodity", item["name"], item["impact"]) for item in markets["commodities"])
+    for side, impact in _INDUSTRY_IMPACT.items():
+        rows.extend(
+            (f"industry_{side}", item["industry"], impact) for item in analysis["industry_impact"][side]
+        )
+    return rows
+
+
+def _month(value):
+    return value.strftime("%Y-%m")
+
+
+class AnalysisHistory:
+    """依月份分區的 Parquet 歷史庫；多個程序可同時寫入（每次寫入獨立檔案）"""
+
+    def __init__(self, path=DEFAULT_HISTORY_PATH, compact_threshold=DEFAULT_COMPACT_THRESHOLD, enabled=True,
+                 embedder=None, semantic_max_entries=DEFAULT_MAX_ENTRIES, ann_threshold=DEFAULT_ANN_THRESHOLD):
+        self.path = path
+        self.compact_threshold = compact_threshold
+        self.enabled = enabled
+        self.aggregate = None
+        self.semantic = None
+        self.summaries_path = None
+        if self.enabled:
+            os.makedirs(path, exist_ok=True)
+            self.summaries_path = os.path.join(path, "summaries.sqlite3")
+            with self._summaries() as conn:
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS summaries (article_id TEXT PRIMARY KEY, summary TEXT NOT NULL)"
+                )
+            self.aggregate = DailyImpactAggregate(os.path.join(path, "daily_impact.sqlite3"))
+            self.semantic = SemanticIndex(
+                os.path.join(path, "semantic.sqlite3"), embedder, semantic_max_entries, ann_threshold
+            )
+
+    @classmethod
+    def from_env(cls):
+        """依環境變數建立歷史庫；ANALYSIS_HISTORY_DISABLED 設為 1 時不記錄"""
+        return cls(
+            path=os.getenv("ANALYSIS_HISTORY_PATH", DEFAULT_HISTORY_PATH),
+            compact_threshold=int(os.getenv("ANALYSIS_HISTORY_COMPACT_THRESHOLD", DEFAULT_COMPACT_THRESHOLD)),
+            enabled=os.getenv("ANALYSIS_HISTORY_DISABLED", "").lower() not in ("1", "true", "yes"),
+            embedder=load_embedder(os.getenv("SEMANTIC_EMBEDDER")),
+            semantic_max_entries=int(os.getenv("SEMANTIC_INDEX_MAX_ENTRIES", DEFAULT_MAX_ENTRIES)),
+            ann_threshold=int(os.getenv("SEMANTIC_ANN_THRESHOLD", DEFAULT_ANN_THRESHOLD)),
+        )
+
+    def _dataset_dir(self, dataset):
+        return os.path.join(self.path, "documents") if dataset == "documents" else self.path
+
+    def _partition_dir(self, month, dataset="impacts"):
+        return os.path.join(self._dataset_dir(dataset), f"month={month}")
+
+    def _part_files(self, month, dataset="impacts"):
+        directory = self._partition_dir(month, dataset)
+        if not os.path.isdir(directory):
+            return []
+        # 以 . 或 _ 開頭的暫存檔與鎖檔不屬於資料集
+        return sorted(
+            os.path.join(directory, name) for name in os.listdir(directory)
+            if name.endswith(".parquet") and not name.startswith((".", "_"))
+        )
+
+    def _write(self, table, month, suffix="", dataset="impacts"):
+        import pyarrow.parquet as pq
+
+        directory = self._partition_dir(month, dataset)
+        os.makedirs(directory, exist_ok=True)
+        name = f"part-{time.time_ns()}-{uuid.uuid4().hex[:8]}{suffix}.parquet"
+        # 先寫入暫存檔再改名，讀取端不會看到寫到一半的檔案
+        temp_path = os.path.join(directory, f".{name}.tmp")
+        pq.write_table(table, temp_path)
+        os.replace(temp_path, os.path.join(directory, name))
+
+    def append(self, article_id, analysis, analyzed_at=None, news_text=None):
+        """展開並寫入一則分析，返回寫入的列數；完整結果與新聞原文同時寫入 documents"""
+        if not self.enabled:
+            return 0
+        import json
+
+        import pyarrow as pa
+
+        analyzed_at = analyzed_at or datetime.now(timezone.utc)
+        rows = flatten_analysis(analysis)
+        if not rows:
+            return 0
+        dimensions, entities, impacts = (list(column) for column in zip(*rows))
+        scores = score_impacts(impacts)
+        day = analyzed_at.astimezone(timezone.utc).date()
+        table = pa.Table.from_pydict({
+            "analyzed_at": [analyzed_at] * len(rows),
+            "date": [day] * len(rows),
+            "article_id": [article_id] * len(rows),
+            "dimension": dimensions,
+            "entity": entities,
+            "impact": impacts,
+            "magnitude": scores["magnitude"],
+            "direction": scores["direction"],
+            "signed": scores["signed"],
+            "matched": scores["matched"],
+        }, schema=_schema())
+        month = _month(day)
+        self._write(table, month)
+        document = pa.Table.from_pydict({
+            "analyzed_at": [analyzed_at],
+            "article_id": [article_id],
+            "news_text": [news_text],
+            "analysis": [json.dumps(analysis, ensure_ascii=False)],
+        }, schema=_schema("documents"))
+        self._write(document, month, dataset="documents")
+        self.aggregate.add(day.isoformat(), dimension_scores(dimensions, scores["signed"], scores["matched"]))
+        self.semantic.add(article_id, news_text, analysis, analyzed_at)
+        if len(self._part_files(month)) > self.compact_threshold:
+            self.compact(month, wait=False)
+        return len(rows)
+
+    @contextlib.contextmanager
+    def _summaries(self):
+        conn = sqlite3.connect(self.summaries_path, timeout=10)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def set_summary(self, article_id, summary):
+        """記錄一則分析的投資建議總結；總結在分析寫入歷史庫之後才產生，匯出報告時由 iter_documents 合併"""
+        if not self.enabled or not summary:
+            return
+        with self._summaries() as conn:
+            conn.execute("INSERT OR REPLACE INTO summaries (article_id, summary) VALUES (?, ?)", (article_id, summary))
+
+    def _summaries_for(self, article_ids):
+        if not article_ids:
+            return {}
+        with self._summaries() as conn:
+            return dict(conn.execute(
+                f"SELECT article_id, summary FROM summaries WHERE article_id IN ({','.join('?' * len(article_ids))})",
+                article_ids,
+            ))
+
+    def months(self, dataset="impacts"):
+        """返回已有資料的月份（YYYY-MM），由舊到新"""
+        directory = self._dataset_dir(dataset)
+        if not os.path.isdir(directory):
+            return []
+        return sorted(
+            name.split("=", 1)[1] for name in os.listdir(directory)
+            if name.startswith("month=") and self._part_files(name.split("=", 1)[1], dataset)
+        )
+
+    def compact(self, month=None, wait=True):
+        """將分區內的小檔合併成單一檔案；month 為 None 時處理所有分區，返回合併掉的檔案數
+
+        合併以分區內的檔案鎖互斥；wait=False 時其他程序正在合併就直接略過。
+        """
+        if not self.enabled:
+            return 0
+        merged = 0
+        for current in ([month] if month else self.months()):
+            lock = KeyFileLock(self._partition_dir(current), "_compact")
+            if not (lock.acquire(timeout=60) if wait else lock.try_acquire()):
+                continue
+            try:
+                merged += self._compact_partition(current)
+                merged += self._compact_partition(current, "documents")
+            finally:
+                lock.release()
+        return merged
+
+    def _compact_partition(self, month, dataset="impacts"):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        files = self._part_files(month, dataset)
+        if len(files) < 2:
+            return 0
+        table = pa.concat_tables([pq.read_table(path, schema=_schema(dataset)) for path in files])
+        self._write(table.sort_by("analyzed_at"), month, suffix="-compacted", dataset=dataset)
+        for path in files:
+            os.remove(path)
+        return len(files)
+
+    def rebuild_aggregate(self):
+        """由歷史庫重新計算每日統計（統計檔遺失或調整面向對應後使用），返回統計列數"""
+        if not self.enabled:
+            return 0
+        frame = self.query(columns=["date", "article_id", "dimension", "signed", "matched"]).to_pandas()
+        frame = frame[frame["matched"]].assign(dimension=frame["dimension"].map(SOURCE_DIMENSIONS)).dropna()
+        # 與增量更新相同：每則分析在每個面向先取平均，再以分析為單位統計
+        per_analysis = frame.groupby(["date", "article_id", "dimension"])["signed"].mean().reset_index()
+        stats = per_analysis.groupby(["date", "dimension"])["signed"].agg(["count", "mean", "var"])
+        stats["m2"] = stats["var"].fillna(0.0) * (stats["count"] - 1)
+        rows = [
+            (day.isoformat(), dimension, int(row["count"]), float(row["mean"]), float(row["m2"]))
+            for (day, dimension), row in stats.iterrows()
+        ]
+        self.aggregate.replace(rows)
+        return len(rows)
+
+    def rebuild_semantic_index(self, batch_size=256):
+        """由歷史庫重新計算所有新聞向量（更換向量模型或索引遺失後使用），返回寫入的筆數"""
+        if not self.enabled:
+            return 0
+        self.semantic.clear()
+        written = 0
+        batch = []
+        for document in self.iter_documents():
+            batch.append((document["article_id"], document["news_text"], document["analysis"], document["analyzed_at"]))
+            if len(batch) == batch_size:
+                written += self.semantic.add_many(batch)
+                batch = []
+        return written + self.semantic.add_many(batch)
+
+    def query(self, start=None, end=None, dimensions=None, entity=None, columns=None):
+        """讀取 [start, end] 日期範圍內的影響紀錄，返回 pyarrow Table
+
+        dimensions 限定面向，entity 為對象名稱的子字串（例如「半導體」可比對「半導體產業」）。
+        """
+        import pyarrow as pa
+        import pyarrow.compute as pc
+        import pyarrow.dataset as ds
+
+        schema = _schema()
+        months = [m for m in self.months() if (start is None or m >= _month(start))
+                  and (end is None or m <= _month(end))]
+        files = [path for m in months for path in self._part_files(m)]
+        if not files:
+            return schema.empty_table() if columns is None else schema.empty_table().select(columns)
+        condition = None
+        for expression in (
+            pc.field("date") >= pa.scalar(start, pa.date32()) if start is not None else None,
+            pc.field("date") <= pa.scalar(end, pa.date32()) if end is not None else None,
+            pc.field("dimension").isin(list(dimensions)) if dimensions else None,
+        ):
+            if expression is not None:
+                condition = expression if condition is None else condition & expression
+        needed = None if columns is None else sorted(set(columns) | ({"entity"} if entity else set()))
+        for attempt in range(2):
+            try:
+                table = ds.dataset(files, schema=schema, format="parquet").to_table(
+                    columns=needed, filter=condition
+                )
+                break
+            except FileNotFoundError:
+                # 讀取期間分區剛好被合併，重新列出檔案後再讀一次
+                if attempt:
+                    raise
+                files = [path for m in months for path in self._part_files(m)]
+        if entity:
+            table = table.filter(pc.match_substring(table["entity"], entity))
+        return table if columns is None else table.select(columns)
+
+    def iter_documents(self, start=None, end=None, batch_size=64):
+        """依分析時間逐批讀取 [start, end] 日期範圍內的完整分析，逐筆產生
+        {"analyzed_at", "article_id", "news_text", "analysis"}，不會一次載入整個範圍；
+        已記錄的投資建議總結合併為 analysis["investment_summary"]"""
+        import json
+
+        import pyarrow as pa
+        import pyarrow.compute as pc
+        import pyarrow.dataset as ds
+
+        schema = _schema("documents")
+        condition = None
+        if start is not None:
+            condition = pc.field("analyzed_at") >= pa.scalar(
+                datetime(start.year, start.month, start.day, tzinfo=timezone.utc), schema.field("analyzed_at").type
+            )
+        if end is not None:
+            end_condition = pc.field("analyzed_at") < pa.scalar(
+                datetime(end.year, end.month, end.day, tzinfo=timezone.utc) + timedelta(days=1),
+                schema.field("analyzed_at").type,
+            )
+            condition = end_condition if condition is None else condition & end_condition
+        for month in self.months("documents"):
+            if (start is not None and month < _month(start)) or (end is not None and month > _month(end)):
+                continue
+            # 逐月讀取，每次只在記憶體中保留一批
+            dataset = ds.dataset(self._part_files(month, "documents"), schema=schema, format="parquet")
+            for batch in dataset.to_batches(filter=condition, batch_size=batch_size):
+                rows = batch.to_pylist()
+                summaries = self._summaries_for(sorted({row["article_id"] for row in rows}))
+                for row in rows:
+                    row["analysis"] = json.loads(row["analysis"])
+                    if row["article_id"] in summaries:
+                        row["analysis"]["investment_summary"] = summaries[row["article_id"]]
+                    yield row
+
+    def daily_sentiment(self, start=None, end=None, dimensions=None, entity=None):
+        """依日期彙總帶正負號的影響分數，返回以日期為索引的 DataFrame（mean、count）"""
+        import pandas as pd
+
+        table = self.query(start, end, dimensions, entity, columns=["date", "signed"])
+        grouped = table.group_by("date").aggregate([("signed", "sum"), ("signed", "count")])
+        frame = grouped.to_pandas().rename(columns={"signed_sum": "sum", "signed_count": "count"})
+        frame["date"] = pd.to_datetime(frame["date"])
+        frame = frame.set_index("date").sort_index()
+        frame["mean"] = frame["sum"] / frame["count"]
+        return frame[["mean", "count", "sum"]]
+
+    def rolling_sentiment(self, entity, window_days=30, end=None, periods=None, dimensions=SECTOR_DIMENSIONS):
+        """對象的滾動平均情緒（-1~1），返回逐日的 DataFrame：當日 mean/count 與 rolling 滾動平均
+
+        滾動平均以視窗內所有紀錄加權（紀錄多的日子權重較高），沒有紀錄的日子 count 為 0。
+        periods 為返回的天數，預設一年；查詢範圍會往前多取一個視窗以計算第一天的滾動值。
+        """
+        import pandas as pd
+
+        end = end or datetime.now(timezone.utc).date()
+        periods = periods or 365
+        first = end - timedelta(days=periods - 1)
+        daily = self.daily_sentiment(first - timedelta(days=window_days - 1), end, dimensions, entity)
+        days = pd.date_range(first - timedelta(days=window_days - 1), end, freq="D")
+        daily = daily.reindex(days, fill_value=0)
+        window_sum = daily["sum"].rolling(window_days, min_periods=1).sum()
+        window_count = daily["count"].rolling(window_days, min_periods=1).sum()
+        result = pd.DataFrame({
+            "mean": daily["sum"] / daily["count"].where(daily["count"] > 0),
+            "count": daily["count"].astype(int),
+            "rolling": window_sum / window_count.where(window_count > 0),
+        })
+        return result.loc[pd.Timestamp(first):]
+
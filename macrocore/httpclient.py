@@ -0,0 +1,210 @@
+"""共用 HTTP 用戶端：每個主機保持連線池，並提供逾時、重試退避與斷路器
+
+呼叫時指定 provider 且設定了 QuotaLimiter 時，每次送出（含重試）前都先取得該服務的額度。
+requests 在第一次建立用戶端時才載入，匯入本模組不會拖慢啟動。
+"""
+import os
+import random
+import threading
+import time
+from urllib.parse import urlsplit
+
+# (連線逾時, 讀取逾時) 秒；非串流的 DeepSeek 分析可能需要一分鐘以上才開始回傳
+DEFAULT_TIMEOUT = (
+    float(os.getenv("HTTP_CONNECT_TIMEOUT", "5")),
+    float(os.getenv("HTTP_READ_TIMEOUT", "120")),
+)
+RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+
+
+class CircuitOpenError(ConnectionError):
+    """上游服務連續失敗而暫時熔斷，呼叫端應改用備援內容"""
+
+
+class CircuitBreaker:
+    """連續失敗達門檻即斷開，冷卻後放行一次試探請求"""
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        with self._lock:
+            if self.opened_at is None:
+                return "closed"
+            if time.monotonic() - self.opened_at >= self.reset_timeout:
+                return "half-open"
+            return "open"
+
+    def allow(self):
+        """是否允許送出請求"""
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            if time.monotonic() - self.opened_at < self.reset_timeout or self._trial_in_flight:
+                return False
+            self._trial_in_flight = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self._trial_in_flight or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+            self._trial_in_flight = False
+
+    def release_trial(self):
+        """試探請求未送出（例如額度不足）時歸還試探機會，不改變斷路器狀態"""
+        with self._lock:
+            self._trial_in_flight = False
+
+
+def retry_after_seconds(response):
+    """解析 Retry-After 標頭（秒數或 HTTP 日期），無法解析時返回 None"""
+    value = response.headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        import email.utils
+        parsed = email.utils.parsedate_to_datetime(value)
+        if parsed is None:
+            return None
+        return max(0.0, parsed.timestamp() - time.time())
+
+
+class BaseHttpClient:
+    """重試退避與斷路器策略，由同步與非同步用戶端共用"""
+
+    def __init__(self, timeout=DEFAULT_TIMEOUT, max_retries=3, backoff_base=0.5,
+                 backoff_max=8.0, max_retry_wait=15.0, failure_threshold=5, reset_timeout=30.0, quota=None):
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.max_retry_wait = max_retry_wait
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.quota = quota
+        self._breakers = {}
+        self._breakers_lock = threading.Lock()
+
+    def breaker(self, url):
+        """取得 URL 所屬主機的斷路器"""
+        host = urlsplit(url).netloc
+        with self._breakers_lock:
+            if host not in self._breakers:
+                self._breakers[host] = CircuitBreaker(self.failure_threshold, self.reset_timeout)
+            return self._breakers[host]
+
+    def _backoff(self, attempt):
+        # 指數退避加上完全抖動，避免多個工作者同時重試
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    def _ensure_closed(self, url, breaker):
+        if not breaker.allow():
+            raise CircuitOpenError(f"{urlsplit(url).netloc} 連續失敗，暫停呼叫 {breaker.reset_timeout:.0f} 秒")
+
+    def _retry_delay(self, breaker, response, attempt, retries, blocked_for=None):
+        """依回應狀態更新斷路器；需要重試時返回等待秒數，否則返回 None
+
+        blocked_for 為額度限制器因這次回應暫停該服務的秒數，重試至少要等到暫停結束。
+        """
+        if response.status_code not in RETRY_STATUSES:
+            breaker.record_success()
+            return None
+        # 429 代表限流而非服務故障，只重試不計入斷路器
+        if response.status_code >= 500:
+            breaker.record_failure()
+        else:
+            breaker.record_success()
+        delay = retry_after_seconds(response)
+        if delay is None:
+            delay = self._backoff(attempt)
+        if blocked_for:
+            delay = max(delay, blocked_for)
+        if attempt >= retries or delay > self.max_retry_wait:
+            return None
+        return delay
+
+
+class HttpClient(BaseHttpClient):
+    """執行緒共用的同步 HTTP 用戶端（requests）"""
+
+    def __init__(self, pool_maxsize=20, **kwargs):
+        super().__init__(**kwargs)
+        import requests
+        from requests.adapters import HTTPAdapter
+        self._exceptions = requests.exceptions
+        self.session = requests.Session()
+        # 重試由本類別自行處理，urllib3 層不再重試
+        adapter = HTTPAdapter(pool_connections=8, pool_maxsize=pool_maxsize, max_retries=0)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def request(self, method, url, timeout=None, max_retries=None, provider=None, **kwargs):
+        """送出請求；遇到連線錯誤或 429/5xx 時退避重試，斷路器開啟或額度不足時立即失敗"""
+        breaker = self.breaker(url)
+        retries = self.max_retries if max_retries is None else max_retries
+        limited = provider is not None and self.quota is not None
+        attempt = 0
+        while True:
+            self._ensure_closed(url, breaker)
+            if limited:
+                try:
+                    self.quota.acquire(provider)
+                except BaseException:
+                    breaker.release_trial()
+                    raise
+            try:
+                response = self.session.request(method, url, timeout=timeout or self.timeout, **kwargs)
+            except self._exceptions.RequestException as exc:
+                breaker.record_failure()
+                retryable = isinstance(exc, (self._exceptions.ConnectionError, self._exceptions.Timeout))
+                if not retryable or attempt >= retries:
+                    raise
+                time.sleep(self._backoff(attempt))
+                attempt += 1
+                continue
+
+            blocked_for = None
+            if limited and response.status_code >= 400:
+                blocked_for = self.quota.record_response(provider, response.status_code, retry_after_seconds(response))
+            delay = self._retry_delay(breaker, response, attempt, retries, blocked_for)
+            if delay is None:
+                return response
+            response.close()
+            time.sleep(delay)
+            attempt += 1
+
+    def get(self, url, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request("POST", url, **kwargs)
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_http_client():
+    """取得程序內共用的 HTTP 用戶端"""
+    global _client
+    with _client_lock:
+        if _client is None:
+            from macrocore.ratelimit import QuotaLimiter
+            _client = HttpClient(max_retries=int(os.getenv("HTTP_MAX_RETRIES", "3")), quota=QuotaLimiter.from_env())
+        return _client
@@ -0,0 +1,85 @@
+"""背景新聞擷取程序
+
+依設定的查詢定期呼叫 GNews，將新文章寫入本地文章庫；頁面只讀取文章庫，載入時不等待外部 API。
+輪詢間隔由每日額度推算，保留一部分額度給手動刷新，超出每日額度（403）時等到 UTC 午夜額度重置。
+每次刷新預設只取一頁；允許往前翻頁時，輪詢間隔以每個查詢最多的請求數計算。
+
+    python -m macrocore ingest --daily-quota 100
+"""
+import os
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+
+from macrocore.httpclient import CircuitOpenError
+from macrocore.news import DEFAULT_NEWS_QUERY, GNewsError, refresh_news
+from macrocore.ratelimit import QuotaExceededError
+
+# GNews 免費方案每日 100 次請求
+DEFAULT_DAILY_QUOTA = 100
+# 保留給頁面手動刷新的額度比例
+DEFAULT_RESERVE_RATIO = 0.2
+MIN_POLL_INTERVAL = 60.0
+# 背景擷取每個查詢每輪最多的 GNews 請求數（refresh_news 的翻頁上限）
+DEFAULT_INGEST_PAGES = 1
+
+
+def configured_queries():
+    """NEWS_QUERIES 以分號分隔多個查詢，未設定時使用頁面預設查詢"""
+    queries = [q.strip() for q in os.getenv("NEWS_QUERIES", "").split(";") if q.strip()]
+    return queries or [DEFAULT_NEWS_QUERY]
+
+
+def poll_interval(num_queries, daily_quota=DEFAULT_DAILY_QUOTA, reserve_ratio=DEFAULT_RESERVE_RATIO,
+                  max_pages=DEFAULT_INGEST_PAGES):
+    """讓所有查詢每天的請求總數不超過 (1 - 保留比例) × 每日額度的輪詢間隔秒數；每個查詢每輪以 max_pages 次請求計算"""
+    budget = max(1.0, daily_quota * (1.0 - reserve_ratio))
+    return max(MIN_POLL_INTERVAL, 86400.0 * num_queries * max_pages / budget)
+
+
+def seconds_until_quota_reset(now=None):
+    """距離 GNews 每日額度重置（UTC 午夜）的秒數"""
+    now = now or datetime.now(timezone.utc)
+    tomorrow = (now + timedelta(days=1)).replace(hour=0, minute=0, second=0, microsecond=0)
+    return (tomorrow - now).total_seconds()
+
+
+def _log(message):
+    print(f"[{datetime.now().isoformat(timespec='seconds')}] {message}", file=sys.stderr, flush=True)
+
+
+def run_ingestion(store, api_key, queries, interval, max_results=10, once=False, sleep=time.sleep,
+                  max_pages=DEFAULT_INGEST_PAGES):
+    """依序輪詢每個查詢並寫入文章庫；once=True 時只跑一輪，返回失敗的查詢數"""
+    while True:
+        failures = 0
+        wait = interval
+        for query in queries:
+            try:
+                added = refresh_news(store, api_key, query=query, max_results=max_results, max_pages=max_pages)
+                _log(f"{query}：新增 {len(added)} 則")
+            except GNewsError as e:
+                failures += 1
+                _log(f"{query}：{e}")
+                if e.status_code == 403:
+                    # 已用完每日額度，剩下的查詢也不必再試
+                    wait = max(wait, seconds_until_quota_reset())
+                    break
+                if e.status_code == 401:
+                    raise
+            except QuotaExceededError as e:
+                # 與頁面等其他程序共用的額度不足，等到額度恢復再繼續
+                failures += 1
+                _log(f"{query}：{e}")
+                wait = max(wait, e.retry_after)
+                break
+            except CircuitOpenError as e:
+                failures += 1
+                _log(f"{query}：{e}")
+            except Exception as e:
+                failures += 1
+                _log(f"{query}：擷取失敗 {e}")
+        if once:
+            return failures
+        _log(f"下次擷取：{wait:.0f} 秒後")
+        sleep(wait)
@@ -0,0 +1,206 @@
+"""各階段耗時與用量指標
+
+分析流程的每個階段（GNews 擷取、提示詞組合、DeepSeek 往返、JSON 解析、圖表規格、投資建議總結……）
+以 metrics.timer 計時，記入各階段的延遲直方圖，並以 JSON 一行一筆寫入 macrocore.metrics 記錄器。
+render_prometheus 將直方圖、分析結果來源（快取命中、近似重複、共用、實際呼叫）計數，
+連同 usage_tracker 的 token 用量與 parse_stats 的解析結果輸出為 Prometheus 文字格式，
+由 ASGI 服務的 /metrics 或 start_metrics_server 啟動的執行緒提供給監控系統抓取。
+"""
+import contextlib
+import functools
+import json
+import logging
+import os
+import sys
+import threading
+import time
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+# 延遲直方圖的上界（秒），涵蓋本地計算到 DeepSeek 長回應
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+_PREFIX = "macroinsight_"
+
+logger = logging.getLogger("macrocore.metrics")
+
+
+def _labels(labels):
+    if not labels:
+        return ""
+    escaped = (
+        (name, str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for name, value in sorted(labels.items())
+    )
+    return "{" + ",".join(f'{name}="{value}"' for name, value in escaped) + "}"
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class MetricsRegistry:
+    """程序內的直方圖與計數器，執行緒安全"""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self._histograms = {}
+        self._counters = {}
+        self._help = {}
+        self._lock = threading.Lock()
+
+    def observe(self, name, value, help_text="", **labels):
+        """記錄一筆直方圖觀測值"""
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._help.setdefault(name, help_text)
+            series = self._histograms.setdefault(name, {}).get(key)
+            if series is None:
+                series = self._histograms[name][key] = {"buckets": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series["buckets"][i] += 1
+            series["sum"] += value
+            series["count"] += 1
+
+    def increment(self, name, amount=1, help_text="", **labels):
+        """累加計數器"""
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._help.setdefault(name, help_text)
+            counters = self._counters.setdefault(name, {})
+            counters[key] = counters.get(key, 0) + amount
+
+    @contextlib.contextmanager
+    def timer(self, stage, **fields):
+        """計時一個階段：記入延遲直方圖（失敗另計錯誤次數）並寫出一筆結構化記錄
+
+        區塊內可在 yield 出的 dict 中補充欄位（例如 token 用量），會一併寫入記錄。
+        """
+        started = time.perf_counter()
+        status = "ok"
+        try:
+            yield fields
+        except BaseException as e:
+            status = "error"
+            fields["error"] = type(e).__name__
+            self.increment("stage_errors_total", help_text="分析各階段失敗次數", stage=stage)
+            raise
+        finally:
+            elapsed = time.perf_counter() - started
+            self.observe("stage_duration_seconds", elapsed, help_text="分析各階段耗時（秒）", stage=stage)
+            if logger.isEnabledFor(logging.INFO):
+                logger.info(json.dumps(
+                    dict(fields, event="stage", stage=stage, status=status, seconds=round(elapsed, 6), ts=time.time()),
+                    ensure_ascii=False, default=str,
+                ))
+
+    def timed(self, stage):
+        """以 timer 計時整個函式的裝飾器"""
+        def decorator(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                with self.timer(stage):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def snapshot(self):
+        """返回直方圖與計數器的複本：({名稱: {標籤: 序列}}, {名稱: {標籤: 值}})"""
+        with self._lock:
+            histograms = {
+                name: {key: dict(series, buckets=list(series["buckets"])) for key, series in values.items()}
+                for name, values in self._histograms.items()
+            }
+            counters = {name: dict(values) for name, values in self._counters.items()}
+        return histograms, counters
+
+    def render_prometheus(self):
+        """輸出 Prometheus 文字格式，附上 token 用量、解析結果與圖表規格快取的統計"""
+        histograms, counters = self.snapshot()
+        lines = []
+
+        def header(name, kind, help_text):
+            if help_text:
+                lines.append(f"# HELP {_PREFIX}{name} {help_text}")
+            lines.append(f"# TYPE {_PREFIX}{name} {kind}")
+
+        for name, values in sorted(histograms.items()):
+            header(name, "histogram", self._help.get(name))
+            for key, series in sorted(values.items()):
+                labels = dict(key)
+                for bound, count in zip(self.buckets, series["buckets"]):
+                    lines.append(f"{_PREFIX}{name}_bucket{_labels(dict(labels, le=_number(float(bound))))} {count}")
+                lines.append(f"{_PREFIX}{name}_bucket{_labels(dict(labels, le='+Inf'))} {series['count']}")
+                lines.append(f"{_PREFIX}{name}_sum{_labels(labels)} {_number(series['sum'])}")
+                lines.append(f"{_PREFIX}{name}_count{_labels(labels)} {series['count']}")
+        for name, values, help_text in sorted(self._counter_families(counters), key=lambda family: family[0]):
+            header(name, "counter", help_text)
+            for labels, value in values:
+                lines.append(f"{_PREFIX}{name}{_labels(labels)} {_number(value)}")
+        return "\n".join(lines) + "\n"
+
+    def _counter_families(self, counters):
+        """registry 本身的計數器加上其他模組既有的程序內統計，逐一產生 (名稱, [(標籤, 值)], 說明)"""
+        from macrocore.tolerant_json import parse_stats
+        from macrocore.usage import USAGE_FIELDS, usage_tracker
+
+        for name, values in counters.items():
+            yield name, [(dict(key), value) for key, value in sorted(values.items())], self._help.get(name)
+        totals = sorted(usage_tracker.totals().items())
+        if totals:
+            yield "deepseek_calls_total", [({"kind": kind}, t["calls"]) for kind, t in totals], "實際呼叫 DeepSeek 的次數"
+            yield "deepseek_call_seconds_total", [({"kind": kind}, t["elapsed"]) for kind, t in totals], \
+                "DeepSeek 呼叫累計耗時（秒）"
+            yield "deepseek_tokens_total", [
+                ({"kind": kind, "type": field[:-len("_tokens")]}, t[field])
+                for kind, t in totals for field in USAGE_FIELDS
+            ], "DeepSeek 回傳的 token 用量"
+        parse = parse_stats.snapshot()
+        yield "parse_results_total", [({"outcome": outcome}, parse[outcome]) for outcome in parse_stats.OUTCOMES], \
+            "模型輸出解析結果"
+        # 圖表模組未載入時不為了輸出指標而載入
+        charts = sys.modules.get("macrocore.charts")
+        if charts is not None:
+            cache = charts.chart_spec_cache
+            yield "chart_spec_cache_total", [({"result": "hit"}, cache.hits), ({"result": "miss"}, cache.misses)], \
+                "圖表規格快取命中與未命中次數"
+
+
+# 程序內共用的指標
+metrics = MetricsRegistry()
+
+
+def configure_logging():
+    """METRICS_LOG 設為 1 時，將各階段的結構化記錄（每行一筆 JSON）輸出到標準錯誤；重複呼叫不會重複輸出"""
+    if os.getenv("METRICS_LOG", "").lower() not in ("1", "true", "yes") or logger.handlers:
+        return
+    handler = logging.StreamHandler(sys.stderr)
+    handler.setFormatter(logging.Formatter("%(message)s"))
+    logger.addHandler(handler)
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+
+
+def start_metrics_server(port, host="0.0.0.0"):
+    """在背景執行緒啟動只提供 GET /metrics 的 HTTP 服務（供沒有 ASGI 服務的 Streamlit 頁面使用），返回伺服器"""
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?", 1)[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = metrics.render_prometheus().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", PROMETHEUS_CONTENT_TYPE)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            # 監控系統定期抓取，不輸出存取記錄
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+    return server
@@ -0,0 +1,211 @@
+"""GNews 新聞增量擷取與本地文章庫
+
+文章以 URL（沒有 URL 時為標題與內容的雜湊）為鍵存入 SQLite，
+每個查詢記錄已取得的最新發布時間作為游標，刷新時只以 from 參數請求更新的文章（超過一頁時以 to 參數往前翻頁），
+新文章合併進既有清單，不必清除其他快取或重抓整個查詢。
+資料庫使用 WAL 模式，背景擷取程序寫入時頁面仍可同時讀取。
+"""
+import contextlib
+import os
+import sqlite3
+import time
+from datetime import datetime, timedelta, timezone
+
+from macrocore.httpclient import get_http_client
+from macrocore.metrics import metrics
+from macrocore.text import content_hash
+
+# 可改指向基準測試的本地模擬服務
+GNEWS_SEARCH_URL = os.getenv("GNEWS_SEARCH_URL", "https://gnews.io/api/v4/search")
+# 頁面預設的台灣經濟新聞查詢
+DEFAULT_NEWS_QUERY = "台灣 經濟 OR 台股 OR 央行 OR 台積電 OR GDP OR 貿易"
+DEFAULT_STORE_PATH = os.path.join(".cache", "news_store.sqlite3")
+# GNews 請求的 (連線, 讀取) 逾時秒數
+GNEWS_TIMEOUT = (5, 15)
+_GNEWS_TIME_FORMAT = "%Y-%m-%dT%H:%M:%SZ"
+# 刷新時最多往前翻的頁數，避免長時間未刷新後一次用掉大量每日額度
+DEFAULT_REFRESH_PAGES = 5
+
+
+class GNewsError(Exception):
+    """GNews 請求失敗；保留 HTTP 狀態碼供呼叫端判斷（401 金鑰無效、403 超出每日額度、429 請求過快）"""
+
+    def __init__(self, message, status_code=None):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def article_id(url, title, content):
+    """文章鍵：優先使用 URL，沒有時以標題與內容的雜湊代替"""
+    return url or content_hash(title, content)[:32]
+
+
+def normalize_article(article):
+    """將 GNews 返回的文章轉成頁面使用的欄位（title/content/category），並附上 id、url 與發布時間"""
+    title = article.get("title") or "無標題"
+    content = (article.get("description") or "無內容") + " " + (article.get("content") or "")
+    url = article.get("url")
+    return {
+        "id": article_id(url, title, content),
+        "url": url,
+        "title": title,
+        "content": content,
+        "category": (article.get("source") or {}).get("name") or "綜合",
+        "published_at": article.get("publishedAt") or "",
+    }
+
+
+def fetch_gnews(query, api_key, since=None, until=None, max_results=6):
+    """查詢 GNews；since / until 為 UTC datetime 時只請求該時間之後 / 之前發布的文章（皆包含邊界）。
+    失敗時拋出 GNewsError"""
+    params = {
+        "q": query,
+        "lang": "zh-TW",
+        "country": "tw",
+        "max": max_results,
+        "sortby": "publishedAt",
+        "token": api_key,
+    }
+    if since is not None:
+        params["from"] = since.strftime(_GNEWS_TIME_FORMAT)
+    if until is not None:
+        params["to"] = until.strftime(_GNEWS_TIME_FORMAT)
+    with metrics.timer("gnews", query=query) as fields:
+        response = get_http_client().get(
+            GNEWS_SEARCH_URL, params=params, timeout=GNEWS_TIMEOUT, provider="gnews"
+        )
+        if response.status_code != 200:
+            raise GNewsError(f"GNews API 請求失敗，狀態碼：{response.status_code}", status_code=response.status_code)
+        articles = [normalize_article(article) for article in response.json().get("articles", [])]
+        fields["articles"] = len(articles)
+    return articles
+
+
+class ArticleStore:
+    """SQLite 文章庫：文章去重保存，並記錄每個查詢的擷取游標"""
+
+    def __init__(self, path=DEFAULT_STORE_PATH):
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with self._connect() as conn:
+            # WAL 設定會保存在資料庫檔案中，之後的連線都沿用
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS articles ("
+                " id TEXT PRIMARY KEY,"
+                " url TEXT,"
+                " title TEXT NOT NULL,"
+                " content TEXT NOT NULL,"
+                " category TEXT NOT NULL,"
+                " published_at TEXT NOT NULL,"
+                " fetched_at REAL NOT NULL)"
+            )
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_articles_published ON articles (published_at)"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS cursors ("
+                " query TEXT PRIMARY KEY,"
+                " latest_published_at TEXT,"
+                " checked_at REAL NOT NULL)"
+            )
+
+    @classmethod
+    def from_env(cls):
+        """依環境變數建立文章庫"""
+        return cls(path=os.getenv("NEWS_STORE_PATH", DEFAULT_STORE_PATH))
+
+    @contextlib.contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=10)
+        conn.execute("PRAGMA synchronous=NORMAL")
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def add_articles(self, articles):
+        """寫入文章，已存在的 id 略過；返回實際新增的文章"""
+        now = time.time()
+        added = []
+        with self._connect() as conn:
+            for article in articles:
+                cursor = conn.execute(
+                    "INSERT OR IGNORE INTO articles"
+                    " (id, url, title, content, category, published_at, fetched_at)"
+                    " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (article["id"], article.get("url"), article["title"], article["content"],
+                     article["category"], article.get("published_at") or "", now),
+                )
+                if cursor.rowcount:
+                    added.append(article)
+        return added
+
+    def latest_articles(self, limit=12):
+        """依發布時間由新到舊返回最近的文章"""
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT id, url, title, content, category, published_at FROM articles"
+                " ORDER BY published_at DESC, fetched_at DESC LIMIT ?",
+                (limit,),
+            ).fetchall()
+        return [
+            dict(zip(("id", "url", "title", "content", "category", "published_at"), row))
+            for row in rows
+        ]
+
+    def get_cursor(self, query):
+        """返回 (已取得的最新發布時間字串或 None, 上次檢查的時間戳或 None)"""
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT latest_published_at, checked_at FROM cursors WHERE query = ?", (query,)
+            ).fetchone()
+        return row if row is not None else (None, None)
+
+    def set_cursor(self, query, latest_published_at):
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO cursors (query, latest_published_at, checked_at) VALUES (?, ?, ?)",
+                (query, latest_published_at, time.time()),
+            )
+
+
+def _parse_published_at(value):
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(value.replace("Z", "+00:00")).astimezone(timezone.utc)
+    except ValueError:
+        return None
+
+
+def refresh_news(store, api_key, query=DEFAULT_NEWS_QUERY, max_results=6, max_pages=DEFAULT_REFRESH_PAGES):
+    """只擷取游標之後發布的新文章並存入文章庫，返回新增的文章；失敗時拋出 GNewsError
+
+    GNews 依發布時間由新到舊返回，整頁都在游標之後時以 to 參數往前翻頁，直到回到游標，
+    兩次刷新之間的新文章超過一頁也不會跳過較舊的；最多翻 max_pages 頁。第一次擷取（沒有游標）只取一頁。
+    """
+    latest, _ = store.get_cursor(query)
+    since = _parse_published_at(latest)
+    if since is not None:
+        # from 參數包含邊界，往後推一秒避免重複取得上次最新的一則
+        since += timedelta(seconds=1)
+    added = []
+    until = None
+    for _ in range(max_pages):
+        articles = fetch_gnews(query, api_key, since=since, until=until, max_results=max_results)
+        added += store.add_articles(articles)
+        for article in articles:
+            if article["published_at"] and (latest is None or article["published_at"] > latest):
+                latest = article["published_at"]
+        if since is None or len(articles) < max_results:
+            break
+        # to 參數同樣包含邊界，同一秒發布的文章會重複取得，由文章庫去重；最舊一則的時間沒有往前時停止
+        oldest = _parse_published_at(min((a["published_at"] for a in articles if a["published_at"]), default=""))
+        if oldest is None or (until is not None and oldest >= until):
+            break
+        until = oldest
+    # 即使沒有新文章也更新檢查時間，讓自動刷新的間隔重新計算
+    store.set_cursor(query, latest)
+    return added
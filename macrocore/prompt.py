@@ -0,0 +1,200 @@
+"""分析與總結的提示詞
+
+靜態指示與精簡的 JSON 結構放在最前面、新聞原文放在最後，
+讓每次請求都共用同一段前綴，可被 DeepSeek 的上下文快取（context caching）重複使用。
+靜態部分在匯入時只組合一次。
+"""
+import json
+
+# 修改提示詞或結構模板時請同步更新版本號，讓舊的快取結果失效
+PROMPT_VERSION = "2025.2"
+
+# 分析結果的 JSON 結構模板
+RESULT_TEMPLATE = {
+    "summary": {
+        "key_points": ["重點1", "重點2", "重點3"],
+        "key_data": ["數據1", "數據2", "數據3"],
+        "related_entities": ["相關企業/產業1", "相關企業/產業2"]
+    },
+    "market_impact": {
+        "macro_economy": {
+            "gdp": {"impact": "影響程度", "description": "詳細說明"},
+            "inflation": {"impact": "影響程度", "description": "詳細說明"},
+            "employment": {"impact": "影響程度", "description": "詳細說明"},
+            "consumption": {"impact": "影響程度", "description": "詳細說明"}
+        },
+        "financial_markets": {
+            "stock_market": {
+                "indices": [{"name": "指數名稱", "impact": "影響", "target": "目標價位"}],
+                "sectors": [{"name": "產業名稱", "impact": "影響", "reason": "原因"}]
+            },
+            "bond_market": {
+                "government": {"impact": "影響", "yield_trend": "殖利率走勢"},
+                "corporate": {"impact": "影響", "spread_trend": "利差走勢"}
+            },
+            "forex_market": [
+                {"pair": "貨幣對", "impact": "影響", "target": "目標價位"}
+            ],
+            "commodities": [
+                {"name": "商品名稱", "impact": "影響", "target": "目標價位"}
+            ]
+        }
+    },
+    "industry_impact": {
+        "benefited": [
+            {"industry": "產業名稱", "reason": "受惠原因", "duration": "影響時長"}
+        ],
+        "damaged": [
+            {"industry": "產業名稱", "reason": "受損原因", "duration": "影響時長"}
+        ],
+        "supply_chain": {"description": "產業鏈影響說明"},
+        "competition": {"description": "競爭格局變化說明"}
+    },
+    "corporate_impact": {
+        "direct": [
+            {"company": "公司名稱", "impact": "影響", "action": "建議行動"}
+        ],
+        "indirect": [
+            {"company": "公司名稱", "impact": "影響", "action": "建議行動"}
+        ],
+        "opportunities": ["機會1", "機會2"],
+        "risks": ["風險1", "風險2"]
+    },
+    "investment_advice": {
+        "short_term": {
+            "position": ["建議1", "建議2"],
+            "risk_control": ["風控建議1", "風控建議2"],
+            "timing": ["時點建議1", "時點建議2"]
+        },
+        "long_term": {
+            "asset_allocation": ["配置建議1", "配置建議2"],
+            "sector_strategy": ["產業建議1", "產業建議2"],
+            "targets": ["投資標的1", "投資標的2"]
+        }
+    },
+    "risk_warning": {
+        "primary_risks": ["主要風險1", "主要風險2"],
+        "secondary_risks": ["次要風險1", "次要風險2"],
+        "monitoring_indicators": ["監控指標1", "監控指標2"],
+        "hedging_suggestions": ["對沖建議1", "對沖建議2"]
+    }
+}
+
+# 精簡序列化的結構模板，省去縮排空白以減少每次請求的 token
+RESULT_SCHEMA = json.dumps(RESULT_TEMPLATE, ensure_ascii=False, separators=(",", ":"))
+
+ANALYSIS_SYSTEM_PROMPT = f"""請以專業財經分析師的角度，以台灣的經濟環境看待，對使用者提供的新聞進行深入分析。
+
+請從以下維度進行分析：
+
+1. 新聞重點摘要：
+   - 核心要點（3-5點）
+   - 關鍵數據和指標
+   - 相關企業和產業
+
+2. 市場影響分析：
+   A. 總體經濟影響
+      - GDP影響
+      - 通膨影響
+      - 就業影響
+      - 消費影響
+
+   B. 金融市場影響
+      - 股市影響（主要指數、產業、個股）
+      - 債券市場影響（公債殖利率、信用債券）
+      - 匯率影響（主要貨幣對）
+      - 大宗商品影響（原物料、能源、貴金屬）
+
+3. 產業影響評估：
+   - 受惠產業及原因
+   - 受損產業及原因
+   - 產業鏈上下游影響
+   - 競爭格局變化
+
+4. 企業影響分析：
+   - 直接影響企業
+   - 間接影響企業
+   - 潛在商機與風險
+   - 企業因應策略建議
+
+5. 投資建議：
+   A. 短期策略（1-3個月）
+      - 投資部位建議
+      - 風險規避建議
+      - 操作時點建議
+
+   B. 中長期策略（3個月以上）
+      - 資產配置建議
+      - 產業布局建議
+      - 投資標的建議
+
+6. 風險提示：
+   - 主要風險因素
+   - 次要風險因素
+   - 風險監控指標
+   - 風險對沖建議
+
+請嚴格按照以下 JSON 格式返回分析結果，不要添加任何其他文字：
+{RESULT_SCHEMA}"""
+
+SUMMARY_SYSTEM_PROMPT = """請以專業財經分析師的角度，基於使用者提供的宏觀新聞分析，提供簡明的投資建議總結。
+請提供200字以內的投資建議總結，包括風險提示。"""
+
+
+def format_similar_context(similar):
+    """將相似的歷史分析（SemanticIndex.search 的結果）組成提示詞中的參考段落"""
+    lines = ["以下是過去分析過的相似事件，可作為歷史比較的參考；與本則新聞無關時請忽略："]
+    for item in similar:
+        key_points = "；".join(item["key_points"][:3])
+        lines.append(f"- {item['analyzed_at'].strftime('%Y-%m-%d')}《{item['title']}》：{key_points}")
+    return "\n".join(lines)
+
+
+def build_analysis_messages(news_text, similar=None):
+    """組合新聞分析的對話訊息：固定的系統提示在前，新聞原文在後
+
+    傳入相似的歷史分析時附在新聞之後，系統提示的前綴不變，仍可沿用上下文快取。
+    """
+    content = f"請分析以下新聞：\n\n{news_text.strip()}"
+    if similar:
+        content += "\n\n" + format_similar_context(similar)
+    return [
+        {"role": "system", "content": ANALYSIS_SYSTEM_PROMPT},
+        {"role": "user", "content": content},
+    ]
+
+
+def build_sections_messages(news_text, sections):
+    """只重新請求指定頂層區塊的對話訊息；系統提示與新聞部分與完整分析相同，可沿用上下文快取"""
+    return [
+        {"role": "system", "content": ANALYSIS_SYSTEM_PROMPT},
+        {"role": "user", "content": (
+            f"請分析以下新聞：\n\n{news_text.strip()}\n\n"
+            f"這次只需返回以下頂層欄位：{'、'.join(sections)}。其他欄位請省略，各欄位結構與上述 JSON 格式相同。"
+        )},
+    ]
+
+
+def build_summary_messages(news_text, analysis):
+    """根據已解析的分析結果組合投資建議總結的對話訊息"""
+    macro = analysis['market_impact']['macro_economy']
+    return [
+        {"role": "system", "content": SUMMARY_SYSTEM_PROMPT},
+        {"role": "user", "content": f"""核心要點: {', '.join(analysis['summary']['key_points'])}
+
+總體經濟影響:
+- GDP: {macro['gdp']['impact']}
+- 通膨: {macro['inflation']['impact']}
+- 就業: {macro['employment']['impact']}
+- 消費: {macro['consumption']['impact']}
+
+主要風險:
+{', '.join(analysis['risk_warning']['primary_risks'])}
+
+投資建議:
+短期: {', '.join(analysis['investment_advice']['short_term']['position'])}
+中長期: {', '.join(analysis['investment_advice']['long_term']['asset_allocation'])}
+
+新聞內容:
+{news_text.strip()}"""},
+    ]
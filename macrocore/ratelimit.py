@@ -0,0 +1,217 @@
+"""跨程序共用的上游 API 額度限制（GNews、DeepSeek）
+
+每個服務一個權杖桶（每分鐘額度）加上每日額度，狀態存在 SQLite 並以 BEGIN IMMEDIATE 交易更新，
+因此頁面、背景擷取程序與批次工具等多個程序共用同一份額度。
+上游回應 429 時依 Retry-After 暫停該服務，回應「額度用完」狀態碼時視為當日額度耗盡。
+額度不足時最多短暫排隊 max_wait 秒，否則立即拋出 QuotaExceededError，讓呼叫端改用備援內容，
+不把請求浪費在必定失敗的 429 上。
+"""
+import asyncio
+import contextlib
+import os
+import sqlite3
+import time
+from datetime import datetime, timedelta, timezone
+
+DEFAULT_LIMITS_PATH = os.path.join(".cache", "rate_limits.sqlite3")
+# 429 未附 Retry-After 時暫停的秒數
+DEFAULT_RETRY_AFTER = 60.0
+
+
+class QuotaExceededError(Exception):
+    """上游額度不足且無法在等待上限內取得；retry_after 為預估可再呼叫的秒數"""
+
+    def __init__(self, provider, retry_after, reason):
+        super().__init__(f"{provider} {reason}，約 {retry_after:.0f} 秒後可再呼叫")
+        self.provider = provider
+        self.retry_after = retry_after
+        self.reason = reason
+
+
+class ProviderQuota:
+    """單一服務的額度設定；None 代表不限制"""
+
+    def __init__(self, per_minute=None, per_day=None, exhausted_status=None):
+        self.per_minute = per_minute
+        self.per_day = per_day
+        # 上游以此狀態碼表示當日額度已用完（GNews 為 403）
+        self.exhausted_status = exhausted_status
+
+
+DEFAULT_QUOTAS = {
+    # GNews 免費方案每日 100 次
+    "gnews": ProviderQuota(per_minute=30, per_day=100, exhausted_status=403),
+    "deepseek": ProviderQuota(per_minute=60),
+}
+
+
+def _utc_day(now):
+    return datetime.fromtimestamp(now, timezone.utc).strftime("%Y-%m-%d")
+
+
+def _seconds_until_next_day(now):
+    current = datetime.fromtimestamp(now, timezone.utc)
+    tomorrow = (current + timedelta(days=1)).replace(hour=0, minute=0, second=0, microsecond=0)
+    return (tomorrow - current).total_seconds()
+
+
+class QuotaLimiter:
+    """以 SQLite 保存狀態的權杖桶限流器，多個程序共用同一個檔案即共用額度"""
+
+    def __init__(self, path=DEFAULT_LIMITS_PATH, quotas=None, max_wait=5.0, enabled=True):
+        self.path = path
+        self.quotas = DEFAULT_QUOTAS if quotas is None else quotas
+        self.max_wait = max_wait
+        self.enabled = enabled
+        self.rejections = 0
+        if self.enabled:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            with self._transaction() as conn:
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS quotas ("
+                    " provider TEXT PRIMARY KEY,"
+                    " tokens REAL NOT NULL,"
+                    " refilled_at REAL NOT NULL,"
+                    " day TEXT NOT NULL,"
+                    " day_used INTEGER NOT NULL,"
+                    " blocked_until REAL NOT NULL)"
+                )
+
+    @classmethod
+    def from_env(cls):
+        """依環境變數建立限流器；RATE_LIMIT_<服務>_PER_MINUTE / _PER_DAY 設為 0 代表不限制"""
+        quotas = {}
+        for provider, default in DEFAULT_QUOTAS.items():
+            prefix = f"RATE_LIMIT_{provider.upper()}"
+            per_minute = float(os.getenv(f"{prefix}_PER_MINUTE", default.per_minute or 0))
+            per_day = int(os.getenv(f"{prefix}_PER_DAY", default.per_day or 0))
+            quotas[provider] = ProviderQuota(per_minute or None, per_day or None, default.exhausted_status)
+        return cls(
+            path=os.getenv("RATE_LIMIT_PATH", DEFAULT_LIMITS_PATH),
+            quotas=quotas,
+            max_wait=float(os.getenv("RATE_LIMIT_MAX_WAIT", "5")),
+            enabled=os.getenv("RATE_LIMIT_DISABLED", "").lower() not in ("1", "true", "yes"),
+        )
+
+    @contextlib.contextmanager
+    def _transaction(self):
+        # isolation_level=None 自行控制交易；BEGIN IMMEDIATE 讓讀取-修改-寫入在程序間互斥
+        conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+        finally:
+            conn.close()
+
+    def _load(self, conn, provider, quota, now):
+        row = conn.execute(
+            "SELECT tokens, refilled_at, day, day_used, blocked_until FROM quotas WHERE provider = ?",
+            (provider,),
+        ).fetchone()
+        capacity = quota.per_minute or 0.0
+        if row is None:
+            tokens, day, day_used, blocked_until = capacity, _utc_day(now), 0, 0.0
+        else:
+            tokens, refilled_at, day, day_used, blocked_until = row
+            if quota.per_minute:
+                tokens = min(capacity, tokens + (now - refilled_at) * quota.per_minute / 60.0)
+            if day != _utc_day(now):
+                day, day_used = _utc_day(now), 0
+        return {"tokens": tokens, "day": day, "day_used": day_used, "blocked_until": blocked_until}
+
+    def _save(self, conn, provider, state, now):
+        conn.execute(
+            "INSERT OR REPLACE INTO quotas (provider, tokens, refilled_at, day, day_used, blocked_until)"
+            " VALUES (?, ?, ?, ?, ?, ?)",
+            (provider, state["tokens"], now, state["day"], state["day_used"], state["blocked_until"]),
+        )
+
+    def try_acquire(self, provider):
+        """嘗試取得一次呼叫額度；成功返回 None，否則返回 (需等待秒數, 原因)"""
+        quota = self.quotas.get(provider)
+        if not self.enabled or quota is None:
+            return None
+        now = time.time()
+        with self._transaction() as conn:
+            state = self._load(conn, provider, quota, now)
+            if quota.per_day and state["day_used"] >= quota.per_day:
+                wait = (_seconds_until_next_day(now), "今日額度已用完")
+            elif state["blocked_until"] > now:
+                wait = (state["blocked_until"] - now, "請求過於頻繁，上游要求稍後再試")
+            elif quota.per_minute and state["tokens"] < 1.0:
+                wait = ((1.0 - state["tokens"]) * 60.0 / quota.per_minute, "每分鐘額度已用完")
+            else:
+                wait = None
+                state["tokens"] -= 1.0 if quota.per_minute else 0.0
+                state["day_used"] += 1
+            self._save(conn, provider, state, now)
+        return wait
+
+    def acquire(self, provider, max_wait=None):
+        """取得一次呼叫額度，最多排隊 max_wait 秒；等不到時拋出 QuotaExceededError"""
+        max_wait = self.max_wait if max_wait is None else max_wait
+        deadline = time.monotonic() + max_wait
+        while True:
+            wait = self.try_acquire(provider)
+            if wait is None:
+                return
+            self._check_deadline(provider, wait, deadline)
+            time.sleep(wait[0])
+
+    async def acquire_async(self, provider, max_wait=None):
+        """acquire 的非同步版本，SQLite 操作移到執行緒中，排隊時不阻塞事件迴圈"""
+        max_wait = self.max_wait if max_wait is None else max_wait
+        deadline = time.monotonic() + max_wait
+        while True:
+            wait = await asyncio.to_thread(self.try_acquire, provider)
+            if wait is None:
+                return
+            self._check_deadline(provider, wait, deadline)
+            await asyncio.sleep(wait[0])
+
+    def _check_deadline(self, provider, wait, deadline):
+        seconds, reason = wait
+        if time.monotonic() + seconds > deadline:
+            self.rejections += 1
+            raise QuotaExceededError(provider, seconds, reason)
+
+    def record_response(self, provider, status_code, retry_after=None):
+        """依上游回應更新狀態：429 依 Retry-After 暫停，額度用完的狀態碼標記當日額度耗盡
+
+        返回該服務因此暫停的剩餘秒數；沒有暫停時返回 None。
+        """
+        quota = self.quotas.get(provider)
+        if not self.enabled or quota is None:
+            return None
+        if status_code != 429 and status_code != quota.exhausted_status:
+            return None
+        now = time.time()
+        with self._transaction() as conn:
+            state = self._load(conn, provider, quota, now)
+            if status_code == 429:
+                delay = DEFAULT_RETRY_AFTER if retry_after is None else retry_after
+                state["blocked_until"] = max(state["blocked_until"], now + delay)
+            else:
+                state["day_used"] = max(state["day_used"], quota.per_day or 0)
+                state["blocked_until"] = max(state["blocked_until"], now + _seconds_until_next_day(now))
+            self._save(conn, provider, state, now)
+        return max(0.0, state["blocked_until"] - now)
+
+    def remaining(self, provider):
+        """返回服務目前的剩餘額度：今日剩餘次數、本分鐘可用次數與暫停剩餘秒數（None 代表不限制）"""
+        quota = self.quotas.get(provider)
+        if not self.enabled or quota is None:
+            return {"day": None, "minute": None, "blocked_for": 0.0}
+        now = time.time()
+        with self._transaction() as conn:
+            state = self._load(conn, provider, quota, now)
+        return {
+            "day": max(0, quota.per_day - state["day_used"]) if quota.per_day else None,
+            "minute": int(state["tokens"]) if quota.per_minute else None,
+            "blocked_for": max(0.0, state["blocked_until"] - now),
+        }
@@ -0,0 +1,259 @@
+"""分析報告產生（Markdown / HTML / JSON）與批次 ZIP 匯出
+
+三種格式共用同一份報告大綱，大綱只依分析結果組成區塊，不經過 f-string 模板，
+輸出的 Markdown 不會帶入程式碼縮排；HTML 外框模板在匯入時編譯一次。
+頁面把產生函式交給下載按鈕，只有實際下載時才產生報告。
+iter_reports_zip 逐則產生報告並寫入 ZIP，邊壓縮邊輸出，不會把所有報告同時放在記憶體中。
+"""
+import html
+import json
+import string
+import textwrap
+import zipfile
+from datetime import datetime
+
+from macrocore.prompt import PROMPT_VERSION
+
+_HTML_TEMPLATE = string.Template(textwrap.dedent("""\
+    <!DOCTYPE html>
+    <html lang="zh-Hant">
+    <head>
+    <meta charset="utf-8">
+    <title>$title</title>
+    <style>
+    body { font-family: "Noto Sans TC", "Microsoft JhengHei", sans-serif; max-width: 960px; margin: 2em auto; padding: 0 1em; line-height: 1.6; color: #222; }
+    h1, h2 { border-bottom: 1px solid #ddd; padding-bottom: .3em; }
+    .news { white-space: pre-wrap; background: #f7f7f7; padding: 1em; border-radius: 4px; }
+    footer { margin-top: 3em; color: #777; font-size: .9em; }
+    </style>
+    </head>
+    <body>
+    $body
+    </body>
+    </html>
+    """))
+
+
+def _items(values, line):
+    return [line(value) for value in values]
+
+
+def report_outline(news_text, analysis, investment_advice=""):
+    """報告大綱：[(標題層級, 標題, 區塊清單)]
+
+    區塊為字串（段落）或字串清單（項目清單）；項目中的換行代表同一項目的第二行。
+    """
+    summary = analysis["summary"]
+    macro = analysis["market_impact"]["macro_economy"]
+    markets = analysis["market_impact"]["financial_markets"]
+    bonds = markets["bond_market"]
+    industry = analysis["industry_impact"]
+    corporate = analysis["corporate_impact"]
+    short_term = analysis["investment_advice"]["short_term"]
+    long_term = analysis["investment_advice"]["long_term"]
+    risk = analysis["risk_warning"]
+
+    def company(item):
+        return f"{item['company']}: {item['impact']} - {item['action']}"
+
+    def industry_item(item):
+        return f"{item['industry']} ({item['duration']}): {item['reason']}"
+
+    outline = [(1, "宏觀新聞影響分析報告", [])]
+    if news_text:
+        outline.append((2, "分析新聞", [news_text.strip()]))
+    outline += [
+        (2, "新聞重點摘要", []),
+        (3, "核心要點", [summary["key_points"]]),
+        (3, "關鍵數據", [summary["key_data"]]),
+        (3, "相關企業和產業", [summary["related_entities"]]),
+        (2, "市場影響分析", []),
+        (3, "總體經濟影響", [[
+            f"{label}: {macro[name]['impact']}\n{macro[name]['description']}"
+            for name, label in (("gdp", "GDP影響"), ("inflation", "通膨影響"),
+                                ("employment", "就業影響"), ("consumption", "消費影響"))
+        ]]),
+        (3, "金融市場影響", []),
+        (4, "股票市場", [
+            "主要指數影響:",
+            _items(markets["stock_market"]["indices"],
+                   lambda index: f"{index['name']}: {index['impact']} (目標: {index['target']})"),
+            "產業影響:",
+            _items(markets["stock_market"]["sectors"],
+                   lambda sector: f"{sector['name']}: {sector['impact']} - {sector['reason']}"),
+        ]),
+        (4, "債券市場", [[
+            f"公債市場: {bonds['government']['impact']}\n殖利率走勢: {bonds['government']['yield_trend']}",
+            f"公司債市場: {bonds['corporate']['impact']}\n利差走勢: {bonds['corporate']['spread_trend']}",
+        ]]),
+        (4, "匯市影響", [_items(markets["forex_market"],
+                              lambda pair: f"{pair['pair']}: {pair['impact']} (目標: {pair['target']})")]),
+        (4, "商品市場影響", [_items(markets["commodities"],
+                                lambda item: f"{item['name']}: {item['impact']} (目標: {item['target']})")]),
+        (2, "產業影響評估", []),
+        (3, "受惠產業", [_items(industry["benefited"], industry_item)]),
+        (3, "受損產業", [_items(industry["damaged"], industry_item)]),
+        (3, "產業鏈影響", [industry["supply_chain"]["description"]]),
+        (3, "競爭格局變化", [industry["competition"]["description"]]),
+        (2, "企業影響分析", []),
+        (3, "直接影響企業", [_items(corporate["direct"], company)]),
+        (3, "間接影響企業", [_items(corporate["indirect"], company)]),
+        (3, "潛在商機", [corporate["opportunities"]]),
+        (3, "潛在風險", [corporate["risks"]]),
+        (2, "投資建議", []),
+        (3, "短期策略 (1-3個月)", [
+            "投資部位:", short_term["position"],
+            "風險控制:", short_term["risk_control"],
+            "操作時點:", short_term["timing"],
+        ]),
+        (3, "中長期策略 (3個月以上)", [
+            "資產配置:", long_term["asset_allocation"],
+            "產業布局:", long_term["sector_strategy"],
+            "投資標的:", long_term["targets"],
+        ]),
+        (2, "風險提示", []),
+        (3, "主要風險", [risk["primary_risks"]]),
+        (3, "次要風險", [risk["secondary_risks"]]),
+        (3, "風險監控指標", [risk["monitoring_indicators"]]),
+        (3, "風險對沖建議", [risk["hedging_suggestions"]]),
+    ]
+    if investment_advice:
+        outline.append((2, "投資建議總結", [investment_advice]))
+    return outline
+
+
+def _footer_lines(generated_at):
+    return [
+        f"報告生成時間: {generated_at.strftime('%Y-%m-%d %H:%M:%S')}",
+        "由 MacroInsight 宏觀新聞分析工具生成",
+    ]
+
+
+def render_markdown(news_text, analysis, investment_advice="", generated_at=None):
+    """產生 Markdown 格式的完整分析報告"""
+    lines = []
+    for level, title, blocks in report_outline(news_text, analysis, investment_advice):
+        lines += ["#" * level + " " + title, ""]
+        for block in blocks:
+            if isinstance(block, str):
+                lines += [block, ""]
+            else:
+                # 項目的第二行縮排兩格，仍屬於同一個清單項目
+                lines += ["- " + str(item).replace("\n", "\n  ") for item in block] + [""]
+    lines.append("---")
+    lines += [f"*{line}*" for line in _footer_lines(generated_at or datetime.now())]
+    return "\n".join(lines) + "\n"
+
+
+def render_html(news_text, analysis, investment_advice="", generated_at=None, include_charts=True,
+                include_plotlyjs=True):
+    """產生單一 HTML 檔案的報告；include_plotlyjs 為 True 時內嵌 plotly.js 可離線開啟，"cdn" 時改由 CDN 載入"""
+    parts = []
+    for level, title, blocks in report_outline(news_text, analysis, investment_advice):
+        parts.append(f"<h{level}>{html.escape(title)}</h{level}>")
+        for block in blocks:
+            if isinstance(block, str):
+                css = ' class="news"' if title == "分析新聞" else ""
+                parts.append(f"<p{css}>{html.escape(block)}</p>")
+            else:
+                parts.append("<ul>" + "".join(
+                    f"<li>{html.escape(str(item)).replace(chr(10), '<br>')}</li>" for item in block
+                ) + "</ul>")
+    if include_charts:
+        import plotly.io as pio
+
+        from macrocore.charts import build_chart_specs
+
+        parts.append("<h2>視覺化分析</h2>")
+        for index, spec in enumerate(build_chart_specs(analysis).values()):
+            # 規格已是完整的 Plotly 格式，略過 plotly 的驗證；plotly.js 只需要在第一張圖表前載入一次
+            parts.append(pio.to_html(
+                spec, validate=False, full_html=False,
+                include_plotlyjs=include_plotlyjs if index == 0 else False
+            ))
+    parts.append("<footer>" + "<br>".join(html.escape(line) for line in _footer_lines(generated_at or datetime.now()))
+                 + "</footer>")
+    return _HTML_TEMPLATE.substitute(title="宏觀新聞影響分析報告", body="\n".join(parts))
+
+
+def render_json(news_text, analysis, investment_advice="", generated_at=None):
+    """產生 JSON 格式的報告，保留完整的結構化分析結果"""
+    return json.dumps({
+        "generated_at": (generated_at or datetime.now()).isoformat(timespec="seconds"),
+        "prompt_version": PROMPT_VERSION,
+        "news_text": news_text,
+        "analysis": analysis,
+        "investment_summary": investment_advice or None,
+    }, ensure_ascii=False, indent=2)
+
+
+# 格式名稱: (副檔名, MIME 類型, 產生函式)
+REPORT_FORMATS = {
+    "markdown": ("md", "text/markdown", render_markdown),
+    "html": ("html", "text/html", render_html),
+    "json": ("json", "application/json", render_json),
+}
+
+
+def render_report(fmt, news_text, analysis, investment_advice="", generated_at=None, **options):
+    """以指定格式（markdown / html / json）產生報告"""
+    return REPORT_FORMATS[fmt][2](news_text, analysis, investment_advice, generated_at, **options)
+
+
+def build_markdown_report(news_text, analysis, investment_advice):
+    """產生 Markdown 格式的完整分析報告"""
+    return render_markdown(news_text, analysis, investment_advice)
+
+
+class _ChunkWriter:
+    """收集 ZipFile 寫出的資料，由產生器逐段取出；沒有 tell/seek，ZipFile 會改用串流模式"""
+
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b"".join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def iter_reports_zip(documents, fmt="markdown", **options):
+    """將多份報告逐則寫入 ZIP 並逐段產生 bytes；documents 為 AnalysisHistory.iter_documents 的結果
+
+    每則報告產生、壓縮並輸出後即釋放，記憶體用量與報告總數無關。
+    """
+    extension = REPORT_FORMATS[fmt][0]
+    if fmt == "html":
+        # 批次匯出的每份 HTML 都內嵌 plotly.js 會讓檔案過大，預設改由 CDN 載入
+        options.setdefault("include_plotlyjs", "cdn")
+    writer = _ChunkWriter()
+    with zipfile.ZipFile(writer, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+        for document in documents:
+            analyzed_at = document["analyzed_at"]
+            analysis = document["analysis"]
+            report = render_report(
+                fmt, document.get("news_text"), analysis, analysis.get("investment_summary", ""),
+                analyzed_at, **options
+            )
+            name = f"{analyzed_at.strftime('%Y%m%d_%H%M%S')}_{document['article_id'][:12]}.{extension}"
+            with archive.open(name, "w") as entry:
+                entry.write(report.encode("utf-8"))
+            yield writer.drain()
+    # 關閉後才寫出中央目錄
+    yield writer.drain()
+
+
+def write_reports_zip(documents, fileobj, fmt="markdown", **options):
+    """將批次報告 ZIP 寫入檔案物件，返回寫入的位元組數"""
+    written = 0
+    for chunk in iter_reports_zip(documents, fmt, **options):
+        fileobj.write(chunk)
+        written += len(chunk)
+    return written
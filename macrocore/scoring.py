@@ -0,0 +1,112 @@
+"""影響程度文字轉換為數值分數
+
+以單一編譯的正規表達式一次找出影響描述中的程度詞與方向詞：
+程度詞依強度排定優先順序（同時出現時取最強者），方向詞以最先出現者為準。
+score_impacts 可一次處理整欄文字（list / numpy 陣列 / pandas Series），
+相同文字只計算一次，適合為大量歷史分析評分；numpy / pandas 只在呼叫時才載入。
+"""
+import re
+from collections import Counter
+
+# (詞彙, 程度)；清單順序即優先順序
+MAGNITUDE_TERMS = [
+    (("極大", "顯著", "強烈", "重大", "大幅", "劇烈"), 1.0),
+    (("較大", "明顯"), 0.75),
+    (("中等", "溫和", "中度"), 0.5),
+    (("較小", "輕微", "小幅"), 0.25),
+    (("極小", "微弱", "有限"), 0.1),
+]
+DIRECTION_TERMS = {
+    1: ("正面", "利多", "利好", "受惠", "上升", "上漲", "走升", "走揚", "增加", "成長", "升值", "擴張",
+        "改善", "看漲", "偏多", "提振", "推升"),
+    -1: ("負面", "利空", "不利", "受損", "下降", "下跌", "走低", "走弱", "減少", "衰退", "貶值", "收縮",
+         "惡化", "看跌", "偏空", "壓抑", "拖累", "下滑"),
+    0: ("中性", "持平", "不變", "穩定"),
+}
+# 只有方向詞時的程度（與舊版「正面/利多 = 較大」一致）；只有中性詞或無法辨識時為中等
+DIRECTIONAL_DEFAULT_MAGNITUDE = 0.75
+DEFAULT_MAGNITUDE = 0.5
+
+
+def _build_lexicon():
+    terms = {}
+    for priority, (words, magnitude) in enumerate(MAGNITUDE_TERMS):
+        for word in words:
+            terms[word] = ("magnitude", priority, magnitude)
+    for direction, words in DIRECTION_TERMS.items():
+        for word in words:
+            terms.setdefault(word, ("direction", 0, direction))
+    # 長詞優先，避免較短的詞搶先比對
+    pattern = re.compile("|".join(re.escape(word) for word in sorted(terms, key=len, reverse=True)))
+    return terms, pattern
+
+
+_TERMS, _TERM_RE = _build_lexicon()
+
+
+def score_impact(impact):
+    """將單一影響描述轉成 (程度 0~1, 方向 1/0/-1, 是否辨識出任何詞彙)"""
+    best_magnitude = None
+    direction = None
+    for match in _TERM_RE.finditer(str(impact or "")):
+        kind, priority, value = _TERMS[match.group()]
+        if kind == "magnitude":
+            if best_magnitude is None or priority < best_magnitude[0]:
+                best_magnitude = (priority, value)
+        elif direction is None:
+            direction = value
+    if best_magnitude is not None:
+        return best_magnitude[1], direction or 0, True
+    if direction is None:
+        return DEFAULT_MAGNITUDE, 0, False
+    return (DIRECTIONAL_DEFAULT_MAGNITUDE if direction else DEFAULT_MAGNITUDE), direction, True
+
+
+def convert_impact_to_score(impact):
+    """將文字影響程度轉換為數值分數（0~1，不含方向）"""
+    return score_impact(impact)[0]
+
+
+def score_impacts(impacts):
+    """一次為整欄影響描述評分
+
+    返回 magnitude（程度 0~1）、direction（1/0/-1）、signed（帶正負號的程度）與 matched（是否辨識）；
+    輸入為 pandas Series 時返回相同索引的 DataFrame，否則返回 numpy 陣列組成的字典。
+    """
+    import numpy as np
+
+    values = impacts.tolist() if hasattr(impacts, "tolist") else list(impacts)
+    # 影響描述高度重複，相同文字只比對一次
+    unique = {}
+    inverse = np.empty(len(values), dtype=np.intp)
+    for index, value in enumerate(values):
+        inverse[index] = unique.setdefault(value, len(unique))
+    scored = [score_impact(value) for value in unique]
+    magnitude = np.array([s[0] for s in scored], dtype=float)[inverse]
+    direction = np.array([s[1] for s in scored], dtype=np.int8)[inverse]
+    matched = np.array([s[2] for s in scored], dtype=bool)[inverse]
+    result = {
+        "magnitude": magnitude,
+        "direction": direction,
+        "signed": magnitude * direction,
+        "matched": matched,
+    }
+    if type(impacts).__module__.startswith("pandas"):
+        import pandas as pd
+        return pd.DataFrame(result, index=impacts.index)
+    return result
+
+
+def impact_coverage(impacts, top=20):
+    """統計詞庫的辨識率，並列出最常見的未辨識描述，供擴充詞庫參考"""
+    values = impacts.tolist() if hasattr(impacts, "tolist") else list(impacts)
+    counts = Counter(values)
+    unmatched = Counter({value: n for value, n in counts.items() if not score_impact(value)[2]})
+    total = len(values)
+    missed = sum(unmatched.values())
+    return {
+        "total": total,
+        "matched": total - missed,
+        "coverage": (total - missed) / total if total else 1.0,
+        "unmatched": unmatched.most_common(top),
+    }
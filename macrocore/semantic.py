@@ -0,0 +1,348 @@
+"""已分析新聞的語意索引（「相似的歷史事件」查詢）
+
+每則分析的新聞以可替換的本地向量模型轉成單位向量，連同標題與核心要點存入 SQLite；
+預設的 HashingEmbedder 以字元 2/3-gram 的雜湊計數組成向量，不需訓練、下載模型或連網。
+各程序在記憶體中保留向量矩陣，查詢前只讀入其他程序新寫入的列，再以 numpy 一次矩陣乘法算出
+餘弦相似度（多則查詢可批次計算）；向量數達到 ann_threshold 後改用倒排分群（IVF）的近似搜尋，
+只比對查詢最接近的幾群。numpy 只在計算時才載入。
+"""
+import contextlib
+import importlib
+import json
+import math
+import os
+import re
+import sqlite3
+import threading
+from datetime import datetime, timezone
+
+from macrocore.dedup import clean_news_text
+
+# 維度過低時雜湊碰撞的雜訊會蓋過短新聞之間的相似度
+DEFAULT_EMBEDDING_DIM = 1024
+DEFAULT_MAX_ENTRIES = 30000
+# 向量數達到此數量時改用近似搜尋
+DEFAULT_ANN_THRESHOLD = 10000
+_TITLE_RE = re.compile(r"\*\*新聞標題[:：]\*\*\s*([^\n]+)")
+_MASK = (1 << 64) - 1
+
+
+def _fmix64(h):
+    import numpy as np
+
+    # MurmurHash3 的最終混合步驟，讓相鄰的多項式雜湊值均勻分散到各維度
+    h ^= h >> np.uint64(33)
+    h *= np.uint64(0xFF51AFD7ED558CCD)
+    h ^= h >> np.uint64(33)
+    h *= np.uint64(0xC4CEB9FE1A85EC53)
+    h ^= h >> np.uint64(33)
+    return h
+
+
+class HashingEmbedder:
+    """字元 n-gram 雜湊向量（hashing trick）：n-gram 依雜湊值累加到固定維度並帶正負號以抵銷碰撞"""
+
+    def __init__(self, dim=DEFAULT_EMBEDDING_DIM, ngram_sizes=(2, 3)):
+        self.dim = dim
+        self.ngram_sizes = tuple(ngram_sizes)
+        # 模型名稱寫入索引，更換模型或維度後舊向量不會被混用
+        self.name = f"hashing-{dim}-" + "-".join(str(size) for size in self.ngram_sizes)
+
+    def _hashes(self, codes, size):
+        import numpy as np
+
+        count = len(codes) - size + 1
+        if count <= 0:
+            return np.empty(0, dtype=np.uint64)
+        h = codes[:count].copy()
+        for offset in range(1, size):
+            h = h * np.uint64(1000003) + codes[offset:offset + count]
+        # 不同長度的 n-gram 使用不同的種子
+        h ^= np.uint64(size * 0x9E3779B97F4A7C15 & _MASK)
+        return _fmix64(h)
+
+    def embed(self, texts):
+        """將多則文本轉成 (則數, dim) 的 float32 單位向量矩陣；空文本為零向量"""
+        import numpy as np
+
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            text = clean_news_text(text)
+            codes = np.frombuffer(text.encode("utf-32-le"), dtype=np.uint32).astype(np.uint64)
+            hashes = np.concatenate([self._hashes(codes, size) for size in self.ngram_sizes])
+            if not len(hashes):
+                continue
+            signs = np.where(hashes >> np.uint64(63), -1.0, 1.0)
+            counts = np.bincount((hashes % np.uint64(self.dim)).astype(np.intp), weights=signs, minlength=self.dim)
+            # 次線性詞頻：重複多次的 n-gram 不會主導整個向量
+            vectors[row] = np.sign(counts) * np.log1p(np.abs(counts))
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        np.divide(vectors, norms, out=vectors, where=norms > 0)
+        return vectors
+
+
+def load_embedder(spec=None):
+    """依「模組:工廠函式」建立向量模型，未指定時使用 HashingEmbedder
+
+    自訂模型需提供 name 屬性與 embed(texts) 方法（返回單位向量矩陣）。
+    """
+    if not spec:
+        return HashingEmbedder()
+    module_name, _, factory = spec.partition(":")
+    return getattr(importlib.import_module(module_name), factory or "Embedder")()
+
+
+def news_title(news_text, limit=80):
+    """取得新聞標題；format_news_text 組成的文本取標題欄位，否則取第一個非空行"""
+    match = _TITLE_RE.search(news_text or "")
+    if match:
+        title = match.group(1)
+    else:
+        title = next((line for line in (news_text or "").splitlines() if line.strip()), "")
+    title = title.strip()
+    return title if len(title) <= limit else title[:limit - 1] + "…"
+
+
+class IVFIndex:
+    """倒排分群（IVF）近似搜尋：以球面 k-means 將向量分群，查詢時只比對最接近的 n_probe 群
+
+    建立後新增的向量不重新分群，查詢時逐一比對；由 SemanticIndex 在新增過多時重建。
+    """
+
+    def __init__(self, vectors, n_lists=None, n_probe=8, iterations=8, seed=0):
+        import numpy as np
+
+        self.size = len(vectors)
+        self.n_lists = n_lists or max(1, int(math.sqrt(self.size)))
+        self.n_probe = min(n_probe, self.n_lists)
+        rng = np.random.default_rng(seed)
+        # 以抽樣訓練群中心，每群約 64 個樣本已足夠
+        sample = vectors[rng.choice(self.size, min(self.size, self.n_lists * 64), replace=False)]
+        centroids = sample[rng.choice(len(sample), self.n_lists, replace=False)].copy()
+        for _ in range(iterations):
+            labels = np.argmax(sample @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, labels, sample)
+            norms = np.linalg.norm(sums, axis=1, keepdims=True)
+            # 沒有分到樣本的群保留原中心
+            centroids = np.where(norms > 0, sums / np.maximum(norms, 1e-12), centroids).astype(np.float32)
+        self.centroids = centroids
+        labels = np.concatenate([
+            np.argmax(vectors[start:start + 8192] @ centroids.T, axis=1)
+            for start in range(0, self.size, 8192)
+        ])
+        self.order = np.argsort(labels, kind="stable")
+        self.offsets = np.searchsorted(labels[self.order], np.arange(self.n_lists + 1))
+
+    def candidates(self, query, total):
+        """返回查詢向量需要比對的向量位置：最接近的 n_probe 群，以及建立後新增的向量"""
+        import numpy as np
+
+        scores = self.centroids @ query
+        probe = np.argpartition(-scores, self.n_probe - 1)[:self.n_probe]
+        return np.concatenate(
+            [self.order[self.offsets[i]:self.offsets[i + 1]] for i in probe] + [np.arange(self.size, total)]
+        )
+
+
+def _top_k(scores, k):
+    import numpy as np
+
+    if len(scores) <= k:
+        return np.argsort(-scores, kind="stable")
+    top = np.argpartition(-scores, k - 1)[:k]
+    return top[np.argsort(-scores[top], kind="stable")]
+
+
+class SemanticIndex:
+    """已分析新聞的向量索引，以 SQLite 保存；多個程序可同時寫入與查詢"""
+
+    def __init__(self, path, embedder=None, max_entries=DEFAULT_MAX_ENTRIES, ann_threshold=DEFAULT_ANN_THRESHOLD):
+        self.path = path
+        self.embedder = embedder or HashingEmbedder()
+        self.max_entries = max_entries
+        self.ann_threshold = ann_threshold
+        self._lock = threading.Lock()
+        self._reset()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings ("
+                " key TEXT PRIMARY KEY,"
+                " model TEXT NOT NULL,"
+                " analyzed_at REAL NOT NULL,"
+                " title TEXT NOT NULL,"
+                " key_points TEXT NOT NULL,"
+                " vector BLOB NOT NULL)"
+            )
+
+    @contextlib.contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=10)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def _reset(self):
+        # 記憶體中的向量矩陣（容量倍增）與對應的中繼資料
+        self._vectors = None
+        self._size = 0
+        self._entries = []
+        self._positions = {}
+        self._rows_seen = 0
+        self._last_rowid = 0
+        self._ivf = None
+
+    def add(self, key, news_text, analysis, analyzed_at=None):
+        """記錄一則分析；同一個鍵再次寫入時取代舊的向量"""
+        self.add_many([(key, news_text, analysis, analyzed_at)])
+
+    def add_many(self, items):
+        """批次記錄 [(鍵, 新聞文本, 分析結果, 分析時間)]，返回寫入的筆數"""
+        if not items:
+            return 0
+        texts = []
+        for _, news_text, analysis, _ in items:
+            key_points = analysis.get("summary", {}).get("key_points", [])
+            # 沒有新聞原文時以核心要點代表這則分析
+            texts.append(news_text or "\n".join(key_points))
+        vectors = self.embedder.embed(texts)
+        rows = []
+        for (key, news_text, analysis, analyzed_at), vector in zip(items, vectors):
+            analyzed_at = analyzed_at or datetime.now(timezone.utc)
+            key_points = analysis.get("summary", {}).get("key_points", [])
+            rows.append((
+                key, self.embedder.name, analyzed_at.timestamp(), news_title(news_text),
+                json.dumps(key_points, ensure_ascii=False), vector.astype("float32").tobytes(),
+            ))
+        with self._connect() as conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, model, analyzed_at, title, key_points, vector)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                rows,
+            )
+            self._evict(conn)
+        return len(rows)
+
+    def _evict(self, conn):
+        (count,) = conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()
+        if count <= self.max_entries:
+            return
+        # 一次刪到上限的九成，避免之後每次寫入都讓各程序重新載入整個矩陣
+        conn.execute(
+            "DELETE FROM embeddings WHERE key IN (SELECT key FROM embeddings ORDER BY analyzed_at LIMIT ?)",
+            (count - int(self.max_entries * 0.9),),
+        )
+
+    def clear(self):
+        """清空索引，供由歷史庫重建時使用"""
+        with self._connect() as conn:
+            conn.execute("DELETE FROM embeddings")
+        with self._lock:
+            self._reset()
+
+    def _append(self, rows):
+        import numpy as np
+
+        dim = None
+        for _, key, analyzed_at, title, key_points, vector in rows:
+            vector = np.frombuffer(vector, dtype=np.float32)
+            dim = len(vector)
+            if self._vectors is None:
+                self._vectors = np.zeros((max(1024, len(rows)), dim), dtype=np.float32)
+            if key in self._positions:
+                # 同一鍵被其他程序取代：原位置改為零向量，不會再被查到
+                self._vectors[self._positions[key]] = 0
+            if self._size == len(self._vectors):
+                self._vectors = np.concatenate([self._vectors, np.zeros_like(self._vectors)])
+            self._vectors[self._size] = vector
+            self._positions[key] = self._size
+            self._entries.append((key, analyzed_at, title, key_points))
+            self._size += 1
+
+    def _refresh(self):
+        """讀入其他程序新寫入的向量；有列被刪除或取代時重新載入整個索引"""
+        with self._connect() as conn:
+            total, last_rowid = conn.execute("SELECT COUNT(*), COALESCE(MAX(rowid), 0) FROM embeddings").fetchone()
+            if total == self._rows_seen and last_rowid == self._last_rowid:
+                return
+            rows = conn.execute(
+                "SELECT rowid, key, analyzed_at, title, key_points, vector FROM embeddings"
+                " WHERE rowid > ? AND model = ? ORDER BY rowid",
+                (self._last_rowid, self.embedder.name),
+            ).fetchall()
+            (added,) = conn.execute("SELECT COUNT(*) FROM embeddings WHERE rowid > ?", (self._last_rowid,)).fetchone()
+            if self._rows_seen + added != total:
+                self._reset()
+                rows = conn.execute(
+                    "SELECT rowid, key, analyzed_at, title, key_points, vector FROM embeddings"
+                    " WHERE model = ? ORDER BY rowid",
+                    (self.embedder.name,),
+                ).fetchall()
+        self._append(rows)
+        self._rows_seen = total
+        self._last_rowid = last_rowid
+
+    def __len__(self):
+        with self._lock:
+            self._refresh()
+            return self._size
+
+    def _candidates(self, query, exact):
+        if exact or self._size < self.ann_threshold:
+            self._ivf = None
+            return None
+        # 建立後新增超過兩成時重新分群
+        if self._ivf is None or self._size - self._ivf.size > self._ivf.size * 0.2:
+            self._ivf = IVFIndex(self._vectors[:self._size])
+        return self._ivf.candidates(query, self._size)
+
+    def search(self, news_text, k=5, exclude=(), min_similarity=0.0, exact=False):
+        """返回與新聞最相似的 k 則已分析新聞，依相似度由高到低排列"""
+        return self.search_batch([news_text], k, exclude, min_similarity, exact)[0]
+
+    def search_batch(self, texts, k=5, exclude=(), min_similarity=0.0, exact=False):
+        """批次查詢多則新聞，每則返回 [{"key", "similarity", "analyzed_at", "title", "key_points"}]
+
+        exclude 為不列入結果的鍵（例如新聞本身）；exact=True 時一律以完整矩陣計算。
+        """
+        import numpy as np
+
+        if isinstance(exclude, str):
+            exclude = {exclude}
+        queries = self.embedder.embed(texts)
+        with self._lock:
+            self._refresh()
+            if not self._size:
+                return [[] for _ in texts]
+            vectors = self._vectors[:self._size]
+            if exact or self._size < self.ann_threshold:
+                # 全部查詢一次矩陣乘法
+                all_scores = queries @ vectors.T
+            results = []
+            for row, query in enumerate(queries):
+                candidates = self._candidates(query, exact)
+                if candidates is None:
+                    positions, scores = None, all_scores[row]
+                else:
+                    positions, scores = candidates, vectors[candidates] @ query
+                hits = []
+                for index in _top_k(scores, k + len(exclude)):
+                    position = int(index if positions is None else positions[index])
+                    key, analyzed_at, title, key_points = self._entries[position]
+                    similarity = float(scores[index])
+                    if key in exclude or self._positions.get(key) != position:
+                        continue
+                    if similarity < min_similarity or len(hits) == k:
+                        break
+                    hits.append({
+                        "key": key,
+                        "similarity": similarity,
+                        "analyzed_at": datetime.fromtimestamp(analyzed_at, timezone.utc),
+                        "title": title,
+                        "key_points": json.loads(key_points),
+                    })
+                results.append(hits)
+        return results
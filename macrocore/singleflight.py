@@ -0,0 +1,210 @@
+"""相同請求的並行合併（single-flight）
+
+同一程序內，相同鍵的後到呼叫直接等待第一個呼叫的結果；
+跨程序則以每個鍵一個檔案鎖排隊，拿到鎖的程序應先重新查詢共用快取，
+因此 N 個同時送出的相同分析只會呼叫一次 DeepSeek。
+"""
+import asyncio
+import os
+import threading
+import time
+from concurrent.futures import Future
+
+DEFAULT_LOCK_DIR = os.path.join(".cache", "singleflight")
+# 超過此秒數未更新的鎖檔視為殘留，建立新鎖時順手清除（只清除沒有程序持有的鎖檔）
+STALE_LOCK_SECONDS = 3600
+
+
+class KeyFileLock:
+    """以檔案鎖實作的跨程序互斥鎖（POSIX 使用 fcntl，Windows 使用 msvcrt）"""
+
+    def __init__(self, lock_dir, key):
+        self.path = os.path.join(lock_dir, f"{key}.lock")
+        self._file = None
+
+    def try_acquire(self):
+        """嘗試取得鎖，不阻塞"""
+        while True:
+            handle = open(self.path, "a+")
+            try:
+                if os.name == "nt":
+                    import msvcrt
+                    handle.seek(0)
+                    msvcrt.locking(handle.fileno(), msvcrt.LK_NBLCK, 1)
+                else:
+                    import fcntl
+                    fcntl.flock(handle.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                handle.close()
+                return False
+            if os.name == "nt" or self._is_current(handle):
+                self._file = handle
+                return True
+            # 開啟後鎖檔被清除殘留鎖的程序刪除，鎖住的已是不存在的檔案，改鎖新建立的檔案
+            handle.close()
+
+    def _is_current(self, handle):
+        try:
+            return os.fstat(handle.fileno()).st_ino == os.stat(self.path).st_ino
+        except FileNotFoundError:
+            return False
+
+    def remove_if_idle(self):
+        """沒有程序持有時刪除鎖檔，返回是否刪除"""
+        if not self.try_acquire():
+            return False
+        try:
+            if os.name != "nt":
+                # 持有鎖時刪除；正在等待的程序取得鎖後會發現檔案已刪除，改鎖新建立的檔案
+                os.remove(self.path)
+        finally:
+            self.release()
+        if os.name == "nt":
+            # Windows 無法刪除其他程序開啟中的檔案，此時刪除失敗並拋出 OSError
+            os.remove(self.path)
+        return True
+
+    def acquire(self, timeout, poll_interval=0.2):
+        """阻塞等待取得鎖，逾時返回 False"""
+        deadline = time.monotonic() + timeout
+        while not self.try_acquire():
+            if time.monotonic() >= deadline:
+                return False
+            time.sleep(poll_interval)
+        return True
+
+    async def acquire_async(self, timeout, poll_interval=0.2):
+        """acquire 的非同步版本，等待期間不佔用執行緒"""
+        deadline = time.monotonic() + timeout
+        while not self.try_acquire():
+            if time.monotonic() >= deadline:
+                return False
+            await asyncio.sleep(poll_interval)
+        return True
+
+    def release(self):
+        if self._file is None:
+            return
+        try:
+            if os.name == "nt":
+                import msvcrt
+                self._file.seek(0)
+                msvcrt.locking(self._file.fileno(), msvcrt.LK_UNLCK, 1)
+            else:
+                import fcntl
+                fcntl.flock(self._file.fileno(), fcntl.LOCK_UN)
+        finally:
+            self._file.close()
+            self._file = None
+
+
+class _SingleFlightBase:
+    def __init__(self, lock_dir=DEFAULT_LOCK_DIR, lock_timeout=300.0):
+        self.lock_dir = lock_dir
+        self.lock_timeout = lock_timeout
+        self.leaders = 0
+        self.followers = 0
+        self._last_prune = 0.0
+        if lock_dir:
+            os.makedirs(lock_dir, exist_ok=True)
+
+    @classmethod
+    def from_env(cls):
+        """依環境變數建立實例；SINGLEFLIGHT_LOCK_DIR 設為空字串時只合併程序內的呼叫"""
+        return cls(lock_dir=os.getenv("SINGLEFLIGHT_LOCK_DIR", DEFAULT_LOCK_DIR))
+
+    def _file_lock(self, key):
+        if not self.lock_dir:
+            return None
+        now = time.time()
+        if now - self._last_prune > STALE_LOCK_SECONDS:
+            self._last_prune = now
+            self._prune(now)
+        return KeyFileLock(self.lock_dir, key)
+
+    def _prune(self, now):
+        for name in os.listdir(self.lock_dir):
+            if not name.endswith(".lock"):
+                continue
+            try:
+                # 開啟鎖檔不會更新修改時間，長時間持有的鎖也可能過期，因此只刪除能立即取得的鎖
+                if now - os.path.getmtime(os.path.join(self.lock_dir, name)) > STALE_LOCK_SECONDS:
+                    KeyFileLock(self.lock_dir, name[:-len(".lock")]).remove_if_idle()
+            except OSError:
+                pass
+
+
+class SingleFlight(_SingleFlightBase):
+    """執行緒版本：do(key, func) 返回 (結果, 是否共用他人的結果)"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def do(self, key, func):
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = Future()
+                self._calls[key] = future
+                self.leaders += 1
+            else:
+                self.followers += 1
+        if not leader:
+            return future.result(), True
+
+        try:
+            file_lock = self._file_lock(key)
+            # 等不到鎖（例如其他程序卡住）時仍自行執行，寧可重複呼叫也不無限等待
+            locked = file_lock is not None and file_lock.acquire(self.lock_timeout)
+            try:
+                result = func()
+            finally:
+                if locked:
+                    file_lock.release()
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result, False
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+
+
+class AsyncSingleFlight(_SingleFlightBase):
+    """asyncio 版本：await do(key, coroutine_function) 返回 (結果, 是否共用他人的結果)"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._calls = {}
+
+    async def do(self, key, func):
+        future = self._calls.get(key)
+        if future is not None:
+            self.followers += 1
+            return await asyncio.shield(future), True
+
+        self.leaders += 1
+        future = asyncio.get_running_loop().create_future()
+        self._calls[key] = future
+        try:
+            file_lock = self._file_lock(key)
+            locked = file_lock is not None and await file_lock.acquire_async(self.lock_timeout)
+            try:
+                result = await func()
+            finally:
+                if locked:
+                    file_lock.release()
+        except BaseException as e:
+            future.set_exception(e)
+            future.exception()  # 沒有其他等待者時避免 "exception was never retrieved" 警告
+            raise
+        else:
+            future.set_result(result)
+            return result, False
+        finally:
+            self._calls.pop(key, None)
@@ -0,0 +1,105 @@
+"""串流 JSON 的增量解析：頂層欄位一完成即可使用"""
+import json
+
+
+class SectionStreamParser:
+    """逐段餵入模型輸出，於每個頂層欄位結束時返回 (欄位名稱, 值)
+
+    會略過第一個 "{" 之前的任何文字（例如 ```json 標記），
+    並追蹤字串與跳脫字元，避免把字串內的括號誤判為結構。
+    """
+
+    def __init__(self):
+        self.sections = {}
+        self.done = False
+        self.failed_sections = []
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._key_chars = None
+        self._key = None
+        self._value_chars = None
+
+    @property
+    def complete(self):
+        """根物件已結束且所有欄位都成功解析"""
+        return self.done and not self.failed_sections
+
+    def feed(self, text):
+        """餵入新的文字片段，返回本次完成的頂層欄位列表"""
+        completed = []
+        for ch in text:
+            if self.done:
+                break
+            if self._depth == 0:
+                if ch == "{":
+                    self._depth = 1
+                continue
+
+            if self._in_string:
+                self._append(ch)
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+                    if self._value_chars is None and self._key_chars is not None:
+                        self._key = json.loads("".join(self._key_chars))
+                        self._key_chars = None
+                continue
+
+            if ch == '"':
+                if self._depth == 1 and self._value_chars is None:
+                    self._key_chars = []
+                self._in_string = True
+                self._append(ch)
+                continue
+
+            if self._value_chars is None:
+                # 位於根物件內、尚未進入欄位值：等待冒號或根物件結束
+                if ch == ":" and self._key is not None:
+                    self._value_chars = []
+                elif ch == "}":
+                    self.done = True
+                continue
+
+            if ch in "{[":
+                self._depth += 1
+                self._value_chars.append(ch)
+            elif ch in "}]":
+                if self._depth == 1:
+                    # 純量值後直接結束根物件
+                    self._finish(completed)
+                    self.done = True
+                    continue
+                self._depth -= 1
+                self._value_chars.append(ch)
+                if self._depth == 1:
+                    self._finish(completed)
+            elif ch == "," and self._depth == 1:
+                self._finish(completed)
+            else:
+                self._value_chars.append(ch)
+        return completed
+
+    def _append(self, ch):
+        if self._value_chars is not None:
+            self._value_chars.append(ch)
+        elif self._key_chars is not None:
+            self._key_chars.append(ch)
+
+    def _finish(self, completed):
+        raw_value = "".join(self._value_chars).strip()
+        key = self._key
+        self._key = None
+        self._value_chars = None
+        if not raw_value:
+            return
+        try:
+            value = json.loads(raw_value)
+        except ValueError:
+            self.failed_sections.append(key)
+            return
+        self.sections[key] = value
+        completed.append((key, value))
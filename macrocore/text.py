@@ -0,0 +1,21 @@
+"""新聞文本正規化與內容雜湊"""
+import hashlib
+import re
+import unicodedata
+
+_WHITESPACE_RE = re.compile(r"\s+")
+
+
+def normalize_news_text(text):
+    """正規化新聞文本：全形轉半形、合併空白、英文字母轉小寫"""
+    text = unicodedata.normalize("NFKC", text or "")
+    return _WHITESPACE_RE.sub(" ", text).strip().lower()
+
+
+def content_hash(*parts):
+    """計算多個欄位依序組合後的 SHA-256 雜湊"""
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(str(part).encode("utf-8"))
+        digest.update(b"\x1f")  # 欄位分隔，避免 ("ab", "c") 與 ("a", "bc") 碰撞
+    return digest.hexdigest()
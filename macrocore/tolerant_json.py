@@ -0,0 +1,225 @@
+"""容錯 JSON 解析與結構模板校正
+
+模型輸出常見的問題：多餘的逗號、在 max_tokens 處被截斷、JSON 前後夾雜說明文字、字串內含換行。
+loads_tolerant 單次掃描解析第一個物件，遇到截斷時保留已完成的部分並標記未完成的頂層欄位；
+conform_to_template 依模板補齊缺少的欄位並修正型別不符的值。
+"""
+import json
+import re
+import threading
+
+_NUMBER_RE = re.compile(r"-?(?:0|[1-9]\d*)(?:\.\d+)?(?:[eE][-+]?\d+)?")
+_LITERALS = {"true": True, "false": False, "null": None}
+_WHITESPACE = " \t\r\n"
+# 模板中字串葉節點缺值時的預設文字
+MISSING_TEXT = "未提供"
+
+
+class _Truncated(Exception):
+    """輸入在值完成前結束；partial 為已解析的部分容器"""
+
+    def __init__(self, partial=None):
+        super().__init__()
+        self.partial = partial
+
+
+class _Malformed(_Truncated):
+    """遇到無法解析的內容，處理方式與截斷相同：保留之前完成的部分"""
+
+
+class _Parser:
+    def __init__(self, text):
+        self.text = text
+        self.pos = 0
+
+    def skip(self):
+        text, pos = self.text, self.pos
+        while pos < len(text) and text[pos] in _WHITESPACE:
+            pos += 1
+        self.pos = pos
+        if pos >= len(text):
+            raise _Truncated()
+        return text[pos]
+
+    def value(self):
+        ch = self.skip()
+        if ch == "{":
+            return self.obj()
+        if ch == "[":
+            return self.array()
+        if ch == '"':
+            return self.string()
+        match = _NUMBER_RE.match(self.text, self.pos)
+        if match:
+            self.pos = match.end()
+            if self.pos >= len(self.text):
+                raise _Truncated()  # 數字可能還沒輸出完
+            return json.loads(match.group())
+        for literal, value in _LITERALS.items():
+            if self.text.startswith(literal, self.pos):
+                self.pos += len(literal)
+                return value
+            if literal.startswith(self.text[self.pos:]):
+                raise _Truncated()
+        raise _Malformed()
+
+    def string(self):
+        try:
+            # strict=False 容許字串內直接出現換行等控制字元
+            value, self.pos = json.decoder.scanstring(self.text, self.pos + 1, False)
+        except json.JSONDecodeError as e:
+            if "Unterminated" in e.msg:
+                raise _Truncated()
+            raise _Malformed()
+        return value
+
+    def obj(self, on_member=None):
+        self.pos += 1
+        result = {}
+        while True:
+            try:
+                ch = self.skip()
+                if ch == "}":
+                    self.pos += 1
+                    return result
+                if ch == ",":
+                    # 容許多餘或結尾的逗號
+                    self.pos += 1
+                    continue
+                if ch != '"':
+                    raise _Malformed()
+                key = self.string()
+                if self.skip() != ":":
+                    raise _Malformed()
+                self.pos += 1
+            except _Truncated as e:
+                raise type(e)(result)
+            try:
+                result[key] = self.value()
+            except _Truncated as e:
+                # 截斷的容器保留已完成的部分，截斷的純量直接捨棄
+                if e.partial is not None:
+                    result[key] = e.partial
+                if on_member is not None:
+                    on_member(key, False)
+                raise type(e)(result)
+            if on_member is not None:
+                on_member(key, True)
+
+    def array(self):
+        self.pos += 1
+        result = []
+        while True:
+            try:
+                ch = self.skip()
+            except _Truncated as e:
+                raise type(e)(result)
+            if ch == "]":
+                self.pos += 1
+                return result
+            if ch == ",":
+                self.pos += 1
+                continue
+            try:
+                result.append(self.value())
+            except _Truncated as e:
+                if e.partial is not None:
+                    result.append(e.partial)
+                raise type(e)(result)
+
+
+def loads_tolerant(text):
+    """解析文字中的第一個 JSON 物件，返回 (物件, 未完成或無法解析的頂層欄位清單, 是否完整)
+
+    略過物件前後的任何文字；找不到物件時返回 (None, [], False)。
+    解析中途遇到無法辨識的內容時，之前完成的頂層欄位仍會保留。
+    """
+    start = text.find("{")
+    if start < 0:
+        return None, [], False
+    parser = _Parser(text)
+    parser.pos = start
+    broken = []
+
+    def on_member(key, complete):
+        if not complete:
+            broken.append(key)
+
+    try:
+        return parser.obj(on_member), broken, True
+    except _Truncated as e:
+        # 截斷或無法解析：保留之前完成的頂層欄位
+        return e.partial if e.partial is not None else {}, broken, False
+
+
+def conform_to_template(value, template, path=""):
+    """依模板校正結構，返回 (校正後的值, 補上預設值的路徑清單)
+
+    模板為字典時逐一檢查欄位（模型多給的欄位保留），為清單時以第一個元素作為每個項目的模板，
+    字串葉節點缺值時填入 MISSING_TEXT，清單缺值時填入空清單。
+    """
+    filled = []
+    if isinstance(template, dict):
+        if not isinstance(value, dict):
+            value = {}
+            if path:
+                filled.append(path)
+        result = dict(value)
+        for key, sub_template in template.items():
+            sub_path = f"{path}.{key}" if path else key
+            if key not in value:
+                result[key], _ = conform_to_template(None, sub_template, sub_path)
+                filled.append(sub_path)
+            else:
+                result[key], sub_filled = conform_to_template(value[key], sub_template, sub_path)
+                filled.extend(sub_filled)
+        return result, filled
+    if isinstance(template, list):
+        if not isinstance(value, list):
+            if value is not None:
+                filled.append(path)
+            return [], filled
+        if not template:
+            return value, filled
+        result = []
+        for index, item in enumerate(value):
+            item, sub_filled = conform_to_template(item, template[0], f"{path}[{index}]")
+            result.append(item)
+            filled.extend(sub_filled)
+        return result, filled
+    if isinstance(value, (dict, list)) or value is None:
+        if value is not None:
+            filled.append(path)
+        return MISSING_TEXT, filled
+    return value if isinstance(value, str) else str(value), filled
+
+
+class ParseStats:
+    """模型輸出解析結果統計，執行緒安全
+
+    clean：直接解析成功；repaired：經容錯解析或補預設值後成功；
+    sections_requested：僅重新請求部分區塊；failed：完全無法取得結果。
+    """
+
+    OUTCOMES = ("clean", "repaired", "sections_requested", "failed")
+
+    def __init__(self):
+        self._counts = dict.fromkeys(self.OUTCOMES, 0)
+        self._lock = threading.Lock()
+
+    def record(self, outcome):
+        with self._lock:
+            self._counts[outcome] += 1
+
+    def snapshot(self):
+        """返回各結果次數與失敗率（需要修復或失敗的比例）"""
+        with self._lock:
+            counts = dict(self._counts)
+        total = sum(counts.values())
+        counts["total"] = total
+        counts["failure_rate"] = (total - counts["clean"]) / total if total else 0.0
+        return counts
+
+
+# 程序內共用的統計
+parse_stats = ParseStats()
@@ -0,0 +1,68 @@
+"""DeepSeek token 用量統計
+
+每次實際呼叫 API 記錄輸入、輸出與上下文快取命中/未命中的 token 數，
+用來衡量穩定提示詞前綴帶來的延遲與費用節省。
+"""
+import threading
+import time
+
+USAGE_FIELDS = (
+    "prompt_tokens",
+    "completion_tokens",
+    "prompt_cache_hit_tokens",
+    "prompt_cache_miss_tokens",
+)
+
+
+def normalize_usage(usage):
+    """只保留關心的四個欄位，缺少的補 0；未回傳用量時返回 None"""
+    if not usage:
+        return None
+    return {field: int(usage.get(field) or 0) for field in USAGE_FIELDS}
+
+
+def cache_hit_ratio(usage):
+    """輸入 token 中命中上下文快取的比例"""
+    hit = usage.get("prompt_cache_hit_tokens", 0)
+    total = hit + usage.get("prompt_cache_miss_tokens", 0)
+    return hit / total if total else 0.0
+
+
+class UsageTracker:
+    """累計各類呼叫（analysis / summary）的 token 用量與耗時，執行緒安全"""
+
+    def __init__(self, max_records=1000):
+        self.max_records = max_records
+        self.records = []
+        self._totals = {}
+        self._lock = threading.Lock()
+
+    def record(self, kind, usage, elapsed=None):
+        """記錄一次 API 呼叫，返回正規化後的用量"""
+        usage = normalize_usage(usage)
+        if usage is None:
+            return None
+        with self._lock:
+            totals = self._totals.get(kind)
+            if totals is None:
+                totals = self._totals[kind] = dict.fromkeys(("calls", "elapsed") + USAGE_FIELDS, 0)
+            totals["calls"] += 1
+            totals["elapsed"] += elapsed or 0.0
+            for field in USAGE_FIELDS:
+                totals[field] += usage[field]
+            self.records.append(dict(usage, kind=kind, elapsed=elapsed, recorded_at=time.time()))
+            # 只保留最近的明細，累計值不受影響
+            del self.records[:-self.max_records]
+        return usage
+
+    def totals(self):
+        """各類呼叫的累計用量，附上上下文快取命中率"""
+        with self._lock:
+            return {
+                kind: dict(totals, cache_hit_ratio=cache_hit_ratio(totals))
+                for kind, totals in self._totals.items()
+            }
+
+
+# 程序內共用的統計
+usage_tracker = UsageTracker()
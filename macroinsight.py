@@ -1,25 +1,101 @@
 import streamlit as st
-import requests
-import json
+import functools
+import io
 import os
-from datetime import datetime
-import pandas as pd
-import plotly.graph_objects as go
+from datetime import datetime, timedelta, timezone
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
-import re
+
+from macrocore.analysis import (
+    AnalysisError,
+    analysis_key,
+    format_news_text,
+    request_analysis,
+    request_investment_summary,
+)
+from macrocore.batch import run_bounded
+from macrocore.cache import AnalysisCache
+from macrocore.charts import (
+    build_aggregate_radar_figure,
+    build_chart_specs,
+    build_impact_heatmap_figure,
+)
+from macrocore.dedup import NearDuplicateIndex, group_near_duplicates
+from macrocore.history import AnalysisHistory
+from macrocore.httpclient import CircuitOpenError, get_http_client
+from macrocore.metrics import configure_logging, metrics, start_metrics_server
+from macrocore.news import DEFAULT_NEWS_QUERY, ArticleStore, GNewsError, refresh_news
+from macrocore.ratelimit import QuotaExceededError
+from macrocore.report import REPORT_FORMATS, render_report, write_reports_zip
+from macrocore.singleflight import SingleFlight
 
 # 載入 .env 文件
 load_dotenv()
 
-@st.cache_data(ttl=3600)  # 快取1小時
-def get_realtime_taiwan_news():
-    """獲取台灣即時新聞"""
-    gnews_api_key = os.getenv("GNEWS_API_KEY")
-    today = datetime.now().strftime("%Y年%m月%d日")
+# 文章庫超過此秒數未更新（背景擷取程序未執行）時，頁面在背景補抓新聞
+NEWS_REFRESH_SECONDS = int(os.getenv("NEWS_REFRESH_SECONDS", "3600"))
+# 新聞列表顯示的最新文章數
+NEWS_LIST_SIZE = int(os.getenv("NEWS_LIST_SIZE", "12"))
+# 每個 session 保留的分析結果數
+MAX_SESSION_RESULTS = int(os.getenv("MAX_SESSION_RESULTS", "10"))
+# 顯示的相似歷史分析則數
+SIMILAR_ANALYSES = int(os.getenv("SIMILAR_ANALYSES", "5"))
+# 低於此相似度的歷史分析視為無關，不顯示也不附在提示詞中
+SIMILAR_MIN_SIMILARITY = float(os.getenv("SIMILAR_MIN_SIMILARITY", "0.1"))
+# 報告下載格式與按鈕上的名稱
+REPORT_LABELS = {"markdown": "Markdown", "html": "HTML", "json": "JSON"}
+# 「一次分析全部新聞」同時呼叫 DeepSeek 的上限
+BATCH_ANALYSIS_CONCURRENCY = int(os.getenv("BATCH_ANALYSIS_CONCURRENCY", "3"))
+
+@st.cache_resource
+def get_analysis_cache():
+    """取得所有使用者共用的持久化分析快取"""
+    return AnalysisCache.from_env()
+
+@st.cache_resource
+def get_singleflight():
+    """取得合併相同分析請求的 single-flight 實例（跨使用者、跨程序）"""
+    return SingleFlight.from_env()
+
+@st.cache_resource
+def get_near_duplicate_index():
+    """取得近似重複新聞索引，轉載同一則稿件的新聞沿用已有的分析"""
+    return NearDuplicateIndex.from_env()
+
+@st.cache_resource
+def get_analysis_history():
+    """取得分析歷史庫，每則新分析展開後寫入供趨勢查詢"""
+    return AnalysisHistory.from_env()
+
+@st.cache_resource
+def get_metrics_server():
+    """設定 METRICS_PORT 時在背景執行緒提供 Prometheus /metrics 端點；同一程序只啟動一次"""
+    configure_logging()
+    port = os.getenv("METRICS_PORT")
+    if not port:
+        return None
+    try:
+        return start_metrics_server(int(port))
+    except OSError:
+        # 連接埠已被其他程序使用，例如同時啟動了多個頁面程序
+        return None
+
+@st.cache_resource
+def get_background_executor():
+    """取得與頁面渲染並行執行背景請求（例如投資建議總結）的執行緒池"""
+    return ThreadPoolExecutor(max_workers=4)
 
-    # 預設的樣本新聞
-    sample_news = [
+@st.cache_resource
+def get_news_store():
+    """取得保存已擷取新聞與擷取游標的本地文章庫"""
+    return ArticleStore.from_env()
+
+def get_sample_news():
+    """未設定 GNews API Key 或尚無任何新聞時顯示的樣本新聞"""
+    today = datetime.now().strftime("%Y年%m月%d日")
+    return [
         {
             "title": f"台股今日開盤漲跌互見 ({today})",
             "content": ("今日台股開盤後漲跌互見，投資人關注美國聯準會利率政策動向。"
@@ -70,59 +146,67 @@ def get_realtime_taiwan_news():
         }
     ]
 
+@st.cache_resource
+def get_news_refresh_state():
+    """背景新聞擷取的共用狀態：同一時間只送出一個擷取請求"""
+    return {"future": None, "lock": threading.Lock()}
+
+def request_news_refresh(gnews_api_key):
+    """在背景執行緒增量擷取新聞，已有擷取進行中時沿用該次；返回 Future"""
+    state = get_news_refresh_state()
+    with state["lock"]:
+        if state["future"] is None or state["future"].done():
+            state["future"] = get_background_executor().submit(refresh_news, get_news_store(), gnews_api_key)
+        return state["future"]
+
+def show_news_refresh_error(error):
+    """顯示擷取新聞失敗的原因"""
+    if isinstance(error, CircuitOpenError):
+        st.warning("⚠️ GNews 服務暫時無法連線，將顯示已保存的新聞。")
+    elif isinstance(error, QuotaExceededError):
+        st.warning(f"⚠️ GNews {error.reason}，約 {error.retry_after / 60:.0f} 分鐘後可再擷取，將顯示已保存的新聞。")
+    elif isinstance(error, GNewsError):
+        st.error(f"{error}。將顯示已保存的新聞。")
+    else:
+        st.error(f"獲取即時新聞時發生錯誤: {error}。將顯示已保存的新聞。")
+
+@metrics.timed("news")
+def get_realtime_taiwan_news(force_refresh=False):
+    """獲取台灣即時新聞：只讀取本地文章庫，由背景擷取程序（python -m macrocore ingest）寫入
+
+    背景程序未執行而文章庫超過刷新間隔時，在背景執行緒補抓，頁面不等待外部 API；
+    手動刷新時才等待這次擷取完成。
+    """
+    gnews_api_key = os.getenv("GNEWS_API_KEY")
     if not gnews_api_key or gnews_api_key == "YOUR_GNEWS_API_KEY":
         st.warning("⚠️ 未找到 GNews API Key 或使用的是預設值，將顯示預設新聞內容。請在 .env 文件中設置您的 GNews API Key。")
-        return sample_news
-
-    try:
-        # 使用 GNews API 獲取台灣經濟新聞
-        search_query = "台灣 經濟 OR 台股 OR 央行 OR 台積電 OR GDP OR 貿易"
-        url = f"https://gnews.io/api/v4/search?q={search_query}&lang=zh-TW&country=tw&max=6&token={gnews_api_key}"
-        
-        response = requests.get(url)
-        
-        if response.status_code == 200:
-            articles = response.json().get("articles", [])
-            if not articles:
-                st.warning("GNews API 未返回任何新聞，將顯示預設內容。")
-                return sample_news
-
-            news_list = []
-            for article in articles:
-                news_list.append({
-                    "title": article.get("title", "無標題"),
-                    "content": article.get("description", "無內容") + " " + article.get("content", ""),
-                    "category": article.get("source", {}).get("name", "綜合")
-                })
-            return news_list
+        return get_sample_news()
+
+    store = get_news_store()
+    _, checked_at = store.get_cursor(DEFAULT_NEWS_QUERY)
+    if force_refresh:
+        try:
+            added = request_news_refresh(gnews_api_key).result()
+            st.toast(f"🔄 新增 {len(added)} 則新聞" if added else "目前沒有更新的新聞")
+        except Exception as e:
+            show_news_refresh_error(e)
+    elif checked_at is None or time.time() - checked_at > NEWS_REFRESH_SECONDS:
+        future = request_news_refresh(gnews_api_key)
+        if future.done() and future.exception() is not None:
+            show_news_refresh_error(future.exception())
+
+    news_list = store.latest_articles(NEWS_LIST_SIZE)
+    if not news_list:
+        if checked_at is None:
+            st.info("⏳ 正在背景擷取今日新聞，請稍後重新整理頁面；目前先顯示預設新聞內容。")
         else:
-            st.error(f"GNews API 請求失敗，狀態碼：{response.status_code}。將顯示預設新聞內容。")
-            return sample_news
-
-    except Exception as e:
-        st.error(f"獲取即時新聞時發生錯誤: {e}。將顯示預設新聞內容。")
-        # 如果獲取失敗，返回預設新聞
-        return sample_news
+            st.warning("GNews API 未返回任何新聞，將顯示預設內容。")
+        return get_sample_news()
+    return news_list
 
 # 設置 Streamlit 端口
 os.environ['STREAMLIT_SERVER_PORT'] = '8877'
 
-def _convert_impact_to_score(impact):
-    """將文字影響程度轉換為數值分數"""
-    impact = impact.lower()
-    if '極大' in impact or '顯著' in impact or '強烈' in impact:
-        return 1.0
-    elif '較大' in impact or '正面' in impact or '利多' in impact:
-        return 0.75
-    elif '中等' in impact or '中性' in impact:
-        return 0.5
-    elif '較小' in impact or '輕微' in impact:
-        return 0.25
-    elif '極小' in impact or '微弱' in impact:
-        return 0.1
-    else:
-        return 0.5  # 默認中等影響
-
 # 設置頁面配置
 st.set_page_config(
     page_title="宏觀新聞分析工具",
@@ -131,360 +215,24 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
-# 自定義 CSS 樣式
-st.markdown("""
-<style>
-    /* 全局樣式 - 小清新風格 */
-    [data-testid="stAppViewContainer"] {
-        background: linear-gradient(135deg, #f8fdff, #e8f4f8);
-        max-width: 1400px;
-        margin: 0 auto;
-        padding: 2rem;
-        color: #2c3e50;
-        font-family: 'Microsoft JhengHei', 'PingFang SC', sans-serif;
-    }
-
-    /* 標題樣式 - 溫和清新 */
-    h1, h2, h3, h4, h5, h6 {
-        color: #34495e;
-        font-family: 'Microsoft JhengHei', sans-serif;
-        margin: 1.5rem 0;
-        font-weight: 500;
-    }
-
-    h1 {
-        font-size: 2.5rem;
-        text-align: center;
-        padding-bottom: 1rem;
-        border-bottom: 3px solid #3498db;
-        margin-bottom: 2rem;
-        color: #2980b9;
-        background: linear-gradient(90deg, #3498db, #2ecc71);
-        -webkit-background-clip: text;
-        -webkit-text-fill-color: transparent;
-        background-clip: text;
-    }
-
-    h2 {
-        font-size: 1.8rem;
-        color: #27ae60;
-        margin-top: 2rem;
-        position: relative;
-    }
-
-    h2:before {
-        content: '';
-        position: absolute;
-        left: 0;
-        bottom: -5px;
-        width: 50px;
-        height: 3px;
-        background: linear-gradient(90deg, #3498db, #2ecc71);
-        border-radius: 2px;
-    }
-
-    h3 {
-        font-size: 1.4rem;
-        color: #16a085;
-    }
-
-    /* 內容區塊樣式 - 清新卡片風格 */
-    .content-block {
-        background: rgba(255, 255, 255, 0.9);
-        border: 1px solid rgba(52, 152, 219, 0.2);
-        border-radius: 15px;
-        padding: 2rem;
-        margin: 1.5rem 0;
-        box-shadow: 0 8px 30px rgba(52, 152, 219, 0.1);
-        backdrop-filter: blur(10px);
-    }
-
-    /* 文本樣式 - 清新可讀 */
-    p, li, span {
-        color: #34495e;
-        font-size: 1.1rem;
-        line-height: 1.8;
-        font-family: 'Microsoft JhengHei', sans-serif;
-    }
-
-    /* 輸入框樣式 - 清新風格 */
-    .stTextArea > div > div > textarea {
-        background: rgba(255, 255, 255, 0.9);
-        border: 2px solid rgba(52, 152, 219, 0.3);
-        border-radius: 12px;
-        padding: 1.2rem;
-        font-size: 1.1rem;
-        color: #2c3e50;
-        min-height: 150px;
-        font-family: 'Microsoft JhengHei', sans-serif;
-        box-shadow: 0 4px 15px rgba(52, 152, 219, 0.1);
-    }
-
-    .stTextArea > div > div > textarea:focus {
-        border-color: #3498db;
-        box-shadow: 0 0 20px rgba(52, 152, 219, 0.3);
-        outline: none;
-    }
-
-    /* 按鈕樣式 - 清新漸變 */
-    .stButton > button {
-        width: 100%;
-        max-width: 300px;
-        padding: 0.9rem 1.8rem;
-        font-size: 1.1rem;
-        color: white;
-        background: linear-gradient(135deg, #3498db, #2ecc71);
-        border: none;
-        border-radius: 25px;
-        cursor: pointer;
-        transition: all 0.3s ease;
-        font-family: 'Microsoft JhengHei', sans-serif;
-        font-weight: 500;
-        box-shadow: 0 4px 15px rgba(52, 152, 219, 0.3);
-    }
-
-    .stButton > button:hover {
-        background: linear-gradient(135deg, #2980b9, #27ae60);
-        transform: translateY(-3px);
-        box-shadow: 0 8px 25px rgba(52, 152, 219, 0.4);
-    }
-
-    /* 表格樣式 - 清新風格 */
-    .dataframe {
-        width: 100%;
-        border-collapse: separate;
-        border-spacing: 0;
-        margin: 1.5rem 0;
-        background: rgba(255, 255, 255, 0.9);
-        border-radius: 12px;
-        overflow: hidden;
-        box-shadow: 0 4px 20px rgba(52, 152, 219, 0.1);
-    }
-
-    .dataframe th {
-        background: linear-gradient(135deg, #74b9ff, #55efc4);
-        color: white;
-        font-weight: 500;
-        padding: 1rem;
-        text-align: left;
-        border: none;
-    }
-
-    .dataframe td {
-        padding: 1rem;
-        border-bottom: 1px solid rgba(52, 152, 219, 0.1);
-        color: #2c3e50;
-        background: rgba(255, 255, 255, 0.8);
-    }
-
-    .dataframe tr:hover {
-        background: rgba(116, 185, 255, 0.1);
-    }
-
-    /* 隱藏側邊欄 */
-    [data-testid="stSidebar"] {
-        display: none !important;
-    }
-
-    /* 分析結果區塊 - 清新卡片風格 */
-    .analysis-section {
-        background: rgba(255, 255, 255, 0.95);
-        border: 1px solid rgba(116, 185, 255, 0.2);
-        border-radius: 16px;
-        padding: 2rem;
-        margin: 2rem 0;
-        box-shadow: 0 8px 30px rgba(116, 185, 255, 0.15);
-        backdrop-filter: blur(10px);
-    }
-
-    .analysis-section h3 {
-        color: #16a085;
-        border-bottom: 2px solid rgba(22, 160, 133, 0.3);
-        padding-bottom: 0.5rem;
-        margin-bottom: 1.5rem;
-    }
-
-    /* 影響程度標籤 - 清新風格 */
-    .impact-label {
-        display: inline-block;
-        padding: 0.5rem 1.2rem;
-        border-radius: 20px;
-        font-weight: 500;
-        margin: 0.3rem;
-        background: linear-gradient(135deg, #74b9ff, #55efc4);
-        border: none;
-        color: white;
-        box-shadow: 0 2px 10px rgba(116, 185, 255, 0.2);
-    }
-
-    /* 圖表容器 - 清新風格 */
-    [data-testid="stPlotlyChart"] {
-        background: rgba(255, 255, 255, 0.95);
-        border: 1px solid rgba(116, 185, 255, 0.2);
-        border-radius: 16px;
-        padding: 1.5rem;
-        margin: 1.5rem 0;
-        box-shadow: 0 6px 25px rgba(116, 185, 255, 0.1);
-        backdrop-filter: blur(10px);
-    }
-
-    /* 提示框樣式 - 清新風格 */
-    .stAlert {
-        background: rgba(255, 255, 255, 0.9);
-        color: #2c3e50;
-        border: 1px solid rgba(116, 185, 255, 0.3);
-        border-radius: 12px;
-        padding: 1rem;
-        box-shadow: 0 4px 15px rgba(116, 185, 255, 0.1);
-    }
-
-    /* 成功消息樣式 - 清新風格 */
-    .success {
-        background: linear-gradient(135deg, #55efc4, #81ecec);
-        color: white;
-        border: none;
-        border-radius: 12px;
-        padding: 1rem;
-        box-shadow: 0 4px 15px rgba(85, 239, 196, 0.2);
-    }
-
-    /* 選擇框樣式 - 清新風格 */
-    .stSelectbox > div > div {
-        background: rgba(255, 255, 255, 0.9);
-        border: 1px solid rgba(116, 185, 255, 0.3);
-        border-radius: 12px;
-        box-shadow: 0 2px 10px rgba(116, 185, 255, 0.1);
-    }
-
-    .stSelectbox > div > div > div {
-        color: #2c3e50;
-    }
-
-    /* 頁腳樣式 - 清新風格 */
-    .footer {
-        text-align: center;
-        padding: 2rem;
-        margin-top: 3rem;
-        border-top: 1px solid rgba(116, 185, 255, 0.2);
-        color: #7f8c8d;
-        background: linear-gradient(135deg, 
-                                    rgba(255,255,255,0.1), 
-                                    rgba(116, 185, 255, 0.05));
-        border-radius: 16px 16px 0 0;
-    }
-
-    /* 數據指標樣式 - 清新風格 */
-    [data-testid="stMetricValue"] {
-        color: #16a085 !important;
-        font-size: 1.5rem !important;
-        font-weight: 600 !important;
-    }
-
-    [data-testid="stMetricDelta"] {
-        color: #27ae60 !important;
-        font-size: 1rem !important;
-    }
-
-    /* 標籤頁樣式 */
-    .stTabs [data-baseweb="tab-list"] {
-        gap: 8px;
-        background: rgba(255, 255, 255, 0.05);
-        padding: 0.5rem;
-        border-radius: 8px;
-    }
-
-    .stTabs [data-baseweb="tab"] {
-        background: transparent;
-        color: #e0e0e0;
-        border: 1px solid rgba(0, 255, 204, 0.3);
-        border-radius: 6px;
-        padding: 0.5rem 1rem;
-    }
-
-    .stTabs [data-baseweb="tab"]:hover {
-        background: rgba(0, 255, 204, 0.1);
-        color: #00ffcc;
-    }
-
-    .stTabs [aria-selected="true"] {
-        background: rgba(0, 255, 204, 0.2) !important;
-        color: #00ffcc !important;
-    }
-
-    /* 響應式設計 */
-    @media screen and (max-width: 768px) {
-        [data-testid="stAppViewContainer"] {
-            padding: 1rem;
-        }
-
-        .content-block, .analysis-section {
-            padding: 1.5rem;
-        }
-
-        h1 {
-            font-size: 2rem;
-        }
-
-        h2 {
-            font-size: 1.5rem;
-        }
-
-        h3 {
-            font-size: 1.2rem;
-        }
-
-        p, li, span {
-            font-size: 1rem;
-        }
+# 自定義 CSS 樣式（讀檔一次後快取，不再內嵌於程式中）
+@st.cache_resource
+def load_page_css():
+    """讀取頁面樣式表"""
+    css_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static", "macroinsight.css")
+    with open(css_path, encoding="utf-8") as f:
+        return f.read()
 
-        .stButton > button {
-            padding: 0.6rem 1.2rem;
-            font-size: 1rem;
-        }
-    }
-
-    /* 確保所有文字顏色 */
-    [data-testid="stMarkdownContainer"] {
-        color: #e0e0e0;
-    }
-
-    .stMarkdown, .stText {
-        color: #e0e0e0;
-    }
-
-    /* 圖表標題樣式 */
-    .js-plotly-plot .plotly .gtitle {
-        fill: #00ffcc !important;
-        font-family: 'Microsoft JhengHei', sans-serif !important;
-    }
-
-    /* 滾動條樣式 */
-    ::-webkit-scrollbar {
-        width: 8px;
-        height: 8px;
-    }
-
-    ::-webkit-scrollbar-track {
-        background: rgba(255, 255, 255, 0.05);
-    }
-
-    ::-webkit-scrollbar-thumb {
-        background: rgba(0, 255, 204, 0.3);
-        border-radius: 4px;
-    }
-
-    ::-webkit-scrollbar-thumb:hover {
-        background: rgba(0, 255, 204, 0.5);
-    }
-</style>
-""", unsafe_allow_html=True)
+st.markdown(f"<style>\n{load_page_css()}</style>", unsafe_allow_html=True)
 
 # 從 .env 文件讀取 API Key（不顯示在UI中）
 api_key = os.getenv("DeepSeek_API")
+get_metrics_server()
 
 # 預設分析選項
 detailed_analysis = True
 include_charts = True
+stream_analysis = True  # 以串流方式接收分析結果，區塊完成即顯示
 
 # 主页面
 st.markdown('<h1>🌸 宏觀新聞分析工具</h1>', unsafe_allow_html=True)
@@ -505,44 +253,87 @@ with col1:
     st.markdown("## 📰 今日台灣重要新聞")
     current_time = datetime.now().strftime("%Y年%m月%d日 %H:%M")
     st.markdown(f"*更新時間：{current_time} | 點選新聞標題即可進行分析*")
+    # 額度由頁面、背景擷取程序與批次工具共用
+    gnews_quota = get_http_client().quota.remaining("gnews")
+    if os.getenv("GNEWS_API_KEY", "YOUR_GNEWS_API_KEY") != "YOUR_GNEWS_API_KEY" and gnews_quota["day"] is not None:
+        st.caption(f"GNews 今日剩餘額度：{gnews_quota['day']} 次")
 
 with col2:
-    if st.button("🔄 刷新新聞", key="refresh_news"):
-        st.cache_data.clear()  # 清除快取以獲取最新新聞
-        st.rerun()
+    # 只請求上次之後發布的新聞並合併進列表，不清除其他快取
+    refresh_requested = st.button("🔄 刷新新聞", key="refresh_news")
 
 # 獲取今日台灣即時新聞
 with st.spinner("🔄 正在獲取今日台灣重要新聞..."):
-    taiwan_news = get_realtime_taiwan_news()
+    taiwan_news = get_realtime_taiwan_news(force_refresh=refresh_requested)
 
-# 創建新聞選擇區域
-selected_news = None
+# 不同媒體轉載的同一則稿件合併為一個標題，只顯示第一則
+near_duplicate_threshold = get_near_duplicate_index().threshold
+news_groups = group_near_duplicates(
+    [f"{news['title']} {news['content']}" for news in taiwan_news], near_duplicate_threshold
+)
+headline_news = [taiwan_news[group[0]] for group in news_groups]
+
+# 創建新聞選擇區域；選擇保存在 session_state，按下「立即分析」造成的重跑後仍然有效
 cols = st.columns(2)
 
-for i, news in enumerate(taiwan_news):
+for i, group in enumerate(news_groups):
+    news = taiwan_news[group[0]]
     col = cols[i % 2]
+    help_text = f"類別：{news['category']}"
+    if len(group) > 1:
+        sources = "、".join(taiwan_news[j]['category'] for j in group[1:])
+        help_text += f"\n\n另有 {len(group) - 1} 則相似報導：{sources}"
     with col:
         if st.button(
-            f"📑 {news['title'][:50]}{'...' if len(news['title']) > 50 else ''}",
-            key=f"news_{i}",
-            help=f"類別：{news['category']}"
+            f"📑 {news['title'][:50]}{'...' if len(news['title']) > 50 else ''}"
+            f"{f'（+{len(group) - 1}）' if len(group) > 1 else ''}",
+            key=f"news_{news.get('id', group[0])}",
+            help=help_text
         ):
-            selected_news = news
+            st.session_state.selected_news = news
+            # 只在選擇新新聞時填入分析區域，之後使用者的修改不會被覆蓋
+            st.session_state.news_input = format_news_text(news)
+
+# 一次分析全部新聞：有上限地並行呼叫，結果寫入分析快取供之後點選時直接使用
+if st.button("⚡ 一次分析全部新聞", key="analyze_all_news", disabled=not api_key):
+    cache = get_analysis_cache()
+    singleflight = get_singleflight()
+    near_duplicates = get_near_duplicate_index()
+    history = get_analysis_history()
+    total = len(headline_news)
+    progress = st.progress(0.0, text=f"正在分析 {total} 則新聞...")
+    status_slots = [st.empty() for _ in headline_news]
+    for slot, news in zip(status_slots, headline_news):
+        slot.info(f"⏳ 等待分析：{news['title']}")
+
+    def analyze_headline(news):
+        return request_analysis(
+            format_news_text(news), api_key, cache=cache, singleflight=singleflight,
+            near_duplicates=near_duplicates, history=history
+        )
+
+    done = 0
+    for index, result, error, elapsed in run_bounded(analyze_headline, headline_news, BATCH_ANALYSIS_CONCURRENCY):
+        done += 1
+        title = headline_news[index]['title']
+        if error is not None:
+            status_slots[index].error(f"❌ {title}：{error}")
+        elif result[1]["near_duplicate"] is not None:
+            status_slots[index].success(f"⚡ {title}（沿用相似新聞的分析）")
+        elif result[1]["cached"]:
+            status_slots[index].success(f"⚡ {title}（快取結果）")
+        else:
+            status_slots[index].success(f"✅ {title}（{elapsed:.1f} 秒）")
+        progress.progress(done / total, text=f"已完成 {done}/{total} 則")
+    st.info("💡 分析結果已寫入快取，點選任一新聞進行分析即可立即查看完整內容")
 
 # 初始化 session_state 來保存文本區域的內容
 if 'news_input' not in st.session_state:
     st.session_state.news_input = ""
 
-# 如果有選擇的新聞，自動填入分析區域
+# 如果有選擇的新聞，詢問是否立即分析
+selected_news = st.session_state.get("selected_news")
 if selected_news:
-    # 當選擇新新聞時，更新 session_state
-    st.session_state.news_input = f"""
-**新聞標題：** {selected_news['title']}
-**新聞類別：** {selected_news['category']}
-
-**新聞內容：**
-{selected_news['content']}
-"""
     st.success(f"✅ 已選擇新聞：{selected_news['title']}")
     
     # 詢問是否要進行分析
@@ -556,8 +347,8 @@ if selected_news:
             use_container_width=True
         ):
             st.session_state.should_analyze = True
-            # 我們將從 news_input 分析，所以不需要 news_to_analyze
             st.session_state.news_to_analyze = st.session_state.news_input
+            st.session_state.selected_news = None
 
 # 新闻输入区域
 # 使用 key 來綁定 session_state，這樣用戶輸入的內容才不會在點擊按鈕後消失
@@ -568,201 +359,339 @@ news_text = st.text_area(
     help="粘貼完整的新聞文本，包括標題和正文內容，或點選上方新聞進行分析"
 )
 
-def analyze_news(news_text):
-    try:
-        # 定義分析結果的 JSON 結構模板
-        result_template = {
-            "summary": {
-                "key_points": ["重點1", "重點2", "重點3"],
-                "key_data": ["數據1", "數據2", "數據3"],
-                "related_entities": ["相關企業/產業1", "相關企業/產業2"]
-            },
-            "market_impact": {
-                "macro_economy": {
-                    "gdp": {"impact": "影響程度", "description": "詳細說明"},
-                    "inflation": {"impact": "影響程度", "description": "詳細說明"},
-                    "employment": {"impact": "影響程度", "description": "詳細說明"},
-                    "consumption": {"impact": "影響程度", "description": "詳細說明"}
-                },
-                "financial_markets": {
-                    "stock_market": {
-                        "indices": [{"name": "指數名稱", "impact": "影響", "target": "目標價位"}],
-                        "sectors": [{"name": "產業名稱", "impact": "影響", "reason": "原因"}]
-                    },
-                    "bond_market": {
-                        "government": {"impact": "影響", "yield_trend": "殖利率走勢"},
-                        "corporate": {"impact": "影響", "spread_trend": "利差走勢"}
-                    },
-                    "forex_market": [
-                        {"pair": "貨幣對", "impact": "影響", "target": "目標價位"}
-                    ],
-                    "commodities": [
-                        {"name": "商品名稱", "impact": "影響", "target": "目標價位"}
-                    ]
-                }
-            },
-            "industry_impact": {
-                "benefited": [
-                    {"industry": "產業名稱", "reason": "受惠原因", "duration": "影響時長"}
-                ],
-                "damaged": [
-                    {"industry": "產業名稱", "reason": "受損原因", "duration": "影響時長"}
-                ],
-                "supply_chain": {"description": "產業鏈影響說明"},
-                "competition": {"description": "競爭格局變化說明"}
-            },
-            "corporate_impact": {
-                "direct": [
-                    {"company": "公司名稱", "impact": "影響", "action": "建議行動"}
-                ],
-                "indirect": [
-                    {"company": "公司名稱", "impact": "影響", "action": "建議行動"}
-                ],
-                "opportunities": ["機會1", "機會2"],
-                "risks": ["風險1", "風險2"]
-            },
-            "investment_advice": {
-                "short_term": {
-                    "position": ["建議1", "建議2"],
-                    "risk_control": ["風控建議1", "風控建議2"],
-                    "timing": ["時點建議1", "時點建議2"]
-                },
-                "long_term": {
-                    "asset_allocation": ["配置建議1", "配置建議2"],
-                    "sector_strategy": ["產業建議1", "產業建議2"],
-                    "targets": ["投資標的1", "投資標的2"]
-                }
-            },
-            "risk_warning": {
-                "primary_risks": ["主要風險1", "主要風險2"],
-                "secondary_risks": ["次要風險1", "次要風險2"],
-                "monitoring_indicators": ["監控指標1", "監控指標2"],
-                "hedging_suggestions": ["對沖建議1", "對沖建議2"]
-            }
-        }
-
-        # 構建優化後的提示詞
-        prompt = f"""
-        請以專業財經分析師的角度，以台灣的經濟環境看待對以下新聞進行深入分析：
-
-        "{news_text}"
-
-        請從以下維度進行分析：
-
-        1. 新聞重點摘要：
-           - 核心要點（3-5點）
-           - 關鍵數據和指標
-           - 相關企業和產業
-
-        2. 市場影響分析：
-           A. 總體經濟影響
-              - GDP影響
-              - 通膨影響
-              - 就業影響
-              - 消費影響
-           
-           B. 金融市場影響
-              - 股市影響（主要指數、產業、個股）
-              - 債券市場影響（公債殖利率、信用債券）
-              - 匯率影響（主要貨幣對）
-              - 大宗商品影響（原物料、能源、貴金屬）
-
-        3. 產業影響評估：
-           - 受惠產業及原因
-           - 受損產業及原因
-           - 產業鏈上下游影響
-           - 競爭格局變化
-
-        4. 企業影響分析：
-           - 直接影響企業
-           - 間接影響企業
-           - 潛在商機與風險
-           - 企業因應策略建議
-
-        5. 投資建議：
-           A. 短期策略（1-3個月）
-              - 投資部位建議
-              - 風險規避建議
-              - 操作時點建議
-           
-           B. 中長期策略（3個月以上）
-              - 資產配置建議
-              - 產業布局建議
-              - 投資標的建議
-
-        6. 風險提示：
-           - 主要風險因素
-           - 次要風險因素
-           - 風險監控指標
-           - 風險對沖建議
-
-        請嚴格按照以下 JSON 格式返回分析結果，不要添加任何其他文字：
-        {json.dumps(result_template, ensure_ascii=False, indent=2)}
-        """
-
-        # 調用 DeepSeek API
-        url = "https://api.deepseek.com/v1/chat/completions"
-        headers = {
-            "Content-Type": "application/json",
-            "Authorization": f"Bearer {api_key}"
-        }
-        data = {
-            "model": "deepseek-chat",
-            "messages": [
-                {"role": "user", "content": prompt}
-            ],
-            "temperature": 0.3,
-            "max_tokens": 4000
-        }
+def find_similar_analyses(news_text, exclude=()):
+    """在語意索引中查詢與新聞最相似的歷史分析；歷史庫停用時返回空清單"""
+    semantic_index = get_analysis_history().semantic
+    if semantic_index is None:
+        return []
+    return semantic_index.search(news_text, SIMILAR_ANALYSES, exclude=exclude, min_similarity=SIMILAR_MIN_SIMILARITY)
 
-        response = requests.post(url, headers=headers, data=json.dumps(data))
-
-        if response.status_code == 200:
-            result = response.json()
-            response_content = result["choices"][0]["message"]["content"]
-            
-            # 嘗試找到並提取 JSON 部分
-            try:
-                # 使用正則表達式提取被 ```json ... ``` 包圍的內容
-                match = re.search(r"```json\n(.*?)\n```", response_content, re.DOTALL)
-                if match:
-                    json_str = match.group(1)
-                else:
-                    # 如果沒有找到 ```json ... ```，則退回使用原始的查找方式
-                    start_idx = response_content.find('{')
-                    end_idx = response_content.rfind('}') + 1
-                    if start_idx >= 0 and end_idx > start_idx:
-                        json_str = response_content[start_idx:end_idx]
-                    else:
-                        st.error("無法在回應中找到有效的 JSON 結構")
-                        st.text("API 返回的原始內容:")
-                        st.code(response_content)
-                        return None
-
-                try:
-                    analysis = json.loads(json_str)
-                    return analysis
-                except json.JSONDecodeError as je:
-                    st.error(f"JSON 解析錯誤: {str(je)}")
-                    st.text("提取出的 JSON 字串:")
-                    st.code(json_str)
-                    st.text("API 返回的原始內容:")
-                    st.code(response_content)
-                    return None
-
-            except Exception as e:
-                st.error(f"處理 API 回應時出錯: {str(e)}")
-                st.text("API 返回的原始內容:")
-                st.code(response_content)
-                return None
-        else:
-            st.error(f"API 調用失敗: {response.status_code}")
-            st.text(f"錯誤詳情: {response.text}")
-            return None
+def analyze_news(news_text, use_cache=True, on_section=None, similar=None):
+    """分析新聞並在頁面上顯示錯誤，返回 (分析結果, 資訊)，失敗時返回 (None, None)
 
+    串流模式下每完成一個頂層區塊即呼叫 on_section(名稱, 內容)；傳入 similar 時將相似的歷史分析附在提示詞中作為參考。
+    """
+    cache = get_analysis_cache()
+    try:
+        analysis, info = request_analysis(
+            news_text,
+            api_key,
+            cache=cache,
+            use_cache=use_cache,
+            stream=stream_analysis and on_section is not None,
+            on_section=on_section,
+            singleflight=get_singleflight(),
+            near_duplicates=get_near_duplicate_index(),
+            history=get_analysis_history(),
+            similar=similar
+        )
+    except AnalysisError as e:
+        st.error(str(e))
+        if e.json_str:
+            st.text("提取出的 JSON 字串:")
+            st.code(e.json_str)
+        if e.raw_response:
+            st.text("API 返回的原始內容:")
+            st.code(e.raw_response)
+        return None, None
+    except CircuitOpenError:
+        st.error("⚠️ DeepSeek 服務暫時無法連線，請稍後再試")
+        return None, None
+    except QuotaExceededError as e:
+        st.error(f"⚠️ 已達 DeepSeek 請求上限（{e.reason}），請約 {e.retry_after:.0f} 秒後再試")
+        return None, None
     except Exception as e:
         st.error(f"分析過程中出現錯誤: {str(e)}")
-        return None
+        return None, None
+
+    if info["near_duplicate"] is not None:
+        st.caption(f"⚡ 與已分析過的新聞高度相似（相似度 {info['near_duplicate']:.0%}），已沿用該則分析結果")
+    elif info["cached"]:
+        stats = cache.stats()
+        st.caption(f"⚡ 已從分析快取載入結果（命中 {stats['hits']} 次 / 未命中 {stats['misses']} 次）")
+    elif info["shared"]:
+        st.caption("⚡ 已有其他使用者正在分析同一則新聞，已共用該次分析結果")
+    elif info["usage"]:
+        usage = info["usage"]
+        st.caption(
+            f"🔢 輸入 {usage['prompt_tokens']} tokens（上下文快取命中 {usage['prompt_cache_hit_tokens']}）"
+            f" / 輸出 {usage['completion_tokens']} tokens"
+        )
+    return analysis, info
+
+def render_summary_section(analysis):
+    """顯示新聞重點摘要"""
+    st.header("新聞重點摘要")
+    with st.container():
+        col1, col2 = st.columns(2)
+
+        with col1:
+            st.subheader("核心要點")
+            for point in analysis["summary"]["key_points"]:
+                st.markdown(f"• {point}")
+
+        with col2:
+            st.subheader("關鍵數據")
+            for data in analysis["summary"]["key_data"]:
+                st.markdown(f"• {data}")
+
+def render_market_impact_section(analysis):
+    """顯示市場影響分析"""
+    st.header("市場影響分析")
+
+    # 總體經濟影響
+    st.subheader("總體經濟影響")
+    macro = analysis["market_impact"]["macro_economy"]
+    cols = st.columns(4)
+
+    with cols[0]:
+        st.metric("GDP影響", macro["gdp"]["impact"])
+        st.caption(macro["gdp"]["description"])
+
+    with cols[1]:
+        st.metric("通膨影響", macro["inflation"]["impact"])
+        st.caption(macro["inflation"]["description"])
+
+    with cols[2]:
+        st.metric("就業影響", macro["employment"]["impact"])
+        st.caption(macro["employment"]["description"])
+
+    with cols[3]:
+        st.metric("消費影響", macro["consumption"]["impact"])
+        st.caption(macro["consumption"]["description"])
+
+    # 金融市場影響
+    st.subheader("金融市場影響")
+    tabs = st.tabs(["股市", "債市", "匯市", "商品"])
+
+    with tabs[0]:
+        col1, col2 = st.columns(2)
+        with col1:
+            st.markdown("##### 主要指數影響")
+            for index in analysis["market_impact"]["financial_markets"]["stock_market"]["indices"]:
+                st.metric(index["name"], index["impact"], index["target"])
+
+        with col2:
+            st.markdown("##### 產業影響")
+            for sector in analysis["market_impact"]["financial_markets"]["stock_market"]["sectors"]:
+                st.metric(sector["name"], sector["impact"])
+                st.caption(sector["reason"])
+
+    with tabs[1]:
+        col1, col2 = st.columns(2)
+        with col1:
+            st.markdown("##### 公債市場")
+            bond = analysis["market_impact"]["financial_markets"]["bond_market"]["government"]
+            st.metric("影響", bond["impact"])
+            st.caption(f"殖利率走勢：{bond['yield_trend']}")
+
+        with col2:
+            st.markdown("##### 公司債市場")
+            corp = analysis["market_impact"]["financial_markets"]["bond_market"]["corporate"]
+            st.metric("影響", corp["impact"])
+            st.caption(f"利差走勢：{corp['spread_trend']}")
+
+    with tabs[2]:
+        st.markdown("##### 主要貨幣對影響")
+        cols = st.columns(3)
+        for i, pair in enumerate(analysis["market_impact"]["financial_markets"]["forex_market"]):
+            with cols[i % 3]:
+                st.metric(pair["pair"], pair["impact"], pair["target"])
+
+    with tabs[3]:
+        st.markdown("##### 大宗商品影響")
+        cols = st.columns(3)
+        for i, commodity in enumerate(analysis["market_impact"]["financial_markets"]["commodities"]):
+            with cols[i % 3]:
+                st.metric(commodity["name"], commodity["impact"], commodity["target"])
+
+def render_industry_impact_section(analysis):
+    """顯示產業影響評估"""
+    st.header("產業影響評估")
+    col1, col2 = st.columns(2)
+
+    with col1:
+        st.subheader("受惠產業")
+        for industry in analysis["industry_impact"]["benefited"]:
+            with st.expander(f"{industry['industry']} ({industry['duration']})"):
+                st.write(industry["reason"])
+
+    with col2:
+        st.subheader("受損產業")
+        for industry in analysis["industry_impact"]["damaged"]:
+            with st.expander(f"{industry['industry']} ({industry['duration']})"):
+                st.write(industry["reason"])
+
+    st.markdown("##### 產業鏈影響")
+    st.info(analysis["industry_impact"]["supply_chain"]["description"])
+
+    st.markdown("##### 競爭格局變化")
+    st.info(analysis["industry_impact"]["competition"]["description"])
+
+def render_investment_advice_section(analysis):
+    """顯示投資建議"""
+    st.header("投資建議")
+    col1, col2 = st.columns(2)
+
+    with col1:
+        st.subheader("短期策略 (1-3個月)")
+        st.markdown("##### 投資部位")
+        for pos in analysis["investment_advice"]["short_term"]["position"]:
+            st.markdown(f"• {pos}")
+
+        st.markdown("##### 風險控制")
+        for risk in analysis["investment_advice"]["short_term"]["risk_control"]:
+            st.markdown(f"• {risk}")
+
+        st.markdown("##### 操作時點")
+        for timing in analysis["investment_advice"]["short_term"]["timing"]:
+            st.markdown(f"• {timing}")
+
+    with col2:
+        st.subheader("中長期策略 (3個月以上)")
+        st.markdown("##### 資產配置")
+        for alloc in analysis["investment_advice"]["long_term"]["asset_allocation"]:
+            st.markdown(f"• {alloc}")
+
+        st.markdown("##### 產業布局")
+        for sector in analysis["investment_advice"]["long_term"]["sector_strategy"]:
+            st.markdown(f"• {sector}")
+
+        st.markdown("##### 投資標的")
+        for target in analysis["investment_advice"]["long_term"]["targets"]:
+            st.markdown(f"• {target}")
+
+def render_risk_warning_section(analysis):
+    """顯示風險提示"""
+    st.header("風險提示")
+    col1, col2 = st.columns(2)
+
+    with col1:
+        st.subheader("主要風險")
+        for risk in analysis["risk_warning"]["primary_risks"]:
+            st.markdown(f"• {risk}")
+
+        st.subheader("次要風險")
+        for risk in analysis["risk_warning"]["secondary_risks"]:
+            st.markdown(f"• {risk}")
+
+    with col2:
+        st.subheader("風險監控指標")
+        for indicator in analysis["risk_warning"]["monitoring_indicators"]:
+            st.markdown(f"• {indicator}")
+
+        st.subheader("風險對沖建議")
+        for hedge in analysis["risk_warning"]["hedging_suggestions"]:
+            st.markdown(f"• {hedge}")
+
+# 各頂層區塊對應的渲染函式，依畫面顯示順序排列（corporate_impact 僅寫入報告）
+SECTION_RENDERERS = {
+    "summary": render_summary_section,
+    "market_impact": render_market_impact_section,
+    "industry_impact": render_industry_impact_section,
+    "investment_advice": render_investment_advice_section,
+    "risk_warning": render_risk_warning_section,
+}
+
+def render_similar_analyses(similar):
+    """顯示語意索引中最相似的歷史分析"""
+    if not similar:
+        return
+    st.markdown('<div class="sub-header">相似的歷史事件</div>', unsafe_allow_html=True)
+    for item in similar:
+        with st.expander(f"{item['analyzed_at']:%Y-%m-%d}｜{item['title']}（相似度 {item['similarity']:.0%}）"):
+            for point in item["key_points"]:
+                st.markdown(f"- {point}")
+
+def store_analysis_result(result_key, news_text, analysis, similar=None, stored=False):
+    """將分析結果保存到 session_state（以內容雜湊為鍵），並在背景開始產生投資建議總結
+
+    stored 表示結果確實以 result_key 存在分析快取中，總結完成後才併入快取。
+    """
+    results = st.session_state.setdefault("analysis_results", {})
+    results.pop(result_key, None)
+    result = {"news_text": news_text, "analysis": analysis, "figures": None, "similar": similar or [],
+              "investment_advice": analysis.get("investment_summary", ""), "summary_future": None, "stored": stored}
+    if not result["investment_advice"]:
+        # 投資建議總結只依賴已解析的分析結果，立即在背景產生，與圖表渲染並行
+        result["summary_future"] = get_background_executor().submit(
+            request_investment_summary, news_text, analysis, api_key
+        )
+    results[result_key] = result
+    # 只保留最近幾則，避免 session 佔用過多記憶體
+    while len(results) > MAX_SESSION_RESULTS:
+        results.pop(next(iter(results)))
+
+@st.fragment
+def render_analysis_result(result_key):
+    """顯示 session_state 中保存的分析結果
+
+    在 fragment 中執行：下載報告等互動只重跑這個區塊，不會重跑整個頁面或重新呼叫 API。
+    """
+    result = st.session_state.get("analysis_results", {}).get(result_key)
+    if result is None:
+        return
+    analysis = result["analysis"]
+    for renderer in SECTION_RENDERERS.values():
+        renderer(analysis)
+    # 相似事件在分析時已查好，重跑時直接顯示
+    render_similar_analyses(result["similar"])
+
+    # 添加視覺化圖表；圖表規格依分析內容快取，第一次顯示時取得，之後重跑沿用
+    if include_charts:
+        if result["figures"] is None:
+            result["figures"] = build_chart_specs(analysis)
+        figures = result["figures"]
+        st.header("視覺化分析")
+
+        # 1. 市場影響雷達圖
+        st.subheader("市場影響雷達圖")
+        st.plotly_chart(figures["radar"], use_container_width=True)
+
+        # 2. 產業影響對比圖
+        st.subheader("產業影響對比")
+        st.plotly_chart(figures["industries"], use_container_width=True)
+
+        # 3. 投資建議時間軸
+        st.subheader("投資建議時間軸")
+        st.plotly_chart(figures["timeline"], use_container_width=True)
+
+    # 添加總結和建議部分
+    st.markdown('<div class="sub-header">總結與投資建議</div>', unsafe_allow_html=True)
+
+    if result["summary_future"] is not None:
+        summary_future, result["summary_future"] = result["summary_future"], None
+        try:
+            result["investment_advice"] = summary_future.result()
+        except Exception as e:
+            st.error(f"無法生成投資建議總結: {e}")
+        else:
+            # 將總結併入快取結果，之後重新分析同一則新聞時不必再呼叫；
+            # 沒有寫入快取的結果（近似重複沿用、以預設值補齊的區塊）不因此變成快取項目，也不在歷史庫中
+            if result["stored"]:
+                get_analysis_cache().put(result_key, dict(analysis, investment_summary=result["investment_advice"]))
+                # 歷史庫的完整分析在總結產生前就已寫入，另外記錄總結供批次匯出報告使用
+                get_analysis_history().set_summary(result_key, result["investment_advice"])
+    investment_advice = result["investment_advice"]
+    if investment_advice:
+        st.markdown(f'<div class="info-box">{investment_advice}</div>', unsafe_allow_html=True)
+
+    # 導出報告選項
+    st.markdown('<div class="sub-header">導出分析報告</div>', unsafe_allow_html=True)
+
+    # 報告只在按下下載時才產生
+    report_time = datetime.now().strftime('%Y%m%d_%H%M%S')
+    report_cols = st.columns(len(REPORT_LABELS))
+    for report_col, (fmt, label) in zip(report_cols, REPORT_LABELS.items()):
+        extension, mime, _ = REPORT_FORMATS[fmt]
+        with report_col:
+            st.download_button(
+                label=f"下載完整分析報告 ({label})",
+                data=functools.partial(render_report, fmt, result["news_text"], analysis, investment_advice),
+                file_name=f"宏觀新聞分析_{report_time}.{extension}",
+                mime=mime,
+                key=f"download_report_{fmt}",
+            )
 
 # 檢查是否需要自動分析選擇的新聞
 auto_analyze = st.session_state.get('should_analyze', False)
@@ -775,504 +704,123 @@ if auto_analyze:
 
 # 分析按钮 - 當自動分析或手動點擊時執行
 manual_analyze = st.button("分析新聞", disabled=not news_text or not api_key)
+bypass_cache = st.checkbox("略過分析快取，重新呼叫 AI 分析", value=False, key="bypass_cache")
+history_context = st.checkbox("將相似的歷史分析附在提示詞中作為參考", value=False, key="history_context")
 
 if auto_analyze or manual_analyze:
+    # 開始新的分析時不再顯示上一則結果
+    st.session_state.current_result = None
     if not analyze_content:
         st.error("請輸入新聞內容")
     elif not api_key:
         st.error("請輸入 DeepSeek API Key")
     else:
         with st.spinner("正在進行深度分析，請稍候..."):
-            analysis = analyze_news(analyze_content)
-            
-            if analysis:
-                # 顯示新聞重點
-                st.header("新聞重點摘要")
-                with st.container():
-                    col1, col2 = st.columns(2)
-                    
-                    with col1:
-                        st.subheader("核心要點")
-                        for point in analysis["summary"]["key_points"]:
-                            st.markdown(f"• {point}")
-                    
-                    with col2:
-                        st.subheader("關鍵數據")
-                        for data in analysis["summary"]["key_data"]:
-                            st.markdown(f"• {data}")
-
-                # 市場影響分析
-                st.header("市場影響分析")
-                
-                # 總體經濟影響
-                st.subheader("總體經濟影響")
-                macro = analysis["market_impact"]["macro_economy"]
-                cols = st.columns(4)
-                
-                with cols[0]:
-                    st.metric("GDP影響", macro["gdp"]["impact"])
-                    st.caption(macro["gdp"]["description"])
-                
-                with cols[1]:
-                    st.metric("通膨影響", macro["inflation"]["impact"])
-                    st.caption(macro["inflation"]["description"])
-                
-                with cols[2]:
-                    st.metric("就業影響", macro["employment"]["impact"])
-                    st.caption(macro["employment"]["description"])
-                
-                with cols[3]:
-                    st.metric("消費影響", macro["consumption"]["impact"])
-                    st.caption(macro["consumption"]["description"])
-
-                # 金融市場影響
-                st.subheader("金融市場影響")
-                tabs = st.tabs(["股市", "債市", "匯市", "商品"])
-                
-                with tabs[0]:
-                    col1, col2 = st.columns(2)
-                    with col1:
-                        st.markdown("##### 主要指數影響")
-                        for index in analysis["market_impact"]["financial_markets"]["stock_market"]["indices"]:
-                            st.metric(index["name"], index["impact"], index["target"])
-                    
-                    with col2:
-                        st.markdown("##### 產業影響")
-                        for sector in analysis["market_impact"]["financial_markets"]["stock_market"]["sectors"]:
-                            st.metric(sector["name"], sector["impact"])
-                            st.caption(sector["reason"])
-
-                with tabs[1]:
-                    col1, col2 = st.columns(2)
-                    with col1:
-                        st.markdown("##### 公債市場")
-                        bond = analysis["market_impact"]["financial_markets"]["bond_market"]["government"]
-                        st.metric("影響", bond["impact"])
-                        st.caption(f"殖利率走勢：{bond['yield_trend']}")
-                    
-                    with col2:
-                        st.markdown("##### 公司債市場")
-                        corp = analysis["market_impact"]["financial_markets"]["bond_market"]["corporate"]
-                        st.metric("影響", corp["impact"])
-                        st.caption(f"利差走勢：{corp['spread_trend']}")
-
-                with tabs[2]:
-                    st.markdown("##### 主要貨幣對影響")
-                    cols = st.columns(3)
-                    for i, pair in enumerate(analysis["market_impact"]["financial_markets"]["forex_market"]):
-                        with cols[i % 3]:
-                            st.metric(pair["pair"], pair["impact"], pair["target"])
-
-                with tabs[3]:
-                    st.markdown("##### 大宗商品影響")
-                    cols = st.columns(3)
-                    for i, commodity in enumerate(analysis["market_impact"]["financial_markets"]["commodities"]):
-                        with cols[i % 3]:
-                            st.metric(commodity["name"], commodity["impact"], commodity["target"])
-
-                # 產業影響
-                st.header("產業影響評估")
-                col1, col2 = st.columns(2)
-                
-                with col1:
-                    st.subheader("受惠產業")
-                    for industry in analysis["industry_impact"]["benefited"]:
-                        with st.expander(f"{industry['industry']} ({industry['duration']})"):
-                            st.write(industry["reason"])
-
-                with col2:
-                    st.subheader("受損產業")
-                    for industry in analysis["industry_impact"]["damaged"]:
-                        with st.expander(f"{industry['industry']} ({industry['duration']})"):
-                            st.write(industry["reason"])
-
-                st.markdown("##### 產業鏈影響")
-                st.info(analysis["industry_impact"]["supply_chain"]["description"])
-                
-                st.markdown("##### 競爭格局變化")
-                st.info(analysis["industry_impact"]["competition"]["description"])
-
-                # 投資建議
-                st.header("投資建議")
-                col1, col2 = st.columns(2)
-                
-                with col1:
-                    st.subheader("短期策略 (1-3個月)")
-                    st.markdown("##### 投資部位")
-                    for pos in analysis["investment_advice"]["short_term"]["position"]:
-                        st.markdown(f"• {pos}")
-                    
-                    st.markdown("##### 風險控制")
-                    for risk in analysis["investment_advice"]["short_term"]["risk_control"]:
-                        st.markdown(f"• {risk}")
-                    
-                    st.markdown("##### 操作時點")
-                    for timing in analysis["investment_advice"]["short_term"]["timing"]:
-                        st.markdown(f"• {timing}")
-
-                with col2:
-                    st.subheader("中長期策略 (3個月以上)")
-                    st.markdown("##### 資產配置")
-                    for alloc in analysis["investment_advice"]["long_term"]["asset_allocation"]:
-                        st.markdown(f"• {alloc}")
-                    
-                    st.markdown("##### 產業布局")
-                    for sector in analysis["investment_advice"]["long_term"]["sector_strategy"]:
-                        st.markdown(f"• {sector}")
-                    
-                    st.markdown("##### 投資標的")
-                    for target in analysis["investment_advice"]["long_term"]["targets"]:
-                        st.markdown(f"• {target}")
-
-                # 風險提示
-                st.header("風險提示")
-                col1, col2 = st.columns(2)
-                
-                with col1:
-                    st.subheader("主要風險")
-                    for risk in analysis["risk_warning"]["primary_risks"]:
-                        st.markdown(f"• {risk}")
-                    
-                    st.subheader("次要風險")
-                    for risk in analysis["risk_warning"]["secondary_risks"]:
-                        st.markdown(f"• {risk}")
-
-                with col2:
-                    st.subheader("風險監控指標")
-                    for indicator in analysis["risk_warning"]["monitoring_indicators"]:
-                        st.markdown(f"• {indicator}")
-                    
-                    st.subheader("風險對沖建議")
-                    for hedge in analysis["risk_warning"]["hedging_suggestions"]:
-                        st.markdown(f"• {hedge}")
-
-                # 添加視覺化圖表
-                if include_charts:
-                    st.header("視覺化分析")
-                    
-                    # 1. 市場影響雷達圖
-                    st.subheader("市場影響雷達圖")
-                    
-                    # 準備雷達圖數據
-                    impact_scores = {
-                        "GDP影響": _convert_impact_to_score(analysis["market_impact"]["macro_economy"]["gdp"]["impact"]),
-                        "通膨影響": _convert_impact_to_score(analysis["market_impact"]["macro_economy"]["inflation"]["impact"]),
-                        "就業影響": _convert_impact_to_score(analysis["market_impact"]["macro_economy"]["employment"]["impact"]),
-                        "消費影響": _convert_impact_to_score(analysis["market_impact"]["macro_economy"]["consumption"]["impact"]),
-                        "股市影響": _convert_impact_to_score(analysis["market_impact"]["financial_markets"]["stock_market"]["indices"][0]["impact"]),
-                        "債市影響": _convert_impact_to_score(analysis["market_impact"]["financial_markets"]["bond_market"]["government"]["impact"])
-                    }
-                    
-                    categories = list(impact_scores.keys())
-                    values = list(impact_scores.values())
-
-                    fig = go.Figure()
-                    fig.add_trace(go.Scatterpolar(
-                        r=values,
-                        theta=categories,
-                        fill='toself',
-                        name='市場影響程度',
-                        line_color='rgb(0, 0, 0)',
-                        fillcolor='rgba(169, 169, 169, 0.3)'
-                    ))
-
-                    fig.update_layout(
-                        polar=dict(
-                            radialaxis=dict(
-                                visible=True,
-                                range=[0, 1],
-                                tickvals=[0, 0.25, 0.5, 0.75, 1],
-                                ticktext=['極小', '較小', '中等', '較大', '極大']
-                            )
-                        ),
-                        showlegend=False,
-                        title="各面向影響程度分析",
-                        title_x=0.5
-                    )
-
-                    st.plotly_chart(fig, use_container_width=True)
-
-                    # 2. 產業影響對比圖
-                    st.subheader("產業影響對比")
-                    
-                    # 準備產業影響數據
-                    benefited_industries = [industry["industry"] for industry in analysis["industry_impact"]["benefited"]]
-                    damaged_industries = [industry["industry"] for industry in analysis["industry_impact"]["damaged"]]
-                    
-                    # 創建產業影響對比圖
-                    fig_industries = go.Figure()
-                    
-                    # 受惠產業
-                    fig_industries.add_trace(go.Bar(
-                        name='受惠產業',
-                        y=benefited_industries,
-                        x=[0.8] * len(benefited_industries),
-                        orientation='h',
-                        marker_color='rgb(144, 238, 144)',
-                        text=['正面影響'] * len(benefited_industries),
-                        textposition='auto',
-                    ))
-                    
-                    # 受損產業
-                    fig_industries.add_trace(go.Bar(
-                        name='受損產業',
-                        y=damaged_industries,
-                        x=[-0.8] * len(damaged_industries),
-                        orientation='h',
-                        marker_color='rgb(255, 182, 193)',
-                        text=['負面影響'] * len(damaged_industries),
-                        textposition='auto',
-                    ))
-                    
-                    fig_industries.update_layout(
-                        title="產業影響對比分析",
-                        title_x=0.5,
-                        barmode='relative',
-                        yaxis=dict(title='產業'),
-                        xaxis=dict(
-                            title='影響程度',
-                            tickvals=[-0.8, 0, 0.8],
-                            ticktext=['負面', '中性', '正面'],
-                            range=[-1, 1]
-                        ),
-                        showlegend=True
-                    )
-                    
-                    st.plotly_chart(fig_industries, use_container_width=True)
-
-                    # 3. 投資建議時間軸
-                    st.subheader("投資建議時間軸")
-                    
-                    # 準備時間軸數據
-                    timeline_data = {
-                        '短期策略': analysis["investment_advice"]["short_term"]["position"],
-                        '中長期策略': analysis["investment_advice"]["long_term"]["asset_allocation"]
-                    }
-                    
-                    # 創建時間軸圖表
-                    fig_timeline = go.Figure()
-                    
-                    y_positions = [0, 1]  # 短期和中長期的y軸位置
-                    colors = ['rgb(169, 169, 169)', 'rgb(0, 0, 0)']
-                    
-                    for i, (period, strategies) in enumerate(timeline_data.items()):
-                        for j, strategy in enumerate(strategies):
-                            fig_timeline.add_trace(go.Scatter(
-                                x=[j, j+0.8],
-                                y=[y_positions[i], y_positions[i]],
-                                mode='lines+text',
-                                name=period if j == 0 else None,
-                                text=[strategy, ''],
-                                textposition='middle right',
-                                line=dict(color=colors[i], width=2),
-                                showlegend=j == 0
-                            ))
-                    
-                    fig_timeline.update_layout(
-                        title="投資策略時間軸",
-                        title_x=0.5,
-                        yaxis=dict(
-                            ticktext=['短期', '中長期'],
-                            tickvals=[0, 1],
-                            zeroline=False
-                        ),
-                        xaxis=dict(
-                            showticklabels=False,
-                            zeroline=False
-                        ),
-                        showlegend=True,
-                        height=400
-                    )
-                    
-                    st.plotly_chart(fig_timeline, use_container_width=True)
-
-                # 添加總結和建議部分
-                st.markdown('<div class="sub-header">總結與投資建議</div>', unsafe_allow_html=True)
-
-                # 生成總結建議
-                summary_prompt = f"""
-                基於以下宏觀新聞分析，提供簡明的投資建議總結：
-
-                新聞內容: {news_text}
-
-                核心要點: {', '.join(analysis['summary']['key_points'])}
-                
-                總體經濟影響:
-                - GDP: {analysis['market_impact']['macro_economy']['gdp']['impact']}
-                - 通膨: {analysis['market_impact']['macro_economy']['inflation']['impact']}
-                - 就業: {analysis['market_impact']['macro_economy']['employment']['impact']}
-                - 消費: {analysis['market_impact']['macro_economy']['consumption']['impact']}
-
-                主要風險:
-                {', '.join(analysis['risk_warning']['primary_risks'])}
-
-                投資建議:
-                短期: {', '.join(analysis['investment_advice']['short_term']['position'])}
-                中長期: {', '.join(analysis['investment_advice']['long_term']['asset_allocation'])}
-
-                請提供200字以內的投資建議總結，包括風險提示。
-                """
-
-                # 調用 DeepSeek API 獲取投資建議
-                summary_data = {
-                    "model": "deepseek-chat",
-                    "messages": [
-                        {"role": "user", "content": summary_prompt}
-                    ],
-                    "temperature": 0.3,
-                    "max_tokens": 500
-                }
-
-                # 定義 API URL 和標頭
-                api_url = "https://api.deepseek.com/v1/chat/completions"
-                api_headers = {
-                    "Content-Type": "application/json",
-                    "Authorization": f"Bearer {api_key}"
-                }
-
-                summary_response = requests.post(api_url, headers=api_headers, data=json.dumps(summary_data))
-
-                if summary_response.status_code == 200:
-                    summary_result = summary_response.json()
-                    investment_advice = summary_result["choices"][0]["message"]["content"]
-                    st.markdown(f'<div class="info-box">{investment_advice}</div>', unsafe_allow_html=True)
-                else:
-                    st.error("無法生成投資建議總結")
-
-                # 導出報告選項
-                st.markdown('<div class="sub-header">導出分析報告</div>', unsafe_allow_html=True)
-
-                # 生成完整報告文本
-                report_text = f"""
-                # 宏觀新聞影響分析報告
-
-                ## 分析新聞
-                {news_text}
-
-                ## 新聞重點摘要
-                ### 核心要點
-                {chr(10).join([f"- {point}" for point in analysis['summary']['key_points']])}
-
-                ### 關鍵數據
-                {chr(10).join([f"- {data}" for data in analysis['summary']['key_data']])}
-
-                ### 相關企業和產業
-                {chr(10).join([f"- {entity}" for entity in analysis['summary']['related_entities']])}
-
-                ## 市場影響分析
-
-                ### 總體經濟影響
-                - GDP影響: {analysis['market_impact']['macro_economy']['gdp']['impact']}
-                  {analysis['market_impact']['macro_economy']['gdp']['description']}
-                - 通膨影響: {analysis['market_impact']['macro_economy']['inflation']['impact']}
-                  {analysis['market_impact']['macro_economy']['inflation']['description']}
-                - 就業影響: {analysis['market_impact']['macro_economy']['employment']['impact']}
-                  {analysis['market_impact']['macro_economy']['employment']['description']}
-                - 消費影響: {analysis['market_impact']['macro_economy']['consumption']['impact']}
-                  {analysis['market_impact']['macro_economy']['consumption']['description']}
-
-                ### 金融市場影響
-
-                #### 股票市場
-                主要指數影響:
-                {chr(10).join([f"- {index['name']}: {index['impact']} (目標: {index['target']})" for index in analysis['market_impact']['financial_markets']['stock_market']['indices']])}
-
-                產業影響:
-                {chr(10).join([f"- {sector['name']}: {sector['impact']} - {sector['reason']}" for sector in analysis['market_impact']['financial_markets']['stock_market']['sectors']])}
-
-                #### 債券市場
-                - 公債市場: {analysis['market_impact']['financial_markets']['bond_market']['government']['impact']}
-                  殖利率走勢: {analysis['market_impact']['financial_markets']['bond_market']['government']['yield_trend']}
-                - 公司債市場: {analysis['market_impact']['financial_markets']['bond_market']['corporate']['impact']}
-                  利差走勢: {analysis['market_impact']['financial_markets']['bond_market']['corporate']['spread_trend']}
-
-                #### 匯市影響
-                {chr(10).join([f"- {pair['pair']}: {pair['impact']} (目標: {pair['target']})" for pair in analysis['market_impact']['financial_markets']['forex_market']])}
-
-                #### 商品市場影響
-                {chr(10).join([f"- {commodity['name']}: {commodity['impact']} (目標: {commodity['target']})" for commodity in analysis['market_impact']['financial_markets']['commodities']])}
-
-                ## 產業影響評估
-
-                ### 受惠產業
-                {chr(10).join([f"- {industry['industry']} ({industry['duration']}): {industry['reason']}" for industry in analysis['industry_impact']['benefited']])}
-
-                ### 受損產業
-                {chr(10).join([f"- {industry['industry']} ({industry['duration']}): {industry['reason']}" for industry in analysis['industry_impact']['damaged']])}
-
-                ### 產業鏈影響
-                {analysis['industry_impact']['supply_chain']['description']}
-
-                ### 競爭格局變化
-                {analysis['industry_impact']['competition']['description']}
-
-                ## 企業影響分析
-
-                ### 直接影響企業
-                {chr(10).join([f"- {company['company']}: {company['impact']} - {company['action']}" for company in analysis['corporate_impact']['direct']])}
-
-                ### 間接影響企業
-                {chr(10).join([f"- {company['company']}: {company['impact']} - {company['action']}" for company in analysis['corporate_impact']['indirect']])}
-
-                ### 潛在商機
-                {chr(10).join([f"- {opportunity}" for opportunity in analysis['corporate_impact']['opportunities']])}
-
-                ### 潛在風險
-                {chr(10).join([f"- {risk}" for risk in analysis['corporate_impact']['risks']])}
-
-                ## 投資建議
-
-                ### 短期策略 (1-3個月)
-                
-                投資部位:
-                {chr(10).join([f"- {pos}" for pos in analysis['investment_advice']['short_term']['position']])}
-
-                風險控制:
-                {chr(10).join([f"- {risk}" for risk in analysis['investment_advice']['short_term']['risk_control']])}
-
-                操作時點:
-                {chr(10).join([f"- {timing}" for timing in analysis['investment_advice']['short_term']['timing']])}
-
-                ### 中長期策略 (3個月以上)
-
-                資產配置:
-                {chr(10).join([f"- {alloc}" for alloc in analysis['investment_advice']['long_term']['asset_allocation']])}
-
-                產業布局:
-                {chr(10).join([f"- {sector}" for sector in analysis['investment_advice']['long_term']['sector_strategy']])}
-
-                投資標的:
-                {chr(10).join([f"- {target}" for target in analysis['investment_advice']['long_term']['targets']])}
-
-                ## 風險提示
-
-                ### 主要風險
-                {chr(10).join([f"- {risk}" for risk in analysis['risk_warning']['primary_risks']])}
-
-                ### 次要風險
-                {chr(10).join([f"- {risk}" for risk in analysis['risk_warning']['secondary_risks']])}
-
-                ### 風險監控指標
-                {chr(10).join([f"- {indicator}" for indicator in analysis['risk_warning']['monitoring_indicators']])}
-
-                ### 風險對沖建議
-                {chr(10).join([f"- {hedge}" for hedge in analysis['risk_warning']['hedging_suggestions']])}
-
-                ## 投資建議總結
-                {investment_advice}
-
-                ---
-                *報告生成時間: {datetime.now().strftime("%Y-%m-%d %H:%M:%S")}*
-                *由 MacroInsight 宏觀新聞分析工具生成*
-                """
-
-                # 提供下載報告選項
-                st.download_button(
-                    label="下載完整分析報告 (Markdown)",
-                    data=report_text,
-                    file_name=f"宏觀新聞分析_{datetime.now().strftime('%Y%m%d_%H%M%S')}.md",
-                    mime="text/markdown",
-                )
+            # 為每個區塊預留位置，串流時哪個區塊先完成就先顯示
+            live_sections = st.empty()
+            with live_sections.container():
+                section_slots = {name: st.empty() for name in SECTION_RENDERERS}
+            rendered_sections = set()
+
+            def render_section(name, section):
+                if name not in SECTION_RENDERERS or name in rendered_sections:
+                    return
+                with section_slots[name].container():
+                    SECTION_RENDERERS[name]({name: section})
+                rendered_sections.add(name)
+
+            # 查詢相似的歷史分析（新聞本身重新分析時不列入）
+            result_key = analysis_key(analyze_content)
+            similar = find_similar_analyses(analyze_content, exclude=result_key)
+            analysis, info = analyze_news(
+                analyze_content,
+                use_cache=not bypass_cache,
+                on_section=render_section,
+                similar=similar if history_context else None
+            )
+
+        if analysis:
+            store_analysis_result(result_key, analyze_content, analysis, similar, stored=info["stored"])
+            st.session_state.current_result = result_key
+            # 串流中顯示的區塊改由下方的完整結果取代
+            live_sections.empty()
+
+# 之後任何互動造成的重跑都直接顯示 session_state 中的結果，不再呼叫 API
+if st.session_state.get("current_result"):
+    render_analysis_result(st.session_state.current_result)
+
+# 整體市場影響：每日統計隨每則新分析增量更新，這裡只讀取彙總結果
+@st.fragment
+def render_aggregate_panel():
+    """跨新聞的市場影響統計；在 fragment 中執行，切換期間不重跑整個頁面"""
+    with st.expander("📊 整體市場影響統計"):
+        impact_aggregate = get_analysis_history().aggregate
+        aggregate_days = st.selectbox("統計期間", [1, 7, 30, 90], index=1, key="aggregate_days",
+                                      format_func=lambda days: "今日" if days == 1 else f"近 {days} 天")
+        if impact_aggregate is None:
+            st.info("分析歷史庫已停用")
+        else:
+            aggregate_end = datetime.now(timezone.utc).date()
+            aggregate_start = aggregate_end - timedelta(days=aggregate_days - 1)
+            aggregate_window = impact_aggregate.window(aggregate_start, aggregate_end)
+            if aggregate_window["count"].sum():
+                st.plotly_chart(build_impact_heatmap_figure(impact_aggregate.daily(aggregate_start, aggregate_end)),
+                                use_container_width=True)
+                st.plotly_chart(build_aggregate_radar_figure(aggregate_window), use_container_width=True)
+                st.caption("面向名稱後的數字為納入統計的分析則數；1 為強烈正面、-1 為強烈負面")
+            else:
+                st.info("統計期間內尚無分析紀錄")
+
+# 歷史情緒走勢：從分析歷史庫查詢產業的滾動平均情緒
+@st.fragment
+def render_trend_panel():
+    """產業情緒走勢；在 fragment 中執行，輸入產業名稱不重跑整個頁面"""
+    with st.expander("📈 產業情緒走勢"):
+        history_col1, history_col2 = st.columns([2, 1])
+        with history_col1:
+            trend_entity = st.text_input("產業名稱", value="半導體", key="trend_entity")
+        with history_col2:
+            trend_window = st.selectbox("滾動天數", [7, 30, 90], index=1, key="trend_window")
+        if trend_entity.strip():
+            trend = get_analysis_history().rolling_sentiment(trend_entity.strip(), trend_window, periods=180)
+            if trend["count"].sum():
+                st.line_chart(trend["rolling"])
+                st.caption(f"近 180 天共 {int(trend['count'].sum())} 筆「{trend_entity.strip()}」相關影響紀錄；"
+                           "1 為強烈正面、-1 為強烈負面")
+            else:
+                st.info("歷史庫中尚無相關分析紀錄")
+
+def build_reports_zip(fmt, days):
+    """將近 days 天歷史庫中的分析匯出為 ZIP；報告逐則產生並壓縮，記憶體中只保留壓縮後的內容"""
+    end = datetime.now(timezone.utc).date()
+    documents = get_analysis_history().iter_documents(end - timedelta(days=days - 1), end)
+    archive = io.BytesIO()
+    write_reports_zip(documents, archive, fmt)
+    return archive
+
+@st.fragment
+def render_export_panel():
+    """批次匯出分析報告；在 fragment 中執行，選擇格式與下載不重跑整個頁面"""
+    with st.expander("🗂️ 批次匯出分析報告"):
+        export_col1, export_col2 = st.columns(2)
+        with export_col1:
+            export_format = st.selectbox("報告格式", list(REPORT_LABELS), format_func=REPORT_LABELS.get,
+                                         key="export_format")
+        with export_col2:
+            export_days = st.selectbox("匯出期間", [1, 7, 30, 90], index=1, key="export_days",
+                                       format_func=lambda days: "今日" if days == 1 else f"近 {days} 天")
+        st.download_button(
+            label="下載 ZIP",
+            data=functools.partial(build_reports_zip, export_format, export_days),
+            file_name=f"宏觀新聞分析報告_{datetime.now().strftime('%Y%m%d')}.zip",
+            mime="application/zip",
+            key="download_reports_zip",
+            disabled=not get_analysis_history().enabled,
+        )
+
+render_aggregate_panel()
+render_trend_panel()
+render_export_panel()
 
 # 添加頁腳
 st.markdown('<div class="footer">作者:© 2025 AKEN | 基於HAI模型</div>',
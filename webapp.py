@@ -0,0 +1,155 @@
+"""非同步 HTTP 服務（ASGI）：提供 templates/index.html 頁面、/analyze 分析端點與 /export 報告匯出
+
+與 Streamlit 頁面共用 macrocore 分析核心與分析快取；上游呼叫不阻塞事件迴圈，
+同時進行的分析超過上限時直接回應 503，讓前端稍後重試而不是無限排隊。
+/export 將分析歷史逐則產生報告並串流為 ZIP；/metrics 以 Prometheus 文字格式輸出各階段耗時與用量指標。
+
+    uvicorn webapp:app --host 0.0.0.0 --port 8000
+"""
+import asyncio
+import contextlib
+import math
+import os
+from datetime import datetime, timedelta, timezone
+
+import httpx
+from dotenv import load_dotenv
+from starlette.applications import Starlette
+from starlette.responses import FileResponse, JSONResponse, Response, StreamingResponse
+from starlette.routing import Route
+
+from macrocore.aio import AsyncHttpClient, async_request_analysis
+from macrocore.analysis import AnalysisError
+from macrocore.cache import AnalysisCache
+from macrocore.charts import build_chart_specs
+from macrocore.dedup import NearDuplicateIndex
+from macrocore.history import AnalysisHistory
+from macrocore.httpclient import CircuitOpenError
+from macrocore.metrics import PROMETHEUS_CONTENT_TYPE, configure_logging, metrics
+from macrocore.ratelimit import QuotaExceededError, QuotaLimiter
+from macrocore.report import REPORT_FORMATS, iter_reports_zip
+from macrocore.singleflight import AsyncSingleFlight
+
+load_dotenv()
+
+TEMPLATE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "templates", "index.html")
+# 同時進行中的分析上限，超過時回應 503
+MAX_CONCURRENT_ANALYSES = int(os.getenv("MAX_CONCURRENT_ANALYSES", "16"))
+BUSY_RETRY_AFTER = "5"
+
+
+async def index(request):
+    return FileResponse(TEMPLATE_PATH)
+
+
+async def analyze(request):
+    state = request.app.state
+    if state.in_flight >= MAX_CONCURRENT_ANALYSES:
+        metrics.increment("rejected_requests_total", help_text="因同時分析數已達上限而回應 503 的次數")
+        return JSONResponse(
+            {"error": "目前分析請求過多，請稍後再試"},
+            status_code=503,
+            headers={"Retry-After": BUSY_RETRY_AFTER},
+        )
+
+    state.in_flight += 1
+    try:
+        form = await request.form()
+        news_text = (form.get("news_text") or "").strip()
+        if not news_text:
+            return JSONResponse({"error": "請輸入新聞內容"}, status_code=400)
+        if not state.api_key:
+            return JSONResponse({"error": "伺服器未設定 DeepSeek API Key"}, status_code=500)
+
+        try:
+            analysis, _ = await async_request_analysis(
+                news_text, state.api_key, state.http, cache=state.cache,
+                singleflight=state.singleflight, near_duplicates=state.near_duplicates,
+                history=state.history
+            )
+        except AnalysisError as e:
+            return JSONResponse({"error": str(e)}, status_code=502)
+        except CircuitOpenError:
+            return JSONResponse(
+                {"error": "DeepSeek 服務暫時無法連線，請稍後再試"},
+                status_code=503,
+                headers={"Retry-After": BUSY_RETRY_AFTER},
+            )
+        except QuotaExceededError as e:
+            return JSONResponse(
+                {"error": f"已達 DeepSeek 請求上限（{e.reason}），請稍後再試"},
+                status_code=503,
+                headers={"Retry-After": str(math.ceil(e.retry_after))},
+            )
+        except httpx.TimeoutException:
+            return JSONResponse(
+                {"error": "DeepSeek 服務回應逾時，請稍後再試"},
+                status_code=503,
+                headers={"Retry-After": BUSY_RETRY_AFTER},
+            )
+        except httpx.HTTPError as e:
+            # 重試後仍失敗的連線錯誤，同樣以 JSON 回應，讓頁面能顯示錯誤訊息
+            return JSONResponse({"error": f"無法連線到 DeepSeek 服務：{type(e).__name__}"}, status_code=502)
+
+        if form.get("include_charts"):
+            # 圖表規格在伺服器端預先算好（依分析內容快取），前端直接交給 Plotly.newPlot
+            charts = build_chart_specs(analysis)
+            analysis = dict(analysis, market_impact=dict(analysis["market_impact"], charts=charts))
+        return JSONResponse(analysis)
+    finally:
+        state.in_flight -= 1
+
+
+async def export(request):
+    """將歷史庫中最近 days 天的分析以指定格式的報告串流為 ZIP 下載"""
+    fmt = request.query_params.get("format", "markdown")
+    if fmt not in REPORT_FORMATS:
+        return JSONResponse({"error": f"不支援的報告格式：{fmt}"}, status_code=400)
+    try:
+        days = max(1, int(request.query_params.get("days", "7")))
+    except ValueError:
+        return JSONResponse({"error": "days 必須為整數"}, status_code=400)
+    end = datetime.now(timezone.utc).date()
+    documents = request.app.state.history.iter_documents(end - timedelta(days=days - 1), end)
+    # 同步產生器由 Starlette 在執行緒池中逐段取出，報告產生與壓縮不阻塞事件迴圈
+    return StreamingResponse(
+        iter_reports_zip(documents, fmt),
+        media_type="application/zip",
+        headers={"Content-Disposition": f'attachment; filename="macroinsight_reports_{end:%Y%m%d}.zip"'},
+    )
+
+
+async def metrics_endpoint(request):
+    """Prometheus 抓取端點"""
+    body = metrics.render_prometheus() + (
+        "# TYPE macroinsight_in_flight_analyses gauge\n"
+        f"macroinsight_in_flight_analyses {request.app.state.in_flight}\n"
+    )
+    return Response(body, media_type=PROMETHEUS_CONTENT_TYPE)
+
+
+@contextlib.asynccontextmanager
+async def lifespan(app):
+    configure_logging()
+    app.state.api_key = os.getenv("DeepSeek_API")
+    app.state.cache = AnalysisCache.from_env()
+    app.state.near_duplicates = NearDuplicateIndex.from_env()
+    app.state.history = AnalysisHistory.from_env()
+    app.state.http = AsyncHttpClient(quota=QuotaLimiter.from_env())
+    app.state.singleflight = AsyncSingleFlight.from_env()
+    app.state.in_flight = 0
+    try:
+        yield
+    finally:
+        await app.state.http.aclose()
+
+
+app = Starlette(
+    routes=[
+        Route("/", index),
+        Route("/analyze", analyze, methods=["POST"]),
+        Route("/export", export),
+        Route("/metrics", metrics_endpoint),
+    ],
+    lifespan=lifespan,
+)